@@ -1,28 +1,180 @@
 """Main logic of the app."""
 
 import json
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request
-from fastapi.responses import HTMLResponse
+import logging
+import time
+import uuid
+from contextlib import asynccontextmanager
+from datetime import date
+from typing import TYPE_CHECKING
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, Request, status
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
 import asyncio
+# not deferred: the store is opened at startup, before the warm-up
 import duckdb
-from modules.gymBuddy import GymBuddy
 import os
-from typing import Any
-from modules.db_setup import connect_in_memory_db, close_db_connection, save_data_to_db
-from modules.feedbackAgent import FeedbackAgent
+from modules.archive import (
+    ARCHIVE_TABLES,
+    ARROW_STREAM_MEDIA_TYPE,
+    DEFAULT_ARCHIVE_DIR,
+    archive_session,
+    arrow_ipc_stream,
+    has_archive,
+    query_archive,
+)
+from modules.capture_rate import CAPTURE_RATE, CaptureRateController
+from modules.db_setup import DuckDBStore, DEFAULT_DB_PATH
+from modules.db_writer import DBWriter, SetRecorder
+from modules.feedback_cache import FeedbackCache
+from modules.inference_pool import InferencePool
+from modules.live_inference import LIVE_RESULT, LiveInference
+from modules.inbox import SessionInbox
+from modules.metrics import METRICS
+from modules.model_tiers import SessionLandmarker, TieredLandmarkerPools, model_path_for
+from modules.protocol import BINARY_PROTOCOL, dumps, encode_analysis
+
+# mediapipe, OpenCV, pandas and LangChain are only imported by the warm-up or the first
+# session, the app starts serving without them
+if TYPE_CHECKING:
+    from modules.feedbackAgent import FeedbackAgent
 
 
 # Get the absolute path to the current file's directory
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
+# per-frame details are logged at DEBUG, set GYMBUDDY_LOG_LEVEL=DEBUG to see them
+logging.basicConfig(
+    level=os.environ.get("GYMBUDDY_LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
+logger = logging.getLogger("gymbuddy")
+
+# attempts of the warm-up, and delay before the first retry (doubled at every retry)
+WARM_UP_ATTEMPTS: int = 3
+WARM_UP_BACKOFF_SECONDS: float = 2.0
+
+
+def load_shared_resources(application: FastAPI) -> None:
+    """
+    Import the heavy modules and build what the sessions share: the Gemini client and,
+    when the inference runs in this process, the warmed up landmarkers of the pool.
+    Without a Gemini client (no credentials) the sessions serve the rule-based feedback.
+    """
+    from modules.feedbackAgent import create_llm
+
+    try:
+        application.state.llm = create_llm()
+    except Exception as e:
+        logger.warning("No LLM client, rule-based feedback only: %s", e)
+        application.state.llm = None
+    if application.state.landmarker_pools is not None:
+        application.state.landmarker_pools.warm_up()
+
+
+async def warm_up(application: FastAPI) -> None:
+    """
+    Load the shared resources in a thread, the app is ready (/ready) once done.
+    A failed attempt is retried with a growing delay, the error of the last one is kept.
+    """
+    start = time.perf_counter()
+    for attempt in range(1, WARM_UP_ATTEMPTS + 1):
+        try:
+            await asyncio.to_thread(load_shared_resources, application)
+            break
+        except Exception as e:
+            logger.error("Warm-up attempt %s of %s failed: %s", attempt, WARM_UP_ATTEMPTS, e)
+            if attempt == WARM_UP_ATTEMPTS:
+                application.state.warmup_error = str(e)
+                return
+            await asyncio.sleep(WARM_UP_BACKOFF_SECONDS * 2 ** (attempt - 1))
+    application.state.ready = True
+    logger.info("Warm-up done in %.2f s", time.perf_counter() - start)
+
+
+@asynccontextmanager
+async def lifespan(application: FastAPI):
+    """Open the shared DuckDB store and its writer once for the whole process."""
+    store = DuckDBStore(
+        path=os.environ.get("GYMBUDDY_DB_PATH", os.path.join(BASE_DIR, DEFAULT_DB_PATH)),
+        pool_size=int(os.environ.get("GYMBUDDY_DB_POOL_SIZE", 8)),
+    )
+    application.state.store = store
+    application.state.db_writer = DBWriter(store.conn)
+    # completed sessions are compacted into Parquet files, disabled when set to ""
+    application.state.archive_dir = os.environ.get(
+        "GYMBUDDY_ARCHIVE_DIR", os.path.join(BASE_DIR, DEFAULT_ARCHIVE_DIR)
+    )
+    # LLM feedback of similar sets, shared by the sessions, kept in memory only when
+    # GYMBUDDY_FEEDBACK_CACHE is set to ""
+    application.state.feedback_cache = FeedbackCache(
+        max_entries=int(os.environ.get("GYMBUDDY_FEEDBACK_CACHE_SIZE", 512)),
+        ttl_seconds=float(os.environ.get("GYMBUDDY_FEEDBACK_CACHE_TTL", 7 * 24 * 3600)),
+        path=os.environ.get(
+            "GYMBUDDY_FEEDBACK_CACHE", os.path.join(BASE_DIR, "data/feedback_cache.json")
+        )
+        or None,
+    )
+    # estimated tokens of the feedback prompt, its statistics are compacted to fit (0: no limit)
+    application.state.prompt_token_budget = int(os.environ.get("GYMBUDDY_PROMPT_TOKEN_BUDGET", 800))
+    # seconds the LLM feedback is waited for before the rule-based one is served
+    application.state.feedback_budget = float(os.environ.get("GYMBUDDY_FEEDBACK_BUDGET", 5.0))
+    # capture rate hints sent to the clients from the state of the workout ("0": fixed rate)
+    application.state.adaptive_capture = os.environ.get("GYMBUDDY_ADAPTIVE_CAPTURE", "1") != "0"
+    # frames cropped to the last pose before the inference ("0": whole frames)
+    application.state.roi_tracking = os.environ.get("GYMBUDDY_ROI_TRACKING", "1") != "0"
+    # pose model variant of the new sessions: lite, full or heavy
+    model_tier = os.environ.get("GYMBUDDY_MODEL_TIER", "lite").lower()
+    application.state.model_path = model_path_for(model_tier, os.path.join(BASE_DIR, "models"))
+    # pose inference in worker processes, in the app process (threads) when 0
+    inference_workers = int(os.environ.get("GYMBUDDY_INFERENCE_WORKERS", 0))
+    application.state.inference_pool = (
+        InferencePool(workers=inference_workers, model_path=application.state.model_path)
+        if inference_workers > 0
+        else None
+    )
+    # landmarkers leased by the sessions when the inference runs in the app process, one
+    # pool per model tier found in models/
+    application.state.landmarker_pools = (
+        TieredLandmarkerPools(
+            os.path.join(BASE_DIR, "models"),
+            size=int(os.environ.get("GYMBUDDY_LANDMARKER_POOL_SIZE", 4)),
+            default_tier=model_tier,
+            # "live": pipelined LIVE_STREAM inference, the next frame is decoded while
+            # the previous one is inferred
+            live=os.environ.get("GYMBUDDY_INFERENCE_MODE", "video").lower() == "live",
+            # segmentation masks, only for a consumer of them
+            segmentation=os.environ.get("GYMBUDDY_SEGMENTATION", "0") == "1",
+        )
+        if application.state.inference_pool is None
+        else None
+    )
+    # sessions step between the model tiers with their inference latency and the load
+    application.state.adaptive_model = os.environ.get("GYMBUDDY_ADAPTIVE_MODEL", "1") != "0"
+    # serving starts right away, readiness waits for the warm-up
+    application.state.ready = False
+    application.state.warmup_error = None
+    application.state.llm = None
+    warmup: asyncio.Task = asyncio.create_task(warm_up(application))
+    try:
+        yield
+    finally:
+        warmup.cancel()
+        if application.state.inference_pool is not None:
+            application.state.inference_pool.close()
+        if application.state.landmarker_pools is not None:
+            application.state.landmarker_pools.close()
+        await asyncio.to_thread(application.state.db_writer.close)
+        store.close()
+
 
 app = FastAPI(
     title="GymBuddy API",
     description="AI-Powered Personal Trainer Backend",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 
@@ -51,39 +203,233 @@ async def get(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Stage timings and counters of the process in the Prometheus text format"""
+    return PlainTextResponse(
+        METRICS.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@app.get("/ready")
+async def ready():
+    """Readiness: 200 once the warm-up is done, 503 while it runs or if it failed"""
+    if app.state.ready:
+        return {"status": "ready"}
+    if app.state.warmup_error is not None:
+        return JSONResponse(
+            {"status": "error", "detail": app.state.warmup_error}, status_code=503
+        )
+    return JSONResponse({"status": "warming up"}, status_code=503)
+
+
+@app.get("/export/{table}")
+async def export_archive(
+    table: str,
+    user_id: str,
+    session_id: str | None = None,
+    start: date | None = None,
+    end: date | None = None,
+):
+    """Stream the archived rows of a user's workouts as Arrow IPC, by session and/or date range"""
+    archive_dir: str = app.state.archive_dir
+    if table not in ARCHIVE_TABLES:
+        raise HTTPException(status_code=404, detail=f"Unknown table {table}.")
+    if not archive_dir or not has_archive(archive_dir, table):
+        raise HTTPException(status_code=404, detail=f"No archived {table} data.")
+    store: DuckDBStore = app.state.store
+    cursor = store.acquire()
+    try:
+        reader = await asyncio.to_thread(
+            query_archive,
+            cursor,
+            table,
+            archive_dir,
+            user_id=user_id,
+            session_id=session_id,
+            start=start,
+            end=end,
+        )
+    except Exception:
+        store.release(cursor)
+        raise
+
+    def stream():
+        # iterated in a worker thread by Starlette, the batches are read lazily
+        try:
+            yield from arrow_ipc_stream(reader)
+        finally:
+            store.release(cursor)
+
+    return StreamingResponse(stream(), media_type=ARROW_STREAM_MEDIA_TYPE)
+
+
+async def receive_messages(websocket: WebSocket, inbox: SessionInbox) -> None:
+    """Receive path: read the websocket as fast as messages arrive and fill the inbox."""
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes") is not None:
+                # time spent waiting in the inbox, observed when the frame is processed
+                message["received_at"] = time.perf_counter()
+            inbox.put(message)
+    except Exception as e:
+        logger.warning("WebSocket receive error: %s", e)
+    finally:
+        inbox.close()
+
+
+async def send_feedback(
+    websocket: WebSocket, feedback_agent: "FeedbackAgent", workout_id: int, budget: float
+) -> None:
+    """
+    Send the feedback of a completed set: the LLM fields as they are generated, the
+    rule-based feedback if the LLM takes more than budget seconds, then the LLM feedback
+    once it is complete. Every feedback message replaces the previous one on the client.
+    """
+    sent = False
+    try:
+        async with asyncio.timeout(180):
+            async for kind, feedback in feedback_agent.ahedged_pipeline(workout_id, budget):
+                if kind == "partial":
+                    await websocket.send_text(
+                        dumps({"type": "feedback_partial", "fields": feedback})
+                    )
+                    continue
+                logger.debug("Feedback received (%s): %s", kind, feedback["formatted_feedback"])
+                await websocket.send_text(
+                    dumps(
+                        {
+                            "type": "feedback",
+                            "message": feedback["formatted_feedback"],
+                            "source": "llm" if kind == "final" else "local",
+                        }
+                    )
+                )
+                sent = True
+    except Exception as e:
+        logger.error("Error getting feedback: %s", e)
+        if not sent:
+            await websocket.send_text(
+                dumps(
+                    {
+                        "type": "feedback",
+                        "message": "Error getting feedback. Please try again later.",
+                    }
+                )
+            )
+
+
 @app.websocket("/ws")
 async def camera_feed(websocket: WebSocket):
     """main logic for the app's loop"""
+    if websocket.app.state.warmup_error is not None:
+        # the server cannot serve sessions, the client does not retry
+        await websocket.accept()
+        await websocket.close(code=status.WS_1011_INTERNAL_ERROR, reason="warm-up failed")
+        return
+    if not websocket.app.state.ready:
+        # the heavy modules are still imported by the warm-up, the client retries
+        await websocket.accept()
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER, reason="warming up")
+        return
+    # already imported once the app is ready
+    from modules.feedbackAgent import FeedbackAgent
+    from modules.gymBuddy import GymBuddy
+
     await websocket.accept()
 
-    print("WebSocket connected successfully")
+    logger.info("WebSocket connected successfully")
     start_detection: bool = False
     wo_names: list = []
     wo_reps: list = []
     series_number:int=1
+    # per-frame results as one binary message instead of two JSON ones (opt-in)
+    binary_results: bool = False
     last_history_sent: str = ""
 
-    # Initialize in-memory DuckDB database
-    db_conn: duckdb.DuckDBPyConnection = connect_in_memory_db()
-    # Initialize GymBuddy
-    buddy: GymBuddy = GymBuddy()
-    feedback_agent: FeedbackAgent = FeedbackAgent(db_conn=db_conn)
+    # identify the session and the user in the shared store
+    session_id: str = uuid.uuid4().hex
+    user_id: str = websocket.query_params.get("user_id", "anonymous")
+
+    # lease a cursor on the shared DuckDB store
+    store: DuckDBStore = websocket.app.state.store
+    db_conn: duckdb.DuckDBPyConnection = store.acquire()
+    # frames are streamed to the database in the background while the set runs
+    recorder: SetRecorder = SetRecorder(websocket.app.state.db_writer)
+    # Initialize GymBuddy, its model is not needed when the inference runs in the pool
+    inference_pool: InferencePool | None = getattr(
+        websocket.app.state, "inference_pool", None
+    )
+    landmarker_pools: TieredLandmarkerPools | None = getattr(
+        websocket.app.state, "landmarker_pools", None
+    )
+    session_landmarker: SessionLandmarker | None = (
+        SessionLandmarker(
+            landmarker_pools, adaptive=getattr(websocket.app.state, "adaptive_model", False)
+        )
+        if landmarker_pools is not None
+        else None
+    )
+    buddy: GymBuddy = GymBuddy(
+        model_path=getattr(websocket.app.state, "model_path", "models/pose_landmarker_lite.task"),
+        session_id=session_id,
+        user_id=user_id,
+        load_model=inference_pool is None,
+        # warmed up at startup, only created here when the pool is empty
+        model=(
+            await session_landmarker.acquire() if session_landmarker is not None else None
+        ),
+        roi_tracking=getattr(websocket.app.state, "roi_tracking", True),
+    )
+    feedback_agent: FeedbackAgent = FeedbackAgent(
+        db_conn=db_conn,
+        session_id=session_id,
+        cache=getattr(websocket.app.state, "feedback_cache", None),
+        token_budget=getattr(websocket.app.state, "prompt_token_budget", 0) or None,
+        llm=getattr(websocket.app.state, "llm", None),
+    )
+    session_metrics = buddy.metrics
+    METRICS.inc("sessions")
+
+    # the receive path runs on its own, consecutive frames that arrive while one is being
+    # processed supersede each other in the inbox and only the latest one is processed
+    inbox: SessionInbox = SessionInbox()
+    # the results of the pipelined inference are delivered to the inbox
+    live_inference: LiveInference | None = (
+        LiveInference(buddy.model, inbox.put, session_metrics)
+        if landmarker_pools is not None and landmarker_pools.live
+        else None
+    )
+    receiver: asyncio.Task = asyncio.create_task(receive_messages(websocket, inbox))
+    # feedback of the last set, its LLM upgrade can arrive while the next set runs
+    feedback_task: asyncio.Task | None = None
+    feedback_budget: float = getattr(websocket.app.state, "feedback_budget", 5.0)
+    capture_rate: CaptureRateController | None = (
+        CaptureRateController()
+        if getattr(websocket.app.state, "adaptive_capture", False)
+        else None
+    )
 
     # start the loop
     try:
         while True:
             try:
                 # Wait for message
-                message = await asyncio.wait_for(websocket.receive(), timeout=0.1)
-                if "text" in message:
+                message = await inbox.get(timeout=0.1)
+                analysis_data: dict | None = None
+                if message["type"] == "websocket.disconnect":
+                    raise WebSocketDisconnect(message.get("code", 1000))
+                if message.get("text") is not None:
                     data: dict = json.loads(message["text"])
-                    print(f"Received text message: {data}")
-                    print(f"Data type: {data.get('type')}, Value: {data.get('value')}")
+                    logger.debug("Received text message: %s", data)
                     if data.get("type") == "workout":
                         workout_name = data.get("value", "push-ups")
                         buddy.set_workout(workout_name)
                         await websocket.send_text(
-                            json.dumps(
+                            dumps(
                                 {
                                     "type": "data",
                                     "message": f"Selected {workout_name}. Ready to start!",
@@ -95,10 +441,9 @@ async def camera_feed(websocket: WebSocket):
                     if data.get("type") == "reps":
 
                         reps = int(data.get("value", 1))
-                        print(f"Setting target reps to {reps}")
                         buddy.set_reps(reps)
                         await websocket.send_text(
-                            json.dumps(
+                            dumps(
                                 {
                                     "type": "data",
                                     "message": f"Set target: {reps} reps. Ready to start!",
@@ -106,6 +451,28 @@ async def camera_feed(websocket: WebSocket):
                                 }
                             )
                         )
+                    if data.get("type") == "protocol":
+                        binary_results = data.get("value") == BINARY_PROTOCOL
+                        buddy.landmark_dicts = not binary_results
+                        await websocket.send_text(
+                            dumps(
+                                {
+                                    "type": "protocol",
+                                    "value": BINARY_PROTOCOL if binary_results else "json",
+                                }
+                            )
+                        )
+                    if data.get("type") == "encoding":
+                        try:
+                            buddy.decoder.configure(
+                                data.get("value", "jpeg"),
+                                int(data.get("width", 0)),
+                                int(data.get("height", 0)),
+                            )
+                            reply = {"type": "encoding", "value": buddy.decoder.encoding}
+                        except ValueError as e:
+                            reply = {"type": "error", "message": str(e)}
+                        await websocket.send_text(dumps(reply))
                     if data.get("type") == "strictness":
                         strictness = data.get("value", "strict")
                         buddy.set_strictness(strictness)
@@ -113,83 +480,107 @@ async def camera_feed(websocket: WebSocket):
                         buddy.set_series_number(series_number)
                         start_detection = True
                         buddy.count_rep = 0
-                        print("Starting detection!")
+                        logger.info("Starting detection!")
 
-                elif "bytes" in message:
+                elif message["type"] == LIVE_RESULT:
+                    # pipelined inference: the result of a frame submitted earlier
+                    if start_detection:
+                        result = message["result"]
+                        analysis_data = buddy.analyze_landmarks(
+                            buddy.track_landmarks(result.landmarks, *result.context)
+                        )
+
+                elif message.get("bytes") is not None:
                     # Process video frame
+                    session_metrics.observe(
+                        "receive", time.perf_counter() - message["received_at"]
+                    )
                     frame_data = message["bytes"]
                     frame = buddy.process_frame_from_bytes(frame_data)
 
                     if frame is not None and start_detection:
                         # Process the frame for exercise detection
-                        analysis_data = await asyncio.to_thread(
-                            buddy.detect_from_frame, frame
+                        if live_inference is not None:
+                            # analysed when its result comes back through the inbox, the
+                            # next frame is received and decoded in the meantime
+                            crop, roi = buddy.crop_frame(frame)
+                            live_inference.submit(
+                                crop, buddy.next_timestamp(), context=(roi, frame.shape)
+                            )
+                        elif inference_pool is not None:
+                            crop, roi = buddy.crop_frame(frame)
+                            try:
+                                with session_metrics.timer("inference"):
+                                    landmarks = await inference_pool.detect(
+                                        session_id, crop, buddy.next_timestamp()
+                                    )
+                            except TimeoutError:
+                                # the frame is given up, the next one is processed
+                                logger.warning("Inference timed out, frame skipped")
+                                METRICS.inc("inference_timeouts")
+                            else:
+                                analysis_data = buddy.analyze_landmarks(
+                                    buddy.track_landmarks(landmarks, roi, frame.shape)
+                                )
+                        else:
+                            analysis_data = await asyncio.to_thread(
+                                buddy.detect_from_frame, frame
+                            )
+
+                if analysis_data is not None:
+                    # Check if workout completed
+                    if buddy.count_rep >= buddy.goal_reps and buddy.goal_reps > 0:
+                        start_detection = False
+                        await websocket.send_text(
+                            dumps(
+                                {
+                                    "type": "data",
+                                    "message": f"Workout complete! You did {buddy.count_rep} {buddy.workout_name}!",
+                                    "status": "completed",
+                                }
+                            )
                         )
-                        # Check if workout completed
-                        if buddy.count_rep >= buddy.goal_reps and buddy.goal_reps > 0:
-                            start_detection = False
+                        logger.info("Workout complete! Writing data to database...")
+                        # only the last batch of frames is left to write
+                        workout_id: int = await asyncio.wrap_future(
+                            recorder.finish(
+                                buddy.workout_db_buffer, buddy.frame_buffer
+                            )
+                        )
+                        saved = workout_id != 0
+                        buddy.reset_data_buffers()  # Reset buffers after saving
+                        if saved:
+                            logger.info("Getting feedback...")
+                            # a pending upgrade of the previous set is stale, it stops
+                            # using the session cursor before the next extraction
+                            if feedback_task is not None:
+                                feedback_task.cancel()
+                                await asyncio.wait({feedback_task})
+                            feedback_task = asyncio.create_task(
+                                send_feedback(
+                                    websocket, feedback_agent, workout_id, feedback_budget
+                                )
+                            )
+                            wo_names.append(buddy.workout_name)
+                            wo_reps.append(buddy.count_rep)
+                            series_number+=1
+                        else:
+                            logger.error("Failed to save data to database.")
                             await websocket.send_text(
-                                json.dumps(
+                                dumps(
                                     {
-                                        "type": "data",
-                                        "message": f"Workout complete! You did {buddy.count_rep} {buddy.workout_name}!",
-                                        "status": "completed",
+                                        "type": "error",
+                                        "message": "Failed to save workout data. Please try again.",
                                     }
                                 )
                             )
-                            print("Workout complete! Writing data to database...")
-                            data_to_save: dict[str, Any] = buddy.get_data_to_save()
-                            buddy.reset_data_buffers()  # Reset buffers after saving
-
-                            # Save data to DuckDB
-                            saved = save_data_to_db(
-                                db_conn,
-                                metadata=data_to_save["workout_db_buffer"],
-                                analysis_data=data_to_save["wo_analysis_buffer"],
-                                raw_landmarks=data_to_save["raw_landmarks_buffer"],
-                            )
-                            if saved:
-                                print("Getting feedback...")
-                                try:
-                                    # feedback_message = '1234'
-                                    feedback = await asyncio.wait_for(
-                                        asyncio.to_thread(
-                                            feedback_agent.agent_pipeline
-                                        ),
-                                        timeout=180,
-                                    )
-
-                                    feedback_message = feedback["formatted_feedback"]
-                                except Exception as e:
-                                    print(f"Error getting feedback: {e}")
-                                    feedback_message = "Error getting feedback. Please try again later."
-
-                                print(f"Feedback received: {feedback_message}")
-                                await websocket.send_text(
-                                    json.dumps(
-                                        {
-                                            "type": "feedback",
-                                            "message": feedback_message,
-                                        }
-                                    )
-                                )
-                                wo_names.append(buddy.workout_name)
-                                wo_reps.append(buddy.count_rep)
-                                series_number+=1
-                            else:
-                                print("Failed to save data to database.")
-                                await websocket.send_text(
-                                    json.dumps(
-                                        {
-                                            "type": "error",
-                                            "message": "Failed to save workout data. Please try again.",
-                                        }
-                                    )
-                                )
-                        else:
-                            # Send current rep count and analysis data
+                    else:
+                        recorder.flush(buddy.workout_db_buffer, buddy.frame_buffer)
+                        # Send current rep count and analysis data
+                        # (the binary result carries the rep count)
+                        if not binary_results:
                             await websocket.send_text(
-                                json.dumps(
+                                dumps(
                                     {
                                         "type": "data",
                                         "message": f"Current rep count: {buddy.count_rep}",
@@ -197,8 +588,34 @@ async def camera_feed(websocket: WebSocket):
                                     }
                                 )
                             )
-                        # Send analysis data for rendering
-                        await websocket.send_text(json.dumps(analysis_data))
+                    # Send analysis data for rendering
+                    with session_metrics.timer("serialize"):
+                        if binary_results:
+                            payload = encode_analysis(
+                                analysis_data, buddy.last_landmarks, buddy.goal_reps
+                            )
+                        else:
+                            payload = dumps(analysis_data)
+                    with session_metrics.timer("send"):
+                        if binary_results:
+                            await websocket.send_bytes(payload)
+                        else:
+                            await websocket.send_text(payload)
+
+                if capture_rate is not None:
+                    fps = capture_rate.update(buddy.current_workout, start_detection)
+                    if fps is not None:
+                        await websocket.send_text(dumps({"type": CAPTURE_RATE, "fps": fps}))
+
+                if session_landmarker is not None and await session_landmarker.follow(
+                    session_metrics
+                ):
+                    # stepped to another model tier
+                    buddy.model = session_landmarker.landmarker
+                    if live_inference is not None:
+                        live_inference.close()
+                        METRICS.inc("frames_skipped_inference", live_inference.frames_skipped)
+                        live_inference = LiveInference(buddy.model, inbox.put, session_metrics)
             except asyncio.TimeoutError:
                 # Send history when idle
                 history_message = ""
@@ -207,7 +624,7 @@ async def camera_feed(websocket: WebSocket):
 
                 if history_message != last_history_sent:
                     await websocket.send_text(
-                        json.dumps(
+                        dumps(
                             {
                                 "type": "history",
                                 "message": history_message.replace("\n", "<br>"),
@@ -216,13 +633,38 @@ async def camera_feed(websocket: WebSocket):
                     )
                     last_history_sent = history_message
             except json.JSONDecodeError as e:
-                print(f"JSON decode error: {e}")
+                logger.warning("JSON decode error: %s", e)
             except ValueError as e:
-                print(f"Value error: {e}")
+                logger.warning("Value error: %s", e)
     except WebSocketDisconnect:
-        print("Client disconnected")
+        logger.info("Client disconnected")
     except Exception as e:
-        print(f"WebSocket error: {e}")
+        logger.error("WebSocket error: %s", e)
     finally:
-        close_db_connection(conn=db_conn)
-        print("WebSocket connection closed")
+        receiver.cancel()
+        await asyncio.gather(receiver, return_exceptions=True)
+        if feedback_task is not None and not feedback_task.done():
+            feedback_task.cancel()
+            # the feedback agent uses the session cursor until it stops
+            await asyncio.wait({feedback_task})
+        if live_inference is not None:
+            live_inference.close()
+            METRICS.inc("frames_skipped_inference", live_inference.frames_skipped)
+        logger.info(
+            "Frames received: %s, dropped (superseded): %s, stage timings: %s",
+            inbox.frames_received,
+            inbox.frames_dropped,
+            session_metrics.summary(),
+        )
+        # keep the frames of an interrupted set
+        recorder.finish(buddy.workout_db_buffer, buddy.frame_buffer)
+        archive_dir = getattr(websocket.app.state, "archive_dir", "")
+        if archive_dir:
+            # queued after the last writes of the session
+            websocket.app.state.db_writer.call(archive_session, session_id, archive_dir)
+        store.release(db_conn)
+        if session_landmarker is not None:
+            await session_landmarker.release()
+        if inference_pool is not None:
+            inference_pool.release_session(session_id)
+        logger.info("WebSocket connection closed")
@@ -0,0 +1,260 @@
+import glob
+import logging
+import os
+from datetime import date
+from typing import Any, Iterator
+import duckdb
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ARCHIVE_DIR: str = "data/archive"
+
+# archived tables, every archived row also carries the session_id of its workout
+ARCHIVE_TABLES: tuple[str, ...] = ("workout", "workout_analysis", "raw_landmarks")
+
+# media type of the Arrow IPC streaming format
+ARROW_STREAM_MEDIA_TYPE: str = "application/vnd.apache.arrow.stream"
+
+_ARCHIVE_SELECT: dict[str, str] = {
+    "workout": "SELECT w.*",
+    "workout_analysis": "SELECT t.*",
+    "raw_landmarks": "SELECT t.*, w.session_id",
+}
+
+
+def _table_dir(archive_dir: str, table: str) -> str:
+    return os.path.join(archive_dir, table)
+
+
+def _table_glob(archive_dir: str, table: str) -> str:
+    return os.path.join(_table_dir(archive_dir, table), "**", "*.parquet")
+
+
+def _check_table(table: str) -> None:
+    if table not in ARCHIVE_TABLES:
+        raise ValueError(f"Unknown table {table}, expected one of {ARCHIVE_TABLES}.")
+
+
+def has_archive(archive_dir: str, table: str) -> bool:
+    """Whether some Parquet files of a table are archived."""
+    return bool(glob.glob(_table_glob(archive_dir, table), recursive=True))
+
+
+def archive_scan(archive_dir: str, table: str) -> str:
+    """
+    SQL table expression reading the archived Parquet files of a table in place.
+    The date and workout partition columns come from the hive directory layout, so
+    filters on them only open the matching files.
+    """
+    _check_table(table)
+    path = _table_glob(archive_dir, table).replace("'", "''")
+    return f"read_parquet('{path}', hive_partitioning = true, union_by_name = true)"
+
+
+def _parquet_files(archive_dir: str) -> set[str]:
+    return {
+        path
+        for table in ARCHIVE_TABLES
+        for path in glob.glob(_table_glob(archive_dir, table), recursive=True)
+    }
+
+
+def archive_workouts(
+    conn: duckdb.DuckDBPyConnection,
+    workout_ids: list[int],
+    archive_dir: str = DEFAULT_ARCHIVE_DIR,
+    delete_live: bool = True,
+) -> int:
+    """
+    Compact completed workouts into the Parquet archive.
+    Layout: <archive_dir>/<table>/date=YYYY-MM-DD/workout=<name>/part_<uuid>.parquet, the
+    date being the start date of the workout. Every call appends new files.
+    The call can be retried: the workouts already in the archive are not copied again,
+    and the files of a failed copy are removed.
+    Args:
+        conn (duckdb.DuckDBPyConnection): connection to the live database.
+        workout_ids (list[int]): the workouts to archive.
+        archive_dir (str): root directory of the archive.
+        delete_live (bool): remove the archived rows from the live tables.
+    Returns:
+        int: the number of workouts archived.
+    """
+    if not workout_ids:
+        return 0
+    for table in ARCHIVE_TABLES:
+        os.makedirs(_table_dir(archive_dir, table), exist_ok=True)
+    conn.execute(
+        "CREATE OR REPLACE TEMP TABLE archive_ids AS SELECT unnest(?::INTEGER[]) AS id",
+        [list(workout_ids)],
+    )
+    if has_archive(archive_dir, "workout"):
+        # left over by an interrupted call, their live rows only need to be deleted
+        conn.execute(
+            f"""DELETE FROM archive_ids WHERE id IN (
+                SELECT id FROM {archive_scan(archive_dir, "workout")})"""
+        )
+    files_before = _parquet_files(archive_dir)
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        # the workout rows go last, an archived workout always has its frames archived
+        for table in reversed(ARCHIVE_TABLES):
+            join = (
+                "FROM workout w"
+                if table == "workout"
+                else f"FROM {table} t JOIN workout w ON t.workout_id = w.id"
+            )
+            target = _table_dir(archive_dir, table).replace("'", "''")
+            conn.execute(
+                f"""
+                COPY (
+                    {_ARCHIVE_SELECT[table]},
+                    CAST(w.timestamp_start AS DATE) AS date, w.workout_name AS workout
+                    {join}
+                    WHERE w.id IN (SELECT id FROM archive_ids)
+                ) TO '{target}' (
+                    FORMAT PARQUET, PARTITION_BY (date, workout), APPEND true,
+                    FILENAME_PATTERN 'part_{{uuid}}', COMPRESSION zstd
+                )"""
+            )
+        if delete_live:
+            for table in ("raw_landmarks", "workout_analysis"):
+                conn.execute(
+                    f"DELETE FROM {table} WHERE workout_id IN (SELECT unnest(?::INTEGER[]))",
+                    [list(workout_ids)],
+                )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        # COPY files are not transactional, a retry would archive the rows twice
+        for path in _parquet_files(archive_dir) - files_before:
+            os.remove(path)
+        raise
+    finally:
+        conn.execute("DROP TABLE IF EXISTS archive_ids")
+    if delete_live:
+        # DuckDB only sees the referencing rows as deleted once committed, so the workout
+        # rows go in a second transaction. Should it fail, calling again finishes the job.
+        conn.execute(
+            "DELETE FROM workout WHERE id IN (SELECT unnest(?::INTEGER[]))",
+            [list(workout_ids)],
+        )
+    logger.info("Archived workouts %s to %s", workout_ids, archive_dir)
+    return len(workout_ids)
+
+
+def archive_session(
+    conn: duckdb.DuckDBPyConnection,
+    session_id: str,
+    archive_dir: str = DEFAULT_ARCHIVE_DIR,
+    delete_live: bool = True,
+) -> int:
+    """Archive all the workouts of a completed session, returns how many were archived."""
+    ids = [
+        row[0]
+        for row in conn.execute(
+            "SELECT id FROM workout WHERE session_id = ? ORDER BY id", [session_id]
+        ).fetchall()
+    ]
+    return archive_workouts(conn, ids, archive_dir, delete_live)
+
+
+def create_archive_views(
+    conn: duckdb.DuckDBPyConnection, archive_dir: str = DEFAULT_ARCHIVE_DIR
+) -> list[str]:
+    """
+    Create an archive_<table> view over the Parquet files of every archived table, so the
+    archive can be queried in place like the live tables. Returns the created views.
+    """
+    views = []
+    for table in ARCHIVE_TABLES:
+        if has_archive(archive_dir, table):
+            conn.execute(
+                f"CREATE OR REPLACE VIEW archive_{table} AS SELECT * FROM {archive_scan(archive_dir, table)}"
+            )
+            views.append(f"archive_{table}")
+    return views
+
+
+def query_archive(  # pylint: disable=too-many-arguments
+    conn: duckdb.DuckDBPyConnection,
+    table: str,
+    archive_dir: str = DEFAULT_ARCHIVE_DIR,
+    *,
+    user_id: str | None = None,
+    session_id: str | None = None,
+    start: date | None = None,
+    end: date | None = None,
+    batch_rows: int = 65_536,
+):
+    """
+    Stream archived rows of a table as Arrow record batches.
+    Args:
+        conn (duckdb.DuckDBPyConnection): a DuckDB connection (the files are read in place).
+        table (str): one of ARCHIVE_TABLES.
+        archive_dir (str): root directory of the archive.
+        user_id (str | None): only the rows of the workouts of this user.
+        session_id (str | None): only the rows of this session.
+        start (date | None): only the workouts started on or after this date.
+        end (date | None): only the workouts started on or before this date.
+        batch_rows (int): rows per record batch.
+    Returns:
+        pyarrow.RecordBatchReader: the rows, read lazily batch by batch.
+    """
+    conditions: list[str] = []
+    params: list[Any] = []
+    if user_id is not None:
+        # only the workout rows carry the user of every archived table
+        id_column = "id" if table == "workout" else "workout_id"
+        conditions.append(
+            f"{id_column} IN (SELECT id FROM {archive_scan(archive_dir, 'workout')} "
+            "WHERE user_id = ?)"
+        )
+        params.append(user_id)
+    if session_id is not None:
+        conditions.append("session_id = ?")
+        params.append(session_id)
+    if start is not None:
+        conditions.append("date >= ?")
+        params.append(start)
+    if end is not None:
+        conditions.append("date <= ?")
+        params.append(end)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return conn.execute(
+        f"SELECT * FROM {archive_scan(archive_dir, table)} {where}", params
+    ).fetch_record_batch(batch_rows)
+
+
+class _ChunkSink:
+    """Write-only file object collecting the bytes written by the Arrow IPC writer."""
+
+    def __init__(self):
+        self.chunks: list[bytes] = []
+        self.closed: bool = False
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+def arrow_ipc_stream(reader) -> Iterator[bytes]:
+    """Encode a RecordBatchReader as an Arrow IPC stream, yielded batch by batch."""
+    import pyarrow as pa
+
+    sink = _ChunkSink()
+    with pa.ipc.new_stream(pa.PythonFile(sink, mode="w"), reader.schema) as writer:
+        yield sink.drain()
+        for batch in reader:
+            writer.write_batch(batch)
+            yield sink.drain()
+    yield sink.drain()
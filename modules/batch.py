@@ -0,0 +1,283 @@
+"""
+Offline analysis of recorded workout videos.
+
+    python -m modules.batch recording.mp4 [more.mp4 ...] --workout push-ups --reps 10
+
+Every video is split in chunks of frames whose pose detection runs in parallel worker
+processes, as fast as the CPU allows. A chunk starts detecting a little before its first
+frame (the overlap) so the VIDEO mode tracker is warm at the boundary; the overlap results
+are dropped. The rep counting and form checks are stateful, they run afterwards over the
+stitched landmarks of the whole video, in order, so a rep spanning two chunks is counted
+exactly once. Each video is saved as one set in the DuckDB store used by the app.
+"""
+
+import argparse
+import logging
+import os
+import uuid
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable
+import cv2
+import numpy as np
+from modules.db_setup import DEFAULT_DB_PATH, DuckDBStore, save_data_to_db
+from modules.gymBuddy import GymBuddy, create_landmarker
+from modules.utils import LandmarkFrame
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_PATH: str = "models/pose_landmarker_lite.task"
+
+
+def _default_landmarker_factory(model_path: str):
+    return create_landmarker(model_path)
+
+
+@dataclass
+class VideoInfo:
+    path: str
+    fps: float
+    n_frames: int
+    # naive local time of the first frame, approximated by the file's modification time
+    start: datetime
+
+
+@dataclass
+class ChunkResult:
+    start: int  # index of the first frame of the chunk
+    landmarks: np.ndarray  # (n, 33, 3) float32, x, y, visibility
+    found: np.ndarray  # (n,) bool, whether a pose was detected
+
+
+def probe_video(path: str) -> VideoInfo:
+    """Read the frame rate and the number of frames of a video."""
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError(f"Cannot open video {path}.")
+    try:
+        fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+        n_frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    finally:
+        capture.release()
+    duration = timedelta(seconds=n_frames / fps)
+    start = datetime.fromtimestamp(os.path.getmtime(path)) - duration
+    return VideoInfo(path=path, fps=fps, n_frames=n_frames, start=start)
+
+
+def split_chunks(n_frames: int, chunk_frames: int) -> list[tuple[int, int]]:
+    """[start, end) frame ranges covering the video."""
+    chunk_frames = max(int(chunk_frames), 1)
+    return [
+        (start, min(start + chunk_frames, n_frames))
+        for start in range(0, n_frames, chunk_frames)
+    ]
+
+
+def detect_chunk(  # pylint: disable=too-many-arguments
+    path: str,
+    start: int,
+    end: int,
+    *,
+    overlap: int,
+    fps: float,
+    model_path: str = DEFAULT_MODEL_PATH,
+    landmarker_factory: Callable[[str], Any] = _default_landmarker_factory,
+) -> ChunkResult:
+    """
+    Detect the poses of the frames [start, end) of a video, run in a worker process.
+    Args:
+        path (str): the video file.
+        start (int): first frame of the chunk.
+        end (int): end of the chunk (excluded).
+        overlap (int): frames detected before start to warm up the tracker, then dropped.
+        fps (float): frame rate of the video, for the model timestamps.
+        model_path (str): path to the .task model file.
+        landmarker_factory (Callable[[str], Any]): creates the VIDEO mode landmarker.
+    Returns:
+        ChunkResult: the landmarks of the chunk's frames.
+    """
+    import mediapipe as mp
+
+    first = max(start - overlap, 0)
+    landmarks = np.zeros((end - start, 33, 3), dtype=np.float32)
+    found = np.zeros(end - start, dtype=bool)
+    capture = cv2.VideoCapture(path)
+    landmarker = landmarker_factory(model_path)
+    try:
+        if first > 0:
+            capture.set(cv2.CAP_PROP_POS_FRAMES, first)
+        for index in range(first, end):
+            ok, frame = capture.read()
+            if not ok:
+                break
+            cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=frame)
+            image = mp.Image(image_format=mp.ImageFormat.SRGB, data=frame)
+            result = landmarker.detect_for_video(image, int(index * 1000 / fps))
+            if index < start or not (result and result.pose_landmarks):
+                continue
+            landmarks[index - start] = LandmarkFrame.from_landmarks(
+                result.pose_landmarks[0]
+            ).data
+            found[index - start] = True
+    finally:
+        landmarker.close()
+        capture.release()
+    return ChunkResult(start=start, landmarks=landmarks, found=found)
+
+
+def analyze_video(  # pylint: disable=too-many-arguments
+    info: VideoInfo,
+    chunks: list[ChunkResult],
+    *,
+    workout_name: str,
+    strictness: str,
+    goal_reps: int,
+    series_number: int = 1,
+    session_id: str | None = None,
+    user_id: str | None = None,
+) -> GymBuddy:
+    """Count the reps and check the form over the stitched chunks of a video, in order."""
+    buddy = GymBuddy(
+        workout_name=workout_name,
+        strictness_crit=strictness,
+        session_id=session_id,
+        user_id=user_id,
+        load_model=False,
+    )
+    buddy.set_reps(goal_reps)
+    buddy.set_series_number(series_number)
+    buddy.time = info.start
+    start_us = int((info.start - datetime(1970, 1, 1)).total_seconds() * 1_000_000)
+    for chunk in sorted(chunks, key=lambda c: c.start):
+        for offset in range(len(chunk.found)):
+            if not chunk.found[offset]:
+                continue
+            index = chunk.start + offset
+            buddy.analyze_landmarks(
+                LandmarkFrame(chunk.landmarks[offset]),
+                timestamp_us=start_us + int(index * 1_000_000 / info.fps),
+            )
+    return buddy
+
+
+def analyze_videos(  # pylint: disable=too-many-arguments
+    paths: list[str],
+    *,
+    db_path: str = DEFAULT_DB_PATH,
+    workout_name: str = "push-ups",
+    strictness: str = "loose",
+    goal_reps: int = 0,
+    user_id: str | None = None,
+    workers: int | None = None,
+    chunk_seconds: float = 60.0,
+    overlap_seconds: float = 1.0,
+    model_path: str = DEFAULT_MODEL_PATH,
+    landmarker_factory: Callable[[str], Any] = _default_landmarker_factory,
+) -> list[dict[str, Any]]:
+    """
+    Analyse recorded videos and save each of them as a set in the DuckDB store.
+    Returns:
+        list[dict[str, Any]]: per video, its path, frames, detected frames, reps and whether it was saved.
+    """
+    infos = [probe_video(path) for path in paths]
+    session_id = f"batch-{uuid.uuid4().hex}"
+    store = DuckDBStore(db_path)
+    summaries = []
+    try:
+        # mediapipe is not fork safe, the workers are spawned
+        with ProcessPoolExecutor(
+            max_workers=workers or os.cpu_count(),
+            mp_context=multiprocessing.get_context("spawn"),
+        ) as executor:
+            # submit every chunk of every video first so the workers never idle
+            futures: list[list[Future]] = [
+                [
+                    executor.submit(
+                        detect_chunk,
+                        info.path,
+                        start,
+                        end,
+                        overlap=round(overlap_seconds * info.fps),
+                        fps=info.fps,
+                        model_path=model_path,
+                        landmarker_factory=landmarker_factory,
+                    )
+                    for start, end in split_chunks(
+                        info.n_frames, round(chunk_seconds * info.fps)
+                    )
+                ]
+                for info in infos
+            ]
+            for series_number, (info, video_futures) in enumerate(zip(infos, futures), 1):
+                buddy = analyze_video(
+                    info,
+                    [future.result() for future in video_futures],
+                    workout_name=workout_name,
+                    strictness=strictness,
+                    goal_reps=goal_reps,
+                    series_number=series_number,
+                    session_id=session_id,
+                    user_id=user_id,
+                )
+                frames = buddy.frame_buffer.view()
+                saved = bool(buddy.workout_db_buffer) and save_data_to_db(
+                    store.conn, buddy.workout_db_buffer, frames
+                )
+                summaries.append(
+                    {
+                        "path": info.path,
+                        "frames": info.n_frames,
+                        "detected_frames": len(frames),
+                        "reps": buddy.count_rep,
+                        "saved": saved,
+                    }
+                )
+                logger.info(
+                    "%s: %d/%d frames with a pose, %d reps, saved: %s",
+                    info.path,
+                    len(frames),
+                    info.n_frames,
+                    buddy.count_rep,
+                    saved,
+                )
+    finally:
+        store.close()
+    return summaries
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Analyse recorded workout videos into the GymBuddy database."
+    )
+    parser.add_argument("videos", nargs="+", help="video files, one set each")
+    parser.add_argument("--workout", default="push-ups", choices=["push-ups", "squats"])
+    parser.add_argument("--strictness", default="loose")
+    parser.add_argument("--reps", type=int, default=0, help="rep goal of the sets")
+    parser.add_argument("--user-id", default=None)
+    parser.add_argument(
+        "--db", default=os.environ.get("GYMBUDDY_DB_PATH", DEFAULT_DB_PATH)
+    )
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--workers", type=int, default=None, help="default: one per CPU")
+    parser.add_argument("--chunk-seconds", type=float, default=60.0)
+    parser.add_argument("--overlap-seconds", type=float, default=1.0)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    analyze_videos(
+        args.videos,
+        db_path=args.db,
+        workout_name=args.workout,
+        strictness=args.strictness,
+        goal_reps=args.reps,
+        user_id=args.user_id,
+        workers=args.workers,
+        chunk_seconds=args.chunk_seconds,
+        overlap_seconds=args.overlap_seconds,
+        model_path=args.model,
+    )
+
+
+if __name__ == "__main__":
+    main()
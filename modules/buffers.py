@@ -0,0 +1,191 @@
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Sequence
+import numpy as np
+
+
+@dataclass
+class FrameBatch:
+    """
+    Columnar view over the frames captured during a set.
+    Every array has the number of frames as first dimension. The arrays are views on
+    the FrameBuffer storage, they are only valid until the buffer is cleared or taken.
+    """
+
+    frame: np.ndarray  # (N,) int32
+    timestamp_us: np.ndarray  # (N,) int64, microseconds since epoch (local time)
+    rep_count: np.ndarray  # (N,) int32
+    down: np.ndarray  # (N,) bool
+    form_issue_code: np.ndarray  # (N,) int16, index in form_issue_labels
+    form_issue_labels: list[str]
+    angle_names: list[str]
+    angle_joint_indices: list[tuple[int, int, int]]
+    angles: np.ndarray  # (N, n_angles) float32
+    landmarks: np.ndarray  # (N, n_landmarks, 2) float32
+
+    def __len__(self) -> int:
+        return len(self.frame)
+
+    def form_issues(self) -> list[str]:
+        """Decode the form issue codes back to their labels."""
+        return [self.form_issue_labels[code] for code in self.form_issue_code.tolist()]
+
+
+class FrameBuffer:
+    """
+    Preallocated, growable struct-of-arrays buffer for the per-frame data of a set.
+    Replaces the per-frame lists of dicts: one append writes a row in each column and
+    the buffer only reallocates (doubling its capacity) when it is full.
+    """
+
+    def __init__(self, capacity: int = 256, n_landmarks: int = 33):
+        self.n_landmarks: int = n_landmarks
+        self.initial_capacity: int = max(int(capacity), 1)
+        self.capacity: int = self.initial_capacity
+        self.size: int = 0
+        self.angle_names: list[str] = []
+        self.angle_joint_indices: list[tuple[int, int, int]] = []
+        self.form_issue_labels: list[str] = []
+        self._form_issue_codes: dict[str, int] = {}
+        # one column per angle, resized by set_angles
+        self._angles: np.ndarray = np.zeros((self.capacity, 0), dtype=np.float32)
+        self._allocate(self.capacity)
+        # wall clock anchor, the per-frame timestamps are derived from the monotonic clock
+        self._wall_anchor_us: int = 0
+        self._mono_anchor_ns: int = 0
+        self._reset_clock()
+
+    def _allocate(self, capacity: int, n_angles: int = 0) -> None:
+        self._frame = np.zeros(capacity, dtype=np.int32)
+        self._timestamp_us = np.zeros(capacity, dtype=np.int64)
+        self._rep_count = np.zeros(capacity, dtype=np.int32)
+        self._down = np.zeros(capacity, dtype=bool)
+        self._form_issue_code = np.zeros(capacity, dtype=np.int16)
+        self._angles = np.zeros((capacity, n_angles), dtype=np.float32)
+        self._landmarks = np.zeros((capacity, self.n_landmarks, 2), dtype=np.float32)
+
+    def _grow(self) -> None:
+        new_capacity = self.capacity * 2
+        for name in (
+            "_frame",
+            "_timestamp_us",
+            "_rep_count",
+            "_down",
+            "_form_issue_code",
+            "_angles",
+            "_landmarks",
+        ):
+            old = getattr(self, name)
+            new = np.zeros((new_capacity,) + old.shape[1:], dtype=old.dtype)
+            new[: self.size] = old[: self.size]
+            setattr(self, name, new)
+        self.capacity = new_capacity
+
+    def _reset_clock(self) -> None:
+        now = datetime.now()
+        # naive local time, same convention as the datetime.now() used for the metadata
+        self._wall_anchor_us = (
+            int((now - datetime(1970, 1, 1)).total_seconds()) * 1_000_000
+            + now.microsecond
+        )
+        self._mono_anchor_ns = time.monotonic_ns()
+
+    def now_us(self) -> int:
+        """Current timestamp in microseconds, monotonic within the buffer's lifetime."""
+        return self._wall_anchor_us + (time.monotonic_ns() - self._mono_anchor_ns) // 1000
+
+    def set_angles(
+        self, names: Sequence[str], joint_indices: Sequence[Sequence[int]]
+    ) -> None:
+        """Declare the angle columns of the buffer. Only allowed while it is empty."""
+        if self.size:
+            raise ValueError("Cannot change the angle columns of a non empty buffer.")
+        self.angle_names = list(names)
+        self.angle_joint_indices = [tuple(int(i) for i in idx) for idx in joint_indices]
+        self._angles = np.zeros((self.capacity, len(self.angle_names)), dtype=np.float32)
+
+    def form_issue_code(self, form_issues: str) -> int:
+        """Return the code of a form issue label, registering it if needed."""
+        code = self._form_issue_codes.get(form_issues)
+        if code is None:
+            code = len(self.form_issue_labels)
+            self.form_issue_labels.append(form_issues)
+            self._form_issue_codes[form_issues] = code
+        return code
+
+    def append(  # pylint: disable=too-many-arguments
+        self,
+        *,
+        frame: int,
+        rep_count: int,
+        down: bool,
+        form_issues: str,
+        angles: Sequence[float],
+        landmarks: np.ndarray,
+        timestamp_us: int | None = None,
+    ) -> None:
+        """
+        Append the data of one frame, the columns are given by keyword.
+        Args:
+            frame (int): the frame number.
+            rep_count (int): the rep count after this frame.
+            down (bool): whether the user is in the down phase.
+            form_issues (str): the form message of the frame.
+            angles (Sequence[float]): the angle values, in the order of angle_names.
+            landmarks (np.ndarray): (n_landmarks, >=2) array, only x and y are kept.
+            timestamp_us (int | None): timestamp of the frame, now when None (live frames).
+        """
+        if self.size == self.capacity:
+            self._grow()
+        i = self.size
+        self._frame[i] = frame
+        self._timestamp_us[i] = self.now_us() if timestamp_us is None else timestamp_us
+        self._rep_count[i] = rep_count
+        self._down[i] = down
+        self._form_issue_code[i] = self.form_issue_code(form_issues)
+        self._angles[i] = angles
+        self._landmarks[i] = landmarks[:, :2]
+        self.size += 1
+
+    def __len__(self) -> int:
+        return self.size
+
+    def view(self) -> FrameBatch:
+        """Zero-copy view of the filled part of the buffer."""
+        n = self.size
+        return FrameBatch(
+            frame=self._frame[:n],
+            timestamp_us=self._timestamp_us[:n],
+            rep_count=self._rep_count[:n],
+            down=self._down[:n],
+            form_issue_code=self._form_issue_code[:n],
+            form_issue_labels=list(self.form_issue_labels),
+            angle_names=list(self.angle_names),
+            angle_joint_indices=list(self.angle_joint_indices),
+            angles=self._angles[:n],
+            landmarks=self._landmarks[:n],
+        )
+
+    def take(self) -> FrameBatch:
+        """
+        Hand over the filled part of the buffer and start over with fresh storage.
+        Unlike view, the returned batch owns its arrays so it can be consumed by another
+        thread while the buffer keeps filling. The angle columns, the form issue codes
+        and the clock are kept, so consecutive batches of a set stay consistent.
+        """
+        batch = self.view()
+        self.capacity = self.initial_capacity
+        self._allocate(self.capacity, len(self.angle_names))
+        self.size = 0
+        return batch
+
+    def clear(self) -> None:
+        """Empty the buffer, keeping the allocated storage."""
+        self.size = 0
+        self.angle_names = []
+        self.angle_joint_indices = []
+        self.form_issue_labels = []
+        self._form_issue_codes = {}
+        self._angles = np.zeros((self.capacity, 0), dtype=np.float32)
+        self._reset_clock()
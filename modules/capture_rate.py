@@ -0,0 +1,76 @@
+import time
+from modules.metrics import METRICS
+from modules.workouts.workoutParent import Workout
+
+# type of the websocket messages telling the client at which rate to send its frames
+CAPTURE_RATE: str = "capture_rate"
+
+# frames per second asked from the client: between the sets, or without movement ...
+IDLE_FPS: int = 2
+# ... during a rep, away from its thresholds ...
+MOVING_FPS: int = 5
+# ... and close to a threshold, where a rep can be counted (the former fixed rate)
+TRANSITION_FPS: int = 10
+
+# degrees from a threshold of the rep angle under which the transition rate is used
+TRANSITION_MARGIN_DEG: float = 20.0
+# change of the rep angle (degrees) counted as a movement
+MOVEMENT_DEG: float = 5.0
+# seconds without movement before the idle rate is used
+IDLE_AFTER_SECONDS: float = 2.0
+# seconds a rate is kept before a lower one is sent, a higher one is sent at once
+HOLD_SECONDS: float = 1.0
+
+
+class CaptureRateController:
+    """
+    Rate at which the client of a session should capture its frames, from the state of
+    the workout: low between the sets and when the user stands still, high when the rep
+    angle gets close to a threshold of Workout.incr_count.
+    The rate goes up at once so no rep transition is missed, and only goes down after
+    HOLD_SECONDS, so it does not flap around the margins.
+    """
+
+    def __init__(self, fps: int = TRANSITION_FPS):
+        # the fixed rate of the clients until they get a hint
+        self.fps: int = fps
+        self.changed_at: float = 0.0
+        self.moved_at: float = 0.0
+        # rep angle at the last movement
+        self.reference_angle: float | None = None
+
+    def target(self, workout: Workout, detecting: bool, now: float) -> int:
+        """Rate the state of the workout calls for."""
+        if not detecting:
+            # the idle delay of a set counts from its start
+            self.reference_angle = None
+            self.moved_at = now
+            return IDLE_FPS
+        margin = workout.rep_margin()
+        if margin is None:
+            # nobody in the frame
+            return IDLE_FPS if now - self.moved_at >= IDLE_AFTER_SECONDS else MOVING_FPS
+        angle = workout.angles[workout.rep_angle]
+        if self.reference_angle is None or abs(angle - self.reference_angle) >= MOVEMENT_DEG:
+            self.reference_angle = angle
+            self.moved_at = now
+        if margin <= TRANSITION_MARGIN_DEG:
+            return TRANSITION_FPS
+        if now - self.moved_at >= IDLE_AFTER_SECONDS:
+            return IDLE_FPS
+        return MOVING_FPS
+
+    def update(self, workout: Workout, detecting: bool, now: float | None = None) -> int | None:
+        """
+        Follow the workout after a frame or a control message.
+        Returns:
+            int | None: the new rate to send to the client, None when it is unchanged.
+        """
+        now = time.monotonic() if now is None else now
+        fps = self.target(workout, detecting, now)
+        if fps == self.fps or (fps < self.fps and now - self.changed_at < HOLD_SECONDS):
+            return None
+        self.fps = fps
+        self.changed_at = now
+        METRICS.inc("capture_rate_hints")
+        return fps
@@ -1,7 +1,14 @@
+import logging
+import os
+import queue
+from contextlib import contextmanager
+from typing import Any, Iterator
 import duckdb
-from typing import Any
-import pandas as pd
-from modules.utils import extend_row
+from modules.buffers import FrameBatch
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH: str = "data/gymbuddy.duckdb"
 
 
 def connect_in_memory_db() -> duckdb.DuckDBPyConnection:
@@ -16,13 +23,72 @@ def connect_in_memory_db() -> duckdb.DuckDBPyConnection:
     return conn
 
 
+class DuckDBStore:
+    """
+    Process-wide, file-backed DuckDB store.
+    The database is opened and set up once, at app startup. Sessions lease a cursor
+    (a lightweight connection to the same database) and give it back when they end;
+    up to pool_size idle cursors are kept for the next sessions.
+    """
+
+    def __init__(self, path: str = DEFAULT_DB_PATH, pool_size: int = 8):
+        self.path: str = path
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn: duckdb.DuckDBPyConnection = duckdb.connect(database=path)
+        setup_database(self.conn)
+        self._idle: queue.Queue = queue.Queue(maxsize=pool_size)
+        for _ in range(pool_size):
+            self._idle.put_nowait(self.conn.cursor())
+
+    def acquire(self) -> duckdb.DuckDBPyConnection:
+        """Lease a cursor on the store, a new one is opened if none is idle."""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self.conn.cursor()
+
+    def release(self, cursor: duckdb.DuckDBPyConnection) -> None:
+        """Give a leased cursor back to the pool."""
+        try:
+            self._idle.put_nowait(cursor)
+        except queue.Full:
+            cursor.close()
+
+    @contextmanager
+    def lease(self) -> Iterator[duckdb.DuckDBPyConnection]:
+        """Context manager leasing a cursor for the duration of the block."""
+        cursor = self.acquire()
+        try:
+            yield cursor
+        finally:
+            self.release(cursor)
+
+    def close(self) -> None:
+        """Close the idle cursors and the database."""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        close_db_connection(self.conn)
+
+
+def landmark_columns(n_landmarks: int = 33) -> list[str]:
+    """Names of the flattened landmark columns: landmark_0_x, landmark_0_y, ..."""
+    columns = []
+    for i in range(n_landmarks):
+        columns.extend([f"landmark_{i}_x", f"landmark_{i}_y"])
+    return columns
+
+
 def setup_database(conn: duckdb.DuckDBPyConnection) -> None:
     """
     Setup the DuckDB database with the necessary tables and sequences.
     Args:
         conn (duckdb.DuckDBPyConnection): The connection to the DuckDB database.
     """
-    print("Setting up DuckDB database...")
+    logger.debug("Setting up DuckDB database...")
     # create a sequence for the workout ids.
     conn.sql("""CREATE SEQUENCE IF NOT EXISTS workout_id_seq INCREMENT BY 1; """)
 
@@ -32,6 +98,8 @@ def setup_database(conn: duckdb.DuckDBPyConnection) -> None:
         """
         CREATE TABLE IF NOT EXISTS workout (
             ID INTEGER PRIMARY KEY default(nextval('workout_id_seq')),
+            session_id VARCHAR,
+            user_id VARCHAR,
             workout_name VARCHAR(128) NOT NULL,
             timestamp_start TIMESTAMP not null, 
             rep_goal INTEGER not null,
@@ -52,6 +120,8 @@ def setup_database(conn: duckdb.DuckDBPyConnection) -> None:
         """
         CREATE TABLE IF NOT EXISTS workout_analysis (
             workout_id INTEGER not null,
+            session_id VARCHAR,
+            user_id VARCHAR,
             frame INTEGER not null,
             timestamp TIMESTAMP not null,
             rep_count INTEGER not null,
@@ -62,7 +132,51 @@ def setup_database(conn: duckdb.DuckDBPyConnection) -> None:
             FOREIGN KEY (workout_id) REFERENCES workout(ID))
             """
     )
-    print("DuckDB setup complete.")
+    # Create a table for the raw landmarks.
+    # one row per frame with the x and y coordinates of the 33 landmarks as columns
+    landmarks_ddl = ",\n            ".join(
+        f"{name} FLOAT not null" for name in landmark_columns()
+    )
+    conn.sql(
+        f"""
+        CREATE TABLE IF NOT EXISTS raw_landmarks (
+            workout_id INTEGER not null,
+            frame INTEGER not null,
+            timestamp TIMESTAMP not null,
+            {landmarks_ddl},
+            primary key (workout_id, frame),
+            FOREIGN KEY (workout_id) REFERENCES workout(ID))
+            """
+    )
+    # re-scored analyses (modules.rescoring): one version per re-scoring run and the
+    # per-frame results of every set it re-scored. The sets may be archived since, so
+    # there is no foreign key to the workout table.
+    conn.sql("""CREATE SEQUENCE IF NOT EXISTS analysis_version_seq INCREMENT BY 1; """)
+    conn.sql(
+        """
+        CREATE TABLE IF NOT EXISTS analysis_version (
+            ID INTEGER PRIMARY KEY default(nextval('analysis_version_seq')),
+            created_at TIMESTAMP not null,
+            strictness_crit VARCHAR(16),
+            rules VARCHAR not null,
+            description VARCHAR)
+            """
+    )
+    conn.sql(
+        """
+        CREATE TABLE IF NOT EXISTS workout_analysis_version (
+            version INTEGER not null,
+            workout_id INTEGER not null,
+            frame INTEGER not null,
+            timestamp TIMESTAMP not null,
+            rep_count INTEGER not null,
+            down BOOLEAN not null,
+            form_issues VARCHAR not null,
+            primary key (version, workout_id, frame),
+            FOREIGN KEY (version) REFERENCES analysis_version(ID))
+            """
+    )
+    logger.info("DuckDB setup complete.")
     # print(conn.sql(""" describe workout """))
     # print(conn.sql(""" describe workout_analysis """))
 
@@ -79,12 +193,14 @@ def write_workout_metadata(conn: duckdb.DuckDBPyConnection, metadata: dict) -> i
     """
 
     try:
-        conn.sql(
+        inserted = conn.sql(
             """
-            INSERT INTO workout (workout_name, timestamp_start,rep_goal,series_number,
-            strictness_crit,strictness_definition, left_side,ldmrks_of_interest)
-            VALUES (?,?,?,?,?,?,?,MAP(?,?)) """,
+            INSERT INTO workout (session_id, user_id, workout_name, timestamp_start,rep_goal,
+            series_number, strictness_crit,strictness_definition, left_side,ldmrks_of_interest)
+            VALUES (?,?,?,?,?,?,?,?,?,MAP(?,?)) RETURNING ID""",
             params=[
+                metadata.get("session_id"),
+                metadata.get("user_id"),
                 metadata["workout_name"],
                 metadata["timestamp_start"],
                 metadata["rep_goal"],
@@ -95,98 +211,135 @@ def write_workout_metadata(conn: duckdb.DuckDBPyConnection, metadata: dict) -> i
                 metadata["ldmrks_values"],
                 metadata["ldmrks_keys"],
             ],
-        )
-        # Get the last inserted id
-        last_id = conn.sql("SELECT max(id) from workout").fetchone()
-        if last_id is not None:
-            return last_id[0]
-        print("No workout entries found in the database.")
+        ).fetchone()
+        # id of the inserted row, safe with several sessions writing to the same store
+        if inserted is not None:
+            return inserted[0]
+        logger.warning("No workout entries found in the database.")
         return 0
     except Exception as e:
-        print(f"Error inserting new workout metadata: {e}")
+        logger.error("Error inserting new workout metadata: %s", e)
         return 0
 
 
 def write_workout_analysis(
     conn: duckdb.DuckDBPyConnection,
-    analysis_data: list[dict[str, Any]],
+    frames: FrameBatch,
     workout_id: int,
+    session_id: str | None = None,
+    user_id: str | None = None,
 ) -> None:
     """
     Write workout analysis data to the DuckDB database.
     Args:
         conn (duckdb.DuckDBPyConnection): The connection to the DuckDB database.
-        analysis_data (list[dict[str,Any]]): A dictionary containing workout analysis data. The list should contain a dictionary for each frame.
-        Each dictionary should contain the following keys: frame, timestamp, rep_count, down, form_issues, angles_data, ldmrks_keys,
-        ldmrks_values.
-    workout_id (int): The id of the workout to which the analysis data belongs.
+        frames (FrameBatch): The columnar frames of the set. The columns are scanned in
+        place by DuckDB, the angles are packed into the angles_data list of structs and the
+        form issue codes are mapped back to their labels in SQL.
+        workout_id (int): The id of the workout to which the analysis data belongs.
+        session_id (str | None): The id of the websocket session that recorded the set.
+        user_id (str | None): The id of the user.
 
     """
-    data_to_insert = pd.DataFrame(analysis_data)
-    data_to_insert["workout_id"] = workout_id
+    if len(frames) == 0:
+        return
+    analysis_batch = {
+        "frame": frames.frame,
+        "timestamp_us": frames.timestamp_us,
+        "rep_count": frames.rep_count,
+        "down": frames.down,
+        "form_issue_code": frames.form_issue_code,
+    }
+    angle_structs: list[str] = []
+    params: list[Any] = [workout_id, session_id, user_id, frames.form_issue_labels]
+    for i, (name, joints) in enumerate(
+        zip(frames.angle_names, frames.angle_joint_indices)
+    ):
+        analysis_batch[f"angle_{i}"] = frames.angles[:, i]
+        angle_structs.append(
+            f"struct_pack(name := ?::VARCHAR, value := angle_{i}::DOUBLE, joint_indices := ?::INT[])"
+        )
+        params.extend([name, list(joints)])
+    angles_data = (
+        f"list_value({', '.join(angle_structs)})"
+        if angle_structs
+        else "[]::STRUCT(name VARCHAR, value DOUBLE, joint_indices INT[])[]"
+    )
 
     try:
-        conn.sql("INSERT INTO workout_analysis BY NAME SELECT * FROM data_to_insert")
+        conn.sql(
+            f"""
+            INSERT INTO workout_analysis BY NAME
+            SELECT ?::INTEGER AS workout_id, ?::VARCHAR AS session_id, ?::VARCHAR AS user_id,
+            frame, make_timestamp(timestamp_us) AS timestamp, rep_count, down, list_extract(?::VARCHAR[], form_issue_code + 1) AS form_issues,
+            {angles_data} AS angles_data
+            FROM analysis_batch""",
+            params=params,
+        )
     except Exception as e:
-        print(f"Error inserting new workout analysis: {e}")
+        logger.error("Error inserting new workout analysis: %s", e)
 
 
 def write_raw_landmarks(
     conn: duckdb.DuckDBPyConnection,
-    raw_landmarks: list[dict[str, Any]],
+    frames: FrameBatch,
     workout_id: int,
 ) -> None:
     """
     Write raw landmarks data to the DuckDB database.
     Args:
         conn (duckdb.DuckDBPyConnection): The connection to the DuckDB database.
-        raw_landmarks (pd.DataFrame): A DataFrame containing raw landmarks data.
+        frames (FrameBatch): The columnar frames of the set.
         workout_id (int): The id of the workout to which the raw landmarks data belongs.
     """
-    columns = []
-    for i in range(33):
-        columns.extend([f"landmark_{i}_x", f"landmark_{i}_y"])
-    raw_landmarks_df = pd.DataFrame(raw_landmarks)
-    raw_landmarks_df["workout_id"] = workout_id
-    landmarks = raw_landmarks_df["landmarks"].apply(lambda x: extend_row(x))
-    landmarks_df = pd.DataFrame(landmarks.to_list(), columns=columns)
-    landmarks_processed = pd.concat([raw_landmarks_df, landmarks_df], axis=1)
-    landmarks_processed.drop(columns=["landmarks"], inplace=True)
+    if len(frames) == 0:
+        return
+    # (N, 33, 2) -> (N, 66): one reshape, the columns are strided views on the block
+    n_frames, n_landmarks, _ = frames.landmarks.shape
+    flat = frames.landmarks.reshape(n_frames, n_landmarks * 2)
+    columns = landmark_columns(n_landmarks)
+    landmarks_batch = {"frame": frames.frame, "timestamp_us": frames.timestamp_us}
+    landmarks_batch.update({name: flat[:, j] for j, name in enumerate(columns)})
     try:
         conn.sql(
-            "CREATE TABLE IF NOT EXISTS raw_landmarks AS SELECT * FROM landmarks_processed"
+            f"""
+            INSERT INTO raw_landmarks BY NAME
+            SELECT ?::INTEGER AS workout_id, frame, make_timestamp(timestamp_us) AS timestamp,
+            {', '.join(columns)}
+            FROM landmarks_batch""",
+            params=[workout_id],
         )
     except Exception as e:
-        print(f"Error inserting raw landmarks: {e}")
+        logger.error("Error inserting raw landmarks: %s", e)
 
 
 def save_data_to_db(
     conn: duckdb.DuckDBPyConnection,
     metadata: dict,
-    analysis_data: list[dict[str, Any]],
-    raw_landmarks: list[dict[str, Any]],
+    frames: FrameBatch,
 ) -> bool:
     """
     Save workout metadata, analysis data, and raw landmarks to the DuckDB database.
     Args:
         conn (duckdb.DuckDBPyConnection): The connection to the DuckDB database.
         metadata (dict): A dictionary containing workout metadata.
-        analysis_data (list[dict[str,Any]]): A list of dictionaries containing workout analysis data.
-        raw_landmarks (list[dict[str,Any]]): A list of dictionaries containing raw landmarks data.
+        frames (FrameBatch): The columnar analysis data and raw landmarks of the set.
     Returns:
         int: The id of the newly inserted workout entry, or 0 if the insertion failed.
     """
-    print("Saving data to DuckDB...")
     workout_id = write_workout_metadata(conn, metadata)
-    print(f"saved meatdata for workout id {workout_id}")
     if workout_id == 0:
-        print("Failed to insert workout metadata. Aborting data save.")
+        logger.error("Failed to insert workout metadata. Aborting data save.")
         return False
-    write_workout_analysis(conn, analysis_data, workout_id)
-    print(f"saved analysis data for workout id {workout_id}")
-    write_raw_landmarks(conn, raw_landmarks, workout_id)
-    print(f"saved raw landmarks for workout id {workout_id}")
-    print(f"Data saved successfully for workout ID: {workout_id}")
+    write_workout_analysis(
+        conn,
+        frames,
+        workout_id,
+        session_id=metadata.get("session_id"),
+        user_id=metadata.get("user_id"),
+    )
+    write_raw_landmarks(conn, frames, workout_id)
+    logger.info("Data saved successfully for workout ID: %s", workout_id)
     return True
 
 
@@ -198,6 +351,6 @@ def close_db_connection(conn: duckdb.DuckDBPyConnection) -> None:
     """
     if conn is not None:
         conn.close()
-        print("Database connection closed.")
+        logger.info("Database connection closed.")
     else:
-        print("No database connection to close.")
+        logger.warning("No database connection to close.")
@@ -0,0 +1,162 @@
+import logging
+import queue
+import time
+import threading
+from dataclasses import dataclass, field
+from concurrent.futures import Future
+from typing import Any, Callable
+import duckdb
+from modules.buffers import FrameBatch, FrameBuffer
+from modules.metrics import METRICS
+from modules.db_setup import (
+    write_workout_metadata,
+    write_workout_analysis,
+    write_raw_landmarks,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(eq=False)
+class SetHandle:
+    """Handle on a set being streamed to the database by a DBWriter."""
+
+    metadata: dict
+    # set by the writer thread once the metadata row is inserted
+    workout_id: int = 0
+    frames_written: int = 0
+    done: Future = field(default_factory=Future)
+
+
+class DBWriter:
+    """
+    Background writer persisting the frames of the running sets in micro-batches.
+    All the writes go through a single thread owning its own DuckDB cursor, so they never
+    block the websocket loop and are applied in submission order: the metadata row of a
+    set is inserted first, its analysis and landmark batches follow.
+    """
+
+    _STOP = object()
+
+    def __init__(self, conn: duckdb.DuckDBPyConnection):
+        self.conn: duckdb.DuckDBPyConnection = conn.cursor()
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run, name="gymbuddy-db-writer", daemon=True
+        )
+        self._thread.start()
+
+    def begin_set(self, metadata: dict) -> SetHandle:
+        """Queue the insertion of the metadata of a new set."""
+        handle = SetHandle(metadata)
+        self._queue.put(("begin", handle, None))
+        return handle
+
+    def append(self, handle: SetHandle, frames: FrameBatch) -> None:
+        """Queue a batch of frames of the set. The batch must own its arrays (see FrameBuffer.take)."""
+        if len(frames) > 0:
+            self._queue.put(("append", handle, frames))
+
+    def end_set(self, handle: SetHandle) -> Future:
+        """
+        Queue the end of the set.
+        Returns:
+            Future: resolves to the workout id once every batch of the set is written,
+            or 0 if the metadata could not be inserted.
+        """
+        self._queue.put(("end", handle, None))
+        return handle.done
+
+    def call(self, func: Callable[..., Any], *args: Any) -> Future:
+        """
+        Queue func(cursor, *args) on the writer thread, after everything queued before it.
+        Returns:
+            Future: resolves to the result of func.
+        """
+        done: Future = Future()
+        self._queue.put(("call", done, (func, args)))
+        return done
+
+    def _run(self) -> None:
+        while True:
+            METRICS.set_gauge("db_writer_queue_depth", self._queue.qsize())
+            item = self._queue.get()
+            if item is self._STOP:
+                break
+            action, handle, frames = item
+            try:
+                self._process(action, handle, frames)
+            except Exception as e:
+                logger.error("Error in database writer (%s): %s", action, e)
+                if action == "end" and not handle.done.done():
+                    handle.done.set_result(0)
+                elif action == "call":
+                    handle.set_exception(e)
+
+    def _process(self, action: str, handle: SetHandle, frames: Any) -> None:
+        if action == "begin":
+            handle.workout_id = write_workout_metadata(self.conn, handle.metadata)
+            if handle.workout_id == 0:
+                logger.error("Failed to insert workout metadata, the set will not be saved.")
+        elif action == "append":
+            if handle.workout_id == 0:
+                return
+            start = time.perf_counter()
+            write_workout_analysis(
+                self.conn,
+                frames,
+                handle.workout_id,
+                session_id=handle.metadata.get("session_id"),
+                user_id=handle.metadata.get("user_id"),
+            )
+            write_raw_landmarks(self.conn, frames, handle.workout_id)
+            METRICS.observe("db_save", time.perf_counter() - start)
+            handle.frames_written += len(frames)
+        elif action == "end":
+            handle.done.set_result(handle.workout_id)
+        elif action == "call":
+            func, args = frames
+            handle.set_result(func(self.conn, *args))
+
+    def close(self) -> None:
+        """Write everything still queued, then stop the thread and close the cursor."""
+        self._queue.put(self._STOP)
+        self._thread.join()
+        self.conn.close()
+
+
+class SetRecorder:
+    """
+    Streams the frames of a GymBuddy set to a DBWriter while the set runs.
+    The frame buffer is handed over every flush_frames frames, so the memory held per
+    connection is bounded and, at the end of the set, only the last batch is left to write.
+    """
+
+    def __init__(self, writer: DBWriter, flush_frames: int = 30):
+        self.writer: DBWriter = writer
+        self.flush_frames: int = flush_frames
+        self.handle: SetHandle | None = None
+
+    def flush(self, metadata: dict, buffer: FrameBuffer, force: bool = False) -> None:
+        """Hand the buffered frames to the writer once enough of them are collected."""
+        if len(buffer) == 0 or not metadata:
+            return
+        if not force and len(buffer) < self.flush_frames:
+            return
+        if self.handle is None:
+            self.handle = self.writer.begin_set(metadata.copy())
+        self.writer.append(self.handle, buffer.take())
+
+    def finish(self, metadata: dict, buffer: FrameBuffer) -> Future:
+        """
+        Write the remaining frames and close the set.
+        Returns:
+            Future: resolves to the workout id, 0 if nothing could be saved.
+        """
+        self.flush(metadata, buffer, force=True)
+        handle, self.handle = self.handle, None
+        if handle is None:
+            done: Future = Future()
+            done.set_result(0)
+            return done
+        return self.writer.end_set(handle)
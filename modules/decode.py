@@ -0,0 +1,115 @@
+import cv2
+import numpy as np
+
+# encodings a client can negotiate for its frames
+SUPPORTED_ENCODINGS: tuple[str, ...] = ("jpeg", "png", "webp", "raw-rgb")
+
+# start-of-frame markers holding the JPEG dimensions (all but DHT, JPG and DAC)
+_JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+_REDUCED_FLAGS = {
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+}
+
+
+def jpeg_size(data: bytes) -> tuple[int, int] | None:
+    """Read the (width, height) of a JPEG from its header, None if it is not a JPEG."""
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    offset = 2
+    while offset + 9 < len(data):
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+        if marker == 0xFF:  # fill byte
+            offset += 1
+            continue
+        if marker in _JPEG_SOF_MARKERS:
+            height = int.from_bytes(data[offset + 5 : offset + 7], "big")
+            width = int.from_bytes(data[offset + 7 : offset + 9], "big")
+            return width, height
+        offset += 2 + int.from_bytes(data[offset + 2 : offset + 4], "big")
+    return None
+
+
+class FrameDecoder:
+    """
+    Per-session decode stage turning the received bytes into the RGB frame given to the model.
+    - compressed frames (JPEG, PNG, WebP) are decoded once by OpenCV and converted to RGB in
+      place; JPEGs much larger than the model input are decoded at 1/2, 1/4 or 1/8 size
+      directly by the JPEG decoder.
+    - raw RGB frames (negotiated with their size) are used in place, without any copy.
+    Frames larger than needed that cannot be reduced while decoding are downscaled into a
+    buffer reused from one frame to the next.
+    """
+
+    def __init__(
+        self, encoding: str = "jpeg", width: int = 0, height: int = 0, target_size: int = 256
+    ):
+        self.encoding: str = "jpeg"
+        self.width: int = 0
+        self.height: int = 0
+        # smallest side the frames are reduced to, the pose model input is 256x256
+        self.target_size: int = target_size
+        self._scaled: np.ndarray | None = None
+        self.configure(encoding, width, height)
+
+    def configure(self, encoding: str, width: int = 0, height: int = 0) -> None:
+        """Set the encoding of the incoming frames, the size is required for raw-rgb."""
+        encoding = encoding.lower()
+        if encoding not in SUPPORTED_ENCODINGS:
+            raise ValueError(
+                f"Unsupported frame encoding {encoding}, expected one of {SUPPORTED_ENCODINGS}."
+            )
+        if encoding == "raw-rgb" and (width <= 0 or height <= 0):
+            raise ValueError("The frame size is required for raw-rgb frames.")
+        self.encoding = encoding
+        self.width = int(width)
+        self.height = int(height)
+
+    def _reduction(self, width: int, height: int) -> int:
+        for factor in (8, 4, 2):
+            if min(width, height) // factor >= self.target_size:
+                return factor
+        return 1
+
+    def _downscale(self, frame: np.ndarray) -> np.ndarray:
+        height, width = frame.shape[:2]
+        factor = min(width, height) / self.target_size
+        if factor < 2:
+            return frame
+        size = (round(width / factor), round(height / factor))
+        if self._scaled is None or self._scaled.shape[:2] != (size[1], size[0]):
+            self._scaled = np.empty((size[1], size[0], 3), dtype=np.uint8)
+        return cv2.resize(frame, size, dst=self._scaled, interpolation=cv2.INTER_AREA)
+
+    def decode(self, data: bytes) -> np.ndarray | None:
+        """
+        Decode a frame.
+        Args:
+            data (bytes): the frame as received from the client.
+        Returns:
+            np.ndarray | None: (height, width, 3) uint8 RGB image, None if it cannot be decoded.
+            The array may be reused by the next call.
+        """
+        if self.encoding == "raw-rgb":
+            if len(data) != self.width * self.height * 3:
+                return None
+            frame = np.frombuffer(data, dtype=np.uint8).reshape(self.height, self.width, 3)
+            return self._downscale(frame)
+
+        buffer = np.frombuffer(data, dtype=np.uint8)
+        size = jpeg_size(data)
+        flags = cv2.IMREAD_COLOR
+        if size is not None:
+            flags = _REDUCED_FLAGS.get(self._reduction(*size), cv2.IMREAD_COLOR)
+        frame = cv2.imdecode(buffer, flags)
+        if frame is None:
+            return None
+        # BGR -> RGB, in place in the array allocated by the decoder
+        cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=frame)
+        if size is None:
+            return self._downscale(frame)
+        return frame
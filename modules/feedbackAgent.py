@@ -1,22 +1,160 @@
+import asyncio
 import duckdb
 import json
+import logging
 import os
 import pandas as pd
+import textwrap
 from datetime import datetime
-from typing import Dict, Any
+import time
+from typing import Dict, Any, AsyncIterator
 from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.output_parsers import StructuredOutputParser, ResponseSchema
+from langchain_core.output_parsers import JsonOutputParser
 from langchain_core.prompts import ChatPromptTemplate
+from modules.feedback_cache import FeedbackCache, feedback_fingerprint
+from modules.local_feedback import NO_ROLLING_SUMMARY, local_feedback, roll_summary
+from modules.metrics import METRICS
+from modules.prompt_budget import (
+    COMPACTION_LEVELS,
+    TokenUsageRecorder,
+    compact_inputs,
+    estimate_tokens,
+    format_angle_stats,
+)
+
+logger = logging.getLogger(__name__)
+
+
+async def _to_thread_to_completion(func: Any, *args: Any) -> Any:
+    """
+    asyncio.to_thread for the steps using the session cursor or the agent state.
+    A thread cannot be stopped, so a cancelled caller still waits for it to return
+    before the cancellation goes on, and the cursor is never released or reused
+    while the thread runs SQL on it.
+    """
+    future = asyncio.ensure_future(asyncio.to_thread(func, *args))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        while not future.done():
+            try:
+                await asyncio.wait({future})
+            except asyncio.CancelledError:
+                continue
+        if not future.cancelled():
+            # retrieved, the caller is cancelled anyway
+            future.exception()
+        raise
+
+# fields of the structured feedback returned by the LLM
+FEEDBACK_FIELDS: tuple[str, ...] = (
+    "encouragement",
+    "positive_point",
+    "main_feedback",
+    "secondary_feedback",
+    "summary",
+    "Rolling_Summary",
+)
+
+
+# Everything the feedback needs from the frames of a workout, in one scan of its rows.
+# The rows before frame_start (the user setting up) are ignored.
+ANALYSIS_QUERY: str = """
+WITH frames AS (
+    SELECT frame, timestamp, rep_count, form_issues, angles_data
+    FROM workout_analysis
+    WHERE workout_id = $workout_id AND frame >= $frame_start
+),
+reps AS (
+    SELECT rep_count + 1 AS repetitions, min(frame) AS start_frame, max(frame) AS end_frame,
+        round(epoch(max(timestamp) - min(timestamp)), 1) AS duration
+    FROM frames
+    GROUP BY rep_count
+    HAVING rep_count + 1 <= $rep_goal
+),
+issues AS (
+    SELECT form_issues, count(*) AS count, list(frame ORDER BY frame) AS frames
+    FROM frames
+    GROUP BY form_issues
+),
+worst AS (
+    SELECT rep_count + 1 AS repetitions, count(*) AS count
+    FROM frames
+    WHERE NOT starts_with(form_issues, 'Good form')
+    GROUP BY repetitions
+    ORDER BY count DESC, repetitions
+    LIMIT 3
+),
+angles AS (
+    SELECT element.name AS name, element.value AS value,
+        element.joint_indices AS joint_indices, NOT starts_with(form_issues, 'Good form') AS has_issue
+    FROM frames, unnest(angles_data) AS t(element)
+),
+angle_stats AS (
+    SELECT name, count(value) AS count,
+        round(avg(value), 2) AS mean, round(stddev_samp(value), 2) AS std,
+        round(min(value), 2) AS min, round(max(value), 2) AS max,
+        quantile_cont(value, [0.25, 0.5, 0.75]) AS quartiles,
+        round(avg(value) FILTER (WHERE has_issue), 2) AS mean_with_issues,
+        any_value(joint_indices) AS joint_indices
+    FROM angles
+    GROUP BY name
+)
+SELECT
+    (SELECT max(rep_count) FROM frames) AS total_repetitions,
+    (SELECT round(avg(duration), 2) FROM reps) AS average_time_repetitions,
+    (SELECT list((repetitions, start_frame, end_frame, duration) ORDER BY repetitions) FROM reps) AS frames_reps,
+    (SELECT list({'form_issues': form_issues, 'count': count, 'frames': frames} ORDER BY count DESC) FROM issues) AS form_issues,
+    (SELECT list({'repetitions': repetitions, 'count': count} ORDER BY count DESC, repetitions) FROM worst) AS worst_reps,
+    (
+        SELECT list({
+            'name': s.name, 'count': s.count, 'mean': s.mean, 'std': s.std, 'min': s.min,
+            'q25': round(s.quartiles[1], 2), 'median': round(s.quartiles[2], 2),
+            'q75': round(s.quartiles[3], 2), 'max': s.max, 'mean_with_issues': s.mean_with_issues,
+            'joints': list_transform(s.joint_indices, i -> coalesce(w.ldmrks_of_interest[i], i::VARCHAR))
+        } ORDER BY s.name)
+        FROM angle_stats s, workout w
+        WHERE w.id = $workout_id
+    ) AS angle_stats
+"""
+
+
+def create_llm(model: str = "gemini-2.0-flash") -> Any:
+    """
+    Gemini chat client. The app creates one for the whole process during its warm-up and
+    shares it between the sessions, the client library is only imported here.
+    """
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    load_dotenv()
+    google_key = os.environ.get("GOOGLE_API_KEY")
+    return ChatGoogleGenerativeAI(model=model, google_api_key=google_key)
 
 
 class FeedbackAgent:
-    def __init__(
-        self, db_conn: duckdb.DuckDBPyConnection, model: str = "gemini-2.0-flash"
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        db_conn: duckdb.DuckDBPyConnection,
+        model: str = "gemini-2.0-flash",
+        session_id: str | None = None,
+        *,
+        cache: FeedbackCache | None = None,
+        token_budget: int | None = None,
+        llm: Any = None,
     ):
 
         self.model: str = model
         self.db_conn: duckdb.DuckDBPyConnection = db_conn
+        # the store is shared by all the sessions, only look at this session's workouts
+        self.session_id: str | None = session_id
+        # feedback of similar sets, shared by the sessions, a hit skips the LLM
+        self.cache: FeedbackCache | None = cache
+        self.cache_key: str | None = None
+        # the set statistics are compacted until the prompt fits, no limit when None
+        self.token_budget: int | None = token_budget
+        self.prompt_level: int = 0
+        self.token_usage: TokenUsageRecorder | None = None
 
         # dataset
         self.id_used: int = 0
@@ -24,50 +162,62 @@ class FeedbackAgent:
         self.metadata: pd.Series = pd.Series()
         self.workout_analysis: dict = {}
         self.landmarks: dict = {}
-        self.previous_rolling_summary:str = "No previous sets in this session."
+        self.previous_rolling_summary:str = NO_ROLLING_SUMMARY
 
-        # Initialize the LLM model
-        load_dotenv()
-        google_key = os.environ.get("GOOGLE_API_KEY")
-        self.llm = ChatGoogleGenerativeAI(model=self.model, google_api_key=google_key)
+        # Initialize the LLM model, unless a shared client is given. Without a client
+        # (no credentials) the rule-based feedback is served instead.
+        self.llm = llm
+        if self.llm is None:
+            try:
+                self.llm = create_llm(self.model)
+            except Exception as e:
+                logger.warning("No LLM client, rule-based feedback only: %s", e)
 
     def update_rolling_summary(self,summary:str)->None:
         self.previous_rolling_summary = summary
 
-    def get_id_frame(self) -> dict[str, int] | None:
+    # The results are always fetched whole: a partly fetched result keeps a transaction
+    # open on the session cursor, and DuckDB then refuses to delete archived workouts
+    # (modules.archive) that this transaction can still see.
+    def get_id_frame(self, workout_id: int | None = None) -> dict[str, int] | None:
         try:
-            query_id: str = "Select max(id) from workout"
-            res_id: tuple | None = self.db_conn.sql(query_id).fetchone()
-            if res_id is None:
-                raise ValueError("No id found in database.")
-            workout_id: int = res_id[0]
+            if workout_id is None:
+                # last workout of the session
+                res_id: list[tuple] = self.db_conn.sql(
+                    "Select max(id) from workout where session_id is not distinct from ?",
+                    params=[self.session_id],
+                ).fetchall()
+                if not res_id or res_id[0][0] is None:
+                    raise ValueError("No id found in database.")
+                workout_id = res_id[0][0]
             # get the first good form and backtrack 10 frames as the start frame (the idea is to avoid analysing the frames when user is setting up)
-            strat_frame_query: str = (
-                f" SELECT  frame from workout_analysis  where workout_id ={workout_id} and SUBSTRING(form_issues,1,4)= 'Good' order by frame"
-            )
-            res_start_frame: tuple | None = self.db_conn.sql(
-                strat_frame_query
-            ).fetchone()
-            if res_start_frame is None:
+            res_start_frame: list[tuple] = self.db_conn.sql(
+                "SELECT frame FROM workout_analysis WHERE workout_id = ? "
+                "AND starts_with(form_issues, 'Good form') ORDER BY frame LIMIT 1",
+                params=[workout_id],
+            ).fetchall()
+            if not res_start_frame:
                 raise ValueError("No analysis data found for the last workout.")
-            frame_start: int = res_start_frame[0] - 10
+            frame_start: int = res_start_frame[0][0] - 10
         except Exception as e:
-            print(f"Error retrieving data: {e}")
+            logger.error("Error retrieving data: %s", e)
             return None
         return {"id": workout_id, "frame_start": frame_start}
 
     def extract_metadata(self) -> pd.Series:
         try:
             metadata: pd.DataFrame = self.db_conn.sql(
-                f"SELECT * FROM workout where id = {self.id_used}"
+                "SELECT * FROM workout WHERE id = ?", params=[self.id_used]
             ).df()
             if metadata is None:
                 raise ValueError("No metadata found for the last workout.")
-            end_time_query = f"SELECT max(timestamp) FROM workout_analysis where workout_id = {self.id_used}"
-            end_time: tuple | None = self.db_conn.sql(end_time_query).fetchone()
-            if end_time is None:
+            end_time: list[tuple] = self.db_conn.sql(
+                "SELECT max(timestamp) FROM workout_analysis WHERE workout_id = ?",
+                params=[self.id_used],
+            ).fetchall()
+            if not end_time:
                 raise ValueError("No end time found for the last workout.")
-            end_time = end_time[0]
+            end_time = end_time[0][0]
             metadata["end_time"] = end_time
             metadata["duration"] = metadata.apply(
                 lambda x: round(
@@ -76,126 +226,74 @@ class FeedbackAgent:
                 axis=1,
             )
         except Exception as e:
-            print(f"Error retrieving metadata: {e}")
+            logger.error("Error retrieving metadata: %s", e)
             return pd.Series()
 
         return metadata.iloc[0]
 
     def extract_analysis(self) -> dict[str, Any]:
+        """Summarise the frames of the workout in one pass of ANALYSIS_QUERY."""
         try:
-            # get total number of reps
-            tot_reps_query: str = (
-                f"select max(rep_count) from workout_analysis where workout_id = {self.id_used} and frame >= {self.frame_start}"
-            )
-            total_reps_res: tuple | None = self.db_conn.sql(tot_reps_query).fetchone()
-            if total_reps_res is None:
+            rows: list[tuple] = self.db_conn.execute(
+                ANALYSIS_QUERY,
+                {
+                    "workout_id": int(self.id_used),
+                    "frame_start": int(self.frame_start),
+                    "rep_goal": int(self.metadata.get("rep_goal", 0)),
+                },
+            ).fetchall()
+            if not rows or rows[0][0] is None:
                 raise ValueError("No analysis data found for current workout")
-            total_reps: int = total_reps_res[0]
-
-            # duration of each repetitons
-            frames_rep_query: str = f"""select min(frame) as start_frame,max(frame) as end_frame,rep_count+1 as repetitions, round(epoch(max(timestamp) - min(timestamp)),1) as duration ,
-                        from workout_analysis where workout_id = {self.id_used} and frame>= {self.frame_start} and repetitions <= {self.metadata['rep_goal']} group by rep_count"""
-            frames_rep: pd.DataFrame = self.db_conn.sql(frames_rep_query).df()
-
-            # average time rep
-            avg_duration: float = round(frames_rep["duration"].mean(), 2)
-
-            # form issues
-            form_issues_query: str = (
-                f"""SELECT form_issues, count(*) as count FROM workout_analysis WHERE workout_id = {self.id_used} AND frame >= {self.frame_start} GROUP BY form_issues"""
-            )
-            form_issues: list = self.db_conn.sql(form_issues_query).fetchall()
-
-            frames_issues_quesry: str = (
-                f"""SELECT  form_issues, LIST(frame) FROM workout_analysis WHERE workout_id = {self.id_used} AND frame >= {self.frame_start} and form_issues not like 'Good form' group by form_issues  """
-            )
-            frames_w_issues: list = self.db_conn.sql(frames_issues_quesry).fetchall()
-
-            worst_reps_query: str = f"""SELECT rep_count+1 as repetitions, count(form_issues) as count
-            FROM workout_analysis 
-            WHERE workout_id = {self.id_used} AND frame >= {self.frame_start} and 
-            form_issues not like 'Good form'
-            GROUP BY repetitions
-            ORDER BY count DESC
-            LIMIT 3"""
-            worst_reps: list = self.db_conn.sql(worst_reps_query).fetchall()
-
-            # exctract angles data
-            dif_angles_query: str = (
-                """ select list(distinct(angle_element.name)) as angle_names FROM workout_analysis, UNNEST(angles_data) as t(angle_element)"""
-            )
-            diff_names_ang_res: tuple | None = self.db_conn.sql(
-                dif_angles_query
-            ).fetchone()
-            if diff_names_ang_res is None:
-                raise ValueError("Error exctracting names of angles")
-            different_names: list = diff_names_ang_res[0]
-
-            cases: list[str] = [
-                f"""MAX(case WHEN element.name ='{name}' THEN round(element.value,2) end) as {name}_angle,
-            MAX(case WHEN element.name ='{name}' THEN element.joint_indices end) as {name}_indices
-            """
-                for name in different_names
-            ]
-            angles_query: str = f"""select frame, {','.join(cases)} from workout_analysis, unnest(angles_data) as t(element) where workout_id = {self.id_used} AND frame >= {self.frame_start}
-            and form_issues not like 'Good form' group by frame"""
-            angles_df: pd.DataFrame = self.db_conn.sql(angles_query).df()
-
-            index_to_name_map: dict = {
-                v: k for k, v in self.metadata["ldmrks_of_interest"].items()
-            }  # to be removed
-
-            # Define the list of columns to transform
-            indices_col: list = [f"{name}_indices" for name in different_names]
-
-            transformed_cols = {
-                col: angles_df[col].apply(
-                    lambda idx_list: [index_to_name_map.get(k) for k in idx_list]
-                )
-                for col in indices_col
-            }
-
-            angles_final = angles_df.assign(**transformed_cols)
-
-            all_angles_query: str = f"""select frame, {','.join(cases)} from workout_analysis, unnest(angles_data) as t(element) where workout_id = {self.id_used} AND frame >= {self.frame_start}
-            group by frame"""
-            angles_desc = self.db_conn.sql(all_angles_query).df().describe()
-
+            (
+                total_reps,
+                avg_duration,
+                frames_rep,
+                form_issues,
+                worst_reps,
+                angle_stats,
+            ) = rows[0]
         except Exception as e:
-            print(f"Error extracting analysis data: {e}")
+            logger.error("Error extracting analysis data: %s", e)
             return {}
         extracted_data = {
             "total_repetitions": total_reps,
-            "average_time_repetitions": avg_duration,
-            "form_issues": form_issues,
-            "frames_with_issues": frames_w_issues,
-            "worst_reps": worst_reps,
-            "frames_reps": frames_rep,
-            "angles_data": angles_final,
-            "angles_desc_stats": angles_desc,
+            "average_time_repetitions": avg_duration if avg_duration is not None else 0,
+            "form_issues": [(issue["form_issues"], issue["count"]) for issue in form_issues],
+            "frames_with_issues": [
+                (issue["form_issues"], issue["frames"])
+                for issue in form_issues
+                if not issue["form_issues"].startswith("Good form")
+            ],
+            "worst_reps": [(rep["repetitions"], rep["count"]) for rep in worst_reps],
+            "frames_reps": frames_rep or [],
+            "angles_desc_stats": angle_stats or [],
         }
         return extracted_data
 
+    @staticmethod
+    def format_angle_stats(angle_stats: list[dict[str, Any]]) -> str:
+        """One line of descriptive statistics (degrees) per angle, for the prompt."""
+        return format_angle_stats(angle_stats)
+
     def extract_raw_landmarks(self) -> dict[str, pd.DataFrame]:
         try:
-            # get raw landmarks only for landmarks of interest
-            index_to_name_map: dict = {
-                v: k for k, v in self.metadata["ldmrks_of_interest"].items()
-            }  # to be removed
-            ofinterest_keys = ""
+            # get raw landmarks only for landmarks of interest (map of index -> name)
             ofinterest_keys = ",".join(
                 [
                     f""" round(landmark_{k}_x,2) as {v}_x, round(landmark_{k}_y,2) as {v}_y"""
-                    for k, v in index_to_name_map.items()
+                    for k, v in self.metadata["ldmrks_of_interest"].items()
                 ]
             )
+            # the columns are built from the landmark indices, the values are parameters
             of_interest_query: str = (
-                f""" select frame, {ofinterest_keys} from raw_landmarks where frame >= {self.frame_start} and workout_id == {self.id_used}"""
+                f""" select frame, {ofinterest_keys} from raw_landmarks where frame >= ? and workout_id = ?"""
             )
-            raw_of_int: pd.DataFrame = self.db_conn.sql(of_interest_query).df()
+            raw_of_int: pd.DataFrame = self.db_conn.sql(
+                of_interest_query, params=[self.frame_start, self.id_used]
+            ).df()
             of_int_desc: pd.DataFrame = raw_of_int.describe()
         except Exception as e:
-            print(f"Error extracting analysis data: {e}")
+            logger.error("Error extracting analysis data: %s", e)
             return {}
         output = {"raw_of_interest": raw_of_int, "of_interest_desc": of_int_desc}
         return output
@@ -228,8 +326,12 @@ class FeedbackAgent:
             )
         response_schemas = [encouragement,positive_point,main_feedback,second_feedback,summ,rolling_summary]
 
-        output_parser = StructuredOutputParser.from_response_schemas(response_schemas)
-        format_instructions = output_parser.get_format_instructions()
+        # the schemas describe the expected JSON to the model, the JSON parser also
+        # parses the partial objects while the answer is streamed
+        format_instructions = StructuredOutputParser.from_response_schemas(
+            response_schemas
+        ).get_format_instructions()
+        output_parser = JsonOutputParser()
 
         system_prompt = """
         You are an expert, data-driven fitness coach. Your tone should be encouraging, clear, and direct. Make sure anyone can understand you, avoid using technical terms.
@@ -267,89 +369,231 @@ class FeedbackAgent:
 
         prompt = ChatPromptTemplate.from_messages(
             [
-                ("system", system_prompt),
-                ("human", user_prompt),
+                ("system", textwrap.dedent(system_prompt)),
+                ("human", textwrap.dedent(user_prompt)),
             ]
         )
 
         return prompt, output_parser, format_instructions
 
-    def format_feedback(self, feedback: dict) -> str:
+    def format_feedback(self, feedback: dict, local: bool = False) -> str:
         now = datetime.now()
+        generated = (
+            "was generated from your set statistics while the detailed analysis is on its way"
+            if local
+            else "was generated using artificial intelligence"
+        )
         formatted = f"""
         <div class=\"feedback-details\">
             <p>💪 {feedback["encouragement"]}</p>
             <p>🔥 {feedback['positive_point']}</p>
             <p>🏋️ {feedback["summary"]} </p>
             <p>🔎 {feedback["main_feedback"]} {feedback["secondary_feedback"]}</p>
-            <small> Disclaimer: Analysis generated on {now}. This analysis was generated using artificial intelligence and can contain errors.</small>
+            <small> Disclaimer: Analysis generated on {now}. This analysis {generated} and can contain errors.</small>
             </div>
             <hr> 
             """
         return formatted
 
-    def agent_pipeline(self) -> Dict[str, Any]:
-        """Main pipeline to extract data, generate feedback and format it"""
-
-        id_frame = self.get_id_frame()
-        if id_frame is None:
-            raise ValueError("no data")
-        self.id_used = id_frame["id"]
-        self.frame_start = id_frame["frame_start"]
-
-        self.metadata = self.extract_metadata()
-        self.workout_analysis = self.extract_analysis()
-
+    def prepare_pipeline(self, workout_id: int | None = None) -> tuple[Any, dict[str, Any]]:
+        """Extract the data of the workout and build the LLM chain and its inputs.
+        Uses the given workout, or the last workout of the session. The chain is None
+        without an LLM client."""
+        with METRICS.timer("sql_extract"):
+            id_frame = self.get_id_frame(workout_id)
+            if id_frame is None:
+                raise ValueError("no data")
+            self.id_used = id_frame["id"]
+            self.frame_start = id_frame["frame_start"]
+
+            self.metadata = self.extract_metadata()
+            self.workout_analysis = self.extract_analysis()
+        if self.cache is not None:
+            self.cache_key = feedback_fingerprint(self.metadata, self.workout_analysis)
 
         prompt_template, output_parser, format_instructions = self.create_prompt()
-        print(prompt_template)
-        chain = prompt_template | self.llm | output_parser
+        logger.debug("prompt: %s", prompt_template)
+        chain = None if self.llm is None else prompt_template | self.llm | output_parser
+
+        logger.debug("rolling summary to be used: %s", self.previous_rolling_summary)
+        # compact the set statistics until the prompt fits the token budget
+        for level in range(COMPACTION_LEVELS):
+            inputs = compact_inputs(
+                self.metadata, self.workout_analysis, self.previous_rolling_summary, level
+            )
+            inputs["format_instructions"] = format_instructions
+            prompt_tokens = estimate_tokens(prompt_template.format(**inputs))
+            if self.token_budget is None or prompt_tokens <= self.token_budget:
+                break
+        else:
+            logger.warning(
+                "Prompt of %s tokens over the budget of %s tokens",
+                prompt_tokens,
+                self.token_budget,
+            )
+        self.prompt_level = level
+        self.token_usage = TokenUsageRecorder(prompt_tokens)
+        logger.debug("prompt of %s tokens (compaction level %s)", prompt_tokens, level)
+        return chain, inputs
+
+    def finalize_feedback(self, feedback: Any, local: bool = False) -> Dict[str, Any]:
+        """Check the parsed feedback, format it and roll the session summary."""
+        if not isinstance(feedback, dict):
+            raise ValueError("The feedback is not a JSON object.")
+        missing = [field for field in FEEDBACK_FIELDS if field not in feedback]
+        if missing:
+            raise ValueError(f"The feedback is missing the fields {missing}.")
+        feedback["formatted_feedback"] = self.format_feedback(feedback=feedback, local=local)
+        self.update_rolling_summary(summary=feedback["Rolling_Summary"])
+        logger.debug("new rolling summary: %s", self.previous_rolling_summary)
+        return feedback
 
-        # Format the extracted data for the prompt
-        form_issues_summary = ", ".join(
-            [
-                f"{issue[0]} ({issue[1]} times)"
-                for issue in self.workout_analysis["form_issues"]
-                if issue[0] != "Good form"
-            ]
+    def cached_feedback(self) -> Dict[str, Any] | None:
+        """
+        Feedback given to a similar set, None on a cache miss.
+        The cached rolling summary belongs to another session, it is rebuilt from the
+        summary of this session and the current set instead.
+        """
+        if self.cache is None or self.cache_key is None:
+            return None
+        feedback = self.cache.get(self.cache_key)
+        if feedback is None:
+            return None
+        feedback["Rolling_Summary"] = roll_summary(
+            self.previous_rolling_summary, self.metadata, self.workout_analysis
         )
-        worst_reps_summary = ", ".join(
-            [
-                f"Rep {rep[0]} ({rep[1]} issues)"
-                for rep in self.workout_analysis["worst_reps"]
-            ]
+        return feedback
+
+    def local_feedback(self) -> Dict[str, Any]:
+        """Rule-based feedback of the prepared set, computed without the LLM."""
+        return local_feedback(
+            self.metadata, self.workout_analysis, self.previous_rolling_summary
         )
-        print(f"rolling summary to be used: {self.previous_rolling_summary}")
-        # Invoke the chain with the necessary data
-        feedback = chain.invoke(
-            {
-                "rep_goal": self.metadata.get("rep_goal", "N/A"),
-                "workout_name": self.metadata.get("workout_name", "N/A"),
-                "strictness_crit": self.metadata.get("strictness_crit", "N/A"),
-                "strictness_definition": self.metadata.get(
-                    "strictness_definition", "N/A"
-                ),
-                "series_number":self.metadata.get("series_number",'N/A"'),
-                "total_repetitions": self.workout_analysis.get("total_repetitions", 0),
-                "duration": self.metadata.get("duration", 0),
-                "average_time_repetitions": self.workout_analysis.get(
-                    "average_time_repetitions", 0
-                ),
-                "form_issues": form_issues_summary,
-                "worst_reps": worst_reps_summary,
-                "angle_stats": self.workout_analysis.get(
-                    "angles_desc_stats", pd.DataFrame()
-                ).to_string(),
-                "format_instructions": format_instructions,
-                "rolling_summary":self.previous_rolling_summary
-            }
+
+    def cache_feedback(self, feedback: Dict[str, Any]) -> None:
+        """Store the LLM feedback of the current set, without its session-specific fields."""
+        if self.cache is None or self.cache_key is None:
+            return
+        self.cache.put(
+            self.cache_key,
+            {field: feedback[field] for field in FEEDBACK_FIELDS if field != "Rolling_Summary"},
         )
-        formatted_feedback = self.format_feedback(feedback=feedback)
-        feedback["formatted_feedback"] = formatted_feedback
-        self.update_rolling_summary(summary = feedback["Rolling_Summary"])
-        print(f"new rolling summary: {self.previous_rolling_summary}")
+
+    def agent_pipeline(self, workout_id: int | None = None) -> Dict[str, Any]:
+        """Main pipeline to extract data, generate feedback and format it.
+        Uses the given workout, or the last workout of the session."""
+        chain, inputs = self.prepare_pipeline(workout_id)
+        cached = self.cached_feedback()
+        if cached is not None:
+            return self.finalize_feedback(cached)
+        if chain is None:
+            raise RuntimeError("No LLM client.")
+        with METRICS.timer("llm"):
+            feedback = chain.invoke(inputs, config={"callbacks": [self.token_usage]})
+        feedback = self.finalize_feedback(feedback)
+        self.cache_feedback(feedback)
         return feedback
 
+    async def astream_pipeline(
+        self, workout_id: int | None = None
+    ) -> AsyncIterator[tuple[str, Dict[str, Any]]]:
+        """
+        Streaming version of agent_pipeline.
+        The SQL extraction runs in a thread, the LLM call is awaited on the event loop
+        without holding a thread during the network wait.
+        Yields:
+            tuple[str, Dict[str, Any]]: ("partial", fields parsed so far) every time the
+            streamed JSON grows, then ("final", feedback) with the formatted feedback.
+            On a cache hit only the final feedback is yielded.
+        """
+        chain, inputs = await _to_thread_to_completion(self.prepare_pipeline, workout_id)
+        async for event in self.astream_feedback(chain, inputs):
+            yield event
+
+    async def astream_feedback(
+        self, chain: Any, inputs: dict[str, Any]
+    ) -> AsyncIterator[tuple[str, Dict[str, Any]]]:
+        """Stream the feedback of the prepared set, from the cache or the LLM."""
+        cached = self.cached_feedback()
+        if cached is not None:
+            yield "final", self.finalize_feedback(cached)
+            return
+        if chain is None:
+            raise RuntimeError("No LLM client.")
+        start = time.perf_counter()
+        feedback: Any = None
+        async for partial in chain.astream(inputs, config={"callbacks": [self.token_usage]}):
+            if not isinstance(partial, dict) or not partial:
+                continue
+            if feedback is None:
+                METRICS.observe("llm_first_token", time.perf_counter() - start)
+            feedback = partial
+            yield "partial", {
+                field: partial[field] for field in FEEDBACK_FIELDS if field in partial
+            }
+        METRICS.observe("llm", time.perf_counter() - start)
+        feedback = self.finalize_feedback(feedback)
+        # the cache may write its file
+        await _to_thread_to_completion(self.cache_feedback, feedback)
+        yield "final", feedback
+
+    async def ahedged_pipeline(
+        self, workout_id: int | None = None, budget: float = 3.0
+    ) -> AsyncIterator[tuple[str, Dict[str, Any]]]:
+        """
+        astream_pipeline within a latency budget.
+        When the LLM has not answered budget seconds after the data is extracted, or
+        fails, the rule-based feedback is served instead, and the LLM feedback still
+        replaces it if it arrives later.
+        Yields:
+            tuple[str, Dict[str, Any]]: ("partial", fields) while the LLM answers within
+            the budget, ("local", feedback) if the budget is exceeded or the LLM fails,
+            ("final", feedback) once the LLM feedback is complete.
+        """
+        chain, inputs = await _to_thread_to_completion(self.prepare_pipeline, workout_id)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + budget
+        stream = self.astream_feedback(chain, inputs)
+        pending: asyncio.Future | None = None
+        served_local = False
+        try:
+            while True:
+                if pending is None:
+                    pending = asyncio.ensure_future(anext(stream))
+                timeout = None if served_local else max(deadline - loop.time(), 0)
+                done, _ = await asyncio.wait({pending}, timeout=timeout)
+                if not done:
+                    # the LLM keeps streaming, its feedback will replace this one
+                    METRICS.inc("feedback_local")
+                    served_local = True
+                    yield "local", self.finalize_feedback(self.local_feedback(), local=True)
+                    continue
+                try:
+                    kind, feedback = pending.result()
+                except StopAsyncIteration:
+                    return
+                except Exception as e:
+                    if served_local:
+                        logger.warning("The LLM feedback failed after the local one: %s", e)
+                    else:
+                        logger.warning("The LLM feedback failed, serving the local one: %s", e)
+                        METRICS.inc("feedback_local")
+                        yield "local", self.finalize_feedback(self.local_feedback(), local=True)
+                    return
+                pending = None
+                # the partial fields would overwrite the local feedback
+                if kind == "partial" and served_local:
+                    continue
+                yield kind, feedback
+                if kind == "final":
+                    return
+        finally:
+            if pending is not None and not pending.done():
+                pending.cancel()
+                # the stream can only be closed once the cancelled step is over
+                await asyncio.wait({pending})
+            await stream.aclose()
+
 
 if __name__ == "__main__":
     # Load environment variables
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Mapping
+from modules.local_feedback import issue_counts
+from modules.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# quantization steps of the fingerprint
+ISSUE_SHARE_STEP: float = 0.1  # share of the frames with an issue
+ANGLE_STEP: float = 5.0  # degrees
+REP_TIME_STEP: float = 0.5  # seconds
+
+
+def _quantize(value: Any, step: float) -> float | None:
+    if value is None:
+        return None
+    return round(round(float(value) / step) * step, 3)
+
+
+def feedback_fingerprint(metadata: Mapping[str, Any], analysis: Mapping[str, Any]) -> str:
+    """
+    Content address of the feedback of a set.
+    Sets with the same workout, goal, strictness and rep count, and with issue shares,
+    angle statistics and rep time equal once quantized, share the same fingerprint and
+    get the same feedback. Whether it is the first set of the session is part of the key,
+    its number and the rolling summary of the session are not.
+    Args:
+        metadata (Mapping[str, Any]): the workout metadata (FeedbackAgent.metadata).
+        analysis (Mapping[str, Any]): the extracted analysis (FeedbackAgent.extract_analysis).
+    Returns:
+        str: hex digest of the canonical fingerprint.
+    """
+    form_issues = analysis.get("form_issues", [])
+    total_frames = sum(count for _, count in form_issues) or 1
+    canonical = {
+        "workout": str(metadata.get("workout_name", "")).lower(),
+        "rep_goal": int(metadata.get("rep_goal", 0) or 0),
+        "strictness": str(metadata.get("strictness_crit", "")).lower(),
+        "deviation": _quantize(metadata.get("strictness_definition"), 1.0),
+        "first_set": int(metadata.get("series_number", 1) or 1) <= 1,
+        "reps": int(analysis.get("total_repetitions", 0) or 0),
+        "rep_time": _quantize(analysis.get("average_time_repetitions"), REP_TIME_STEP),
+        # single issues, without the angles measured on the frames
+        "issues": sorted(
+            (issue, share)
+            for issue, share in (
+                (issue, _quantize(count / total_frames, ISSUE_SHARE_STEP))
+                for issue, count in issue_counts(form_issues).items()
+            )
+            if share
+        ),
+        "angles": sorted(
+            (
+                stats["name"],
+                _quantize(stats.get("mean"), ANGLE_STEP),
+                _quantize(stats.get("min"), ANGLE_STEP),
+                _quantize(stats.get("max"), ANGLE_STEP),
+            )
+            for stats in analysis.get("angles_desc_stats", [])
+        ),
+    }
+    encoded = json.dumps(canonical, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+class FeedbackCache:
+    """
+    LRU cache of LLM feedback with a time to live, shared by all the sessions.
+    When a path is given the entries are loaded from and saved to a JSON file, so the
+    cache survives restarts. Hits and misses are counted in the process metrics.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 512,
+        ttl_seconds: float = 7 * 24 * 3600,
+        path: str | None = None,
+    ):
+        self.max_entries: int = max_entries
+        self.ttl_seconds: float = ttl_seconds
+        self.path: str | None = path
+        # key -> (stored at, epoch seconds, feedback)
+        self._entries: OrderedDict[str, tuple[float, dict[str, Any]]] = OrderedDict()
+        self._lock = threading.Lock()
+        # one writer at a time, the last snapshot taken is the last one written
+        self._save_lock = threading.Lock()
+        if path:
+            self.load()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        """Return a copy of the cached feedback, None if it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        METRICS.inc("feedback_cache_hits" if entry is not None else "feedback_cache_misses")
+        return None if entry is None else dict(entry[1])
+
+    def put(self, key: str, feedback: dict[str, Any]) -> None:
+        """Store feedback, evicting the least recently used entries beyond max_entries."""
+        with self._lock:
+            self._entries[key] = (time.time(), dict(feedback))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        if self.path:
+            self.save()
+
+    def load(self) -> None:
+        """Load the entries saved at path, the expired ones are dropped."""
+        now = time.time()
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                saved = json.load(f)
+            entries = [
+                (key, float(stored_at), dict(feedback))
+                for key, stored_at, feedback in saved[-self.max_entries :]
+                if now - float(stored_at) <= self.ttl_seconds
+            ]
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning("Cannot load the feedback cache %s: %s", self.path, e)
+            return
+        with self._lock:
+            for key, stored_at, feedback in entries:
+                self._entries[key] = (stored_at, feedback)
+
+    def save(self) -> None:
+        """Write the entries to path, in LRU order, atomically."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._save_lock:
+            with self._lock:
+                entries = [[key, stored_at, fb] for key, (stored_at, fb) in self._entries.items()]
+            tmp_path = None
+            try:
+                with tempfile.NamedTemporaryFile(
+                    "w", encoding="utf-8", dir=directory or ".", suffix=".tmp", delete=False
+                ) as f:
+                    tmp_path = f.name
+                    json.dump(entries, f)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                logger.warning("Cannot save the feedback cache %s: %s", self.path, e)
+                if tmp_path and os.path.exists(tmp_path):
+                    os.remove(tmp_path)
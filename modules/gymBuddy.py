@@ -1,31 +1,83 @@
+import logging
+import time
 import mediapipe as mp
-import cv2
 from datetime import datetime
 import numpy as np
-from modules.utils import is_left_side
+from modules.utils import is_left_side, LandmarkFrame
 from modules.workouts.pushups import PushUps
 from modules.workouts.squats import Squats
 from typing import Dict, Any
-import json
 from modules.workouts.workoutParent import Workout
+from modules.buffers import FrameBuffer, FrameBatch
+from modules.decode import FrameDecoder
+from modules.metrics import SessionMetrics
+from modules.roi import RoiTracker
 
+logger = logging.getLogger(__name__)
 
 PoseLandmarkerResult = mp.tasks.vision.PoseLandmarkerResult
 
 
+def create_landmarker(
+    model_path: str, live: bool = False, result_callback=None, segmentation: bool = False
+) -> mp.tasks.vision.PoseLandmarker:
+    """
+    Create a mediapipe PoseLandmarker.
+    Args:
+        model_path (str): path to the .task model file.
+        live (bool): LIVE_STREAM running mode (results delivered to result_callback)
+            instead of VIDEO.
+        result_callback: callback receiving the results in LIVE_STREAM mode.
+        segmentation (bool): also compute the segmentation mask of the pose, nothing
+            reads it by default.
+    Returns:
+        mp.tasks.vision.PoseLandmarker: the landmarker.
+    """
+    BaseOptions = mp.tasks.BaseOptions
+    PoseLandmarker = mp.tasks.vision.PoseLandmarker
+    PoseLandmarkerOptions = mp.tasks.vision.PoseLandmarkerOptions
+    VisionRunningMode = mp.tasks.vision.RunningMode
+    if live:
+        run_mode = VisionRunningMode.LIVE_STREAM
+    else:
+        run_mode = VisionRunningMode.VIDEO
+        result_callback = None
+    # Create a pose landmarker instance with the video mode:
+    options = PoseLandmarkerOptions(
+        base_options=BaseOptions(model_asset_path=model_path),
+        running_mode=run_mode,
+        output_segmentation_masks=segmentation,
+        result_callback=result_callback,
+    )
+    return PoseLandmarker.create_from_options(options)
+
+
 class GymBuddy:
 
-    def __init__(
+    def __init__(  # pylint: disable=too-many-arguments
         self,
         workout_name: str = "Push-ups",
         strictness_crit: str = "loose",
         input_type: str = "Video",
         model_path: str = "models/pose_landmarker_lite.task",
+        *,
+        session_id: str | None = None,
+        user_id: str | None = None,
+        load_model: bool = True,
+        model: Any = None,
+        roi_tracking: bool = True,
     ):
-        # set up the model
+        # identifiers stored with the workouts of the session
+        self.session_id: str | None = session_id
+        self.user_id: str | None = user_id
+
+        # set up the model: a landmarker leased from a LandmarkerPool, none when the
+        # inference runs in an InferencePool, else loaded for this session
         self.input_type: str = input_type
         self.model_path: str = model_path
-        self.model = self.create_model()
+        if model is None and load_model:
+            model = self.create_model()
+        self.model = model
 
         # set up the camera
         self.frame_timestamp: float = 0
@@ -41,6 +93,10 @@ class GymBuddy:
         self.left_side: bool = False
         self.POSE_LANDMARK_RESULT = None
         self.count_rep: int = 0
+        # landmarks of the last analysed frame, and whether the analysis data carries
+        # them as a list of dicts (JSON protocol) or not (binary protocol)
+        self.last_landmarks: LandmarkFrame | None = None
+        self.landmark_dicts: bool = True
 
         # set current workout
         self.current_workout: Workout = self.create_workout(self.workout_name)
@@ -50,8 +106,16 @@ class GymBuddy:
 
         # Initialize buffers for logging and database
         self.workout_db_buffer: Dict[str, Any] = {}
-        self.wo_analysis_buffer: list[Dict[str, Any]] = []
-        self.raw_landmarks_buffer: list[Dict[str, Any]] = []
+        self.frame_buffer: FrameBuffer = FrameBuffer()
+
+        # decodes the frames sent by the client to RGB, configured by an "encoding" message
+        self.decoder: FrameDecoder = FrameDecoder()
+
+        # per-stage timers of the session, also recorded process-wide
+        self.metrics: SessionMetrics = SessionMetrics(session_id)
+
+        # crops the frames to the person before the inference, whole frames when None
+        self.roi_tracker: RoiTracker | None = RoiTracker() if roi_tracking else None
 
     def create_workout(self, workout_name: str) -> Workout:
         workouts = {"push-ups": PushUps, "abs": None, "squats": Squats}
@@ -64,13 +128,12 @@ class GymBuddy:
 
     def set_workout(self, workout_name: str):
         self.workout_name = workout_name
-        print(f"Workout set to: {self.workout_name}")
         self.current_workout = self.create_workout(self.workout_name)
-        print(f"Current workout: {self.current_workout}")
+        logger.info("Workout set to: %s", self.workout_name)
 
     def set_reps(self, reps: int):
         self.goal_reps = reps
-        print(f"Reps set to: {self.goal_reps}")
+        logger.info("Reps set to: %s", self.goal_reps)
 
     def set_strictness(self, strictness: str) -> None:
         self.strictness = strictness.lower()
@@ -79,104 +142,128 @@ class GymBuddy:
         self.series_number = series_number
 
     def create_model(self):
-        BaseOptions = mp.tasks.BaseOptions
-        PoseLandmarker = mp.tasks.vision.PoseLandmarker
-        PoseLandmarkerOptions = mp.tasks.vision.PoseLandmarkerOptions
-        VisionRunningMode = mp.tasks.vision.RunningMode
-        callback = None
-        if self.input_type.lower() == "live":
-            run_mode = VisionRunningMode.LIVE_STREAM
-            callback = self.print_result
-        else:
-            run_mode = VisionRunningMode.VIDEO
-        # Create a pose landmarker instance with the video mode:
-        options = PoseLandmarkerOptions(
-            base_options=BaseOptions(model_asset_path=self.model_path),
-            running_mode=run_mode,
-            output_segmentation_masks=True,
-            result_callback=callback,
+        return create_landmarker(
+            self.model_path,
+            live=self.input_type.lower() == "live",
+            result_callback=self.print_result,
         )
-        PoseLandmarker = PoseLandmarker.create_from_options(options)
-        return PoseLandmarker
 
-    def print_result(self, result) -> None:
+    def print_result(self, result, _output_image=None, _timestamp_ms=None) -> None:
+        # LIVE_STREAM callback, the pipelined version is modules.live_inference
         self.POSE_LANDMARK_RESULT = result
 
     def process_frame_from_bytes(self, frame_bytes):
-        """Process frame data received from frontend"""
+        """Decode the frame data received from frontend into an RGB image"""
         try:
-            # Convert bytes to numpy array
-            nparr = np.frombuffer(frame_bytes, np.uint8)
-            # Decode image
-            frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            return frame
+            with self.metrics.timer("decode"):
+                return self.decoder.decode(frame_bytes)
         except Exception as e:
-            print(f"Error processing frame from bytes: {e}")
+            logger.warning("Error processing frame from bytes: %s", e)
             return None
 
+    def next_timestamp(self, fps: int = 30) -> int:
+        """Advance and return the timestamp (ms) of the next frame given to the model."""
+        self.frame_timestamp += int(1000 / fps)  # Increment timestamp by frame duration
+        return self.frame_timestamp
+
     # @pyinstrument.profile()
     def detect_from_frame(self, frame) -> dict:
         """Process a single frame for exercise detection"""
         if frame is None:
             return {}
-        print(f"workout name: {self.workout_name}")
-        print(f"current workout: {self.current_workout}")
-        print(f"strictness: {self.strictness}")
-        fps = 30
+        return self.analyze_landmarks(self.run_inference(frame))
 
-        frame = frame.copy()
-        height, width, _ = frame.shape
+    def crop_frame(self, frame: np.ndarray) -> tuple[np.ndarray, tuple[int, int, int, int] | None]:
+        """Crop a frame to the region of the last pose, see RoiTracker.crop."""
+        if self.roi_tracker is None:
+            return frame, None
+        return self.roi_tracker.crop(frame)
 
-        print("image shape:", height, width)
-        # frame = cv2.resize(frame, (720, int(720 * height / width))) # Maintain aspect ratio
-
-        mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=frame)
-
-        self.frame_timestamp += int(1000 / fps)  # Increment timestamp by frame duration
+    def track_landmarks(
+        self,
+        landmarks: LandmarkFrame | None,
+        roi: tuple[int, int, int, int] | None,
+        frame_shape: tuple[int, ...],
+    ) -> LandmarkFrame | None:
+        """Map the landmarks of a cropped frame back to the whole frame and follow the pose."""
+        if self.roi_tracker is None:
+            return landmarks
+        landmarks = self.roi_tracker.to_frame(landmarks, roi, frame_shape[0], frame_shape[1])
+        self.roi_tracker.update(landmarks)
+        return landmarks
+
+    def run_inference(self, frame) -> LandmarkFrame | None:
+        """Run the pose model on a frame and return the landmarks of the first pose."""
+        # the decoded frame is already RGB and owned by this session, only a crop is copied
+        crop, roi = self.crop_frame(frame)
+        mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=np.ascontiguousarray(crop))
+
+        timestamp = self.next_timestamp()
 
         # Process the image with the model and detect landmarks
-        if self.input_type.lower() == "live":
-            self.model.detect_async(mp_image, self.frame_timestamp)
-        else:
-            self.POSE_LANDMARK_RESULT = self.model.detect_for_video(
-                mp_image, self.frame_timestamp
+        with self.metrics.timer("inference"):
+            if self.input_type.lower() == "live":
+                self.model.detect_async(mp_image, timestamp)
+            else:
+                self.POSE_LANDMARK_RESULT = self.model.detect_for_video(
+                    mp_image, timestamp
+                )
+
+        landmarks = None
+        if self.POSE_LANDMARK_RESULT and self.POSE_LANDMARK_RESULT.pose_landmarks:
+            # build the array-backed frame once, it is shared by all the analysis steps
+            landmarks = LandmarkFrame.from_landmarks(
+                self.POSE_LANDMARK_RESULT.pose_landmarks[0]
             )
-
+        return self.track_landmarks(landmarks, roi, frame.shape)
+
+    def analyze_landmarks(
+        self, res: LandmarkFrame | None, timestamp_us: int | None = None
+    ) -> dict:
+        """Count reps, check the form and buffer the data of a frame from its landmarks.
+        The frame is timestamped now unless timestamp_us is given (recorded videos)."""
+        start = time.perf_counter()
         # process the results
         # annotated_img = frame
         analysis_data = {
             "landmarks": [],
             "rep_count": self.count_rep,
+            "goal_reps": self.goal_reps,
             "form_ok": True,
             "form_message": "Initializing...",
             "display_angles": [],
             "is_down_phase": self.current_workout.down,
         }
 
-        if self.POSE_LANDMARK_RESULT and self.POSE_LANDMARK_RESULT.pose_landmarks:
+        self.last_landmarks = res
+        if res is not None:
 
             # annotated_img = self.draw_landmarks_on_image(annotated_img)
 
-            res = self.POSE_LANDMARK_RESULT.pose_landmarks
-            analysis_data["landmarks"] = [{"x": lm.x, "y": lm.y} for lm in res[0]]
+            if self.landmark_dicts:
+                analysis_data["landmarks"] = res.to_dicts()
 
             # Determine side on the first frame
             if self.frame_count == 0:
-                self.left_side = is_left_side(res[0])
-                print(f"left side: {self.left_side}")
+                self.left_side = is_left_side(res)
                 # set current workout points to left side
                 self.current_workout.left_side = self.left_side
                 # update the indices of the current workout
                 self.current_workout.update_indices()
-                print(f"left side curr wo {self.current_workout.left_side}")
                 # retrieve the landmarks of interest from the current workout
                 ldmrks_of_interest = self.current_workout.get_indices()
-                print(f"landmarks of interest: {ldmrks_of_interest}")
                 ldmrks_keys = list(ldmrks_of_interest.keys())
                 ldmrks_values = list(ldmrks_of_interest.values())
-                print(f"series_number:{self.series_number}")
+                logger.debug(
+                    "left side: %s, landmarks of interest: %s, series number: %s",
+                    self.left_side,
+                    ldmrks_of_interest,
+                    self.series_number,
+                )
                 # save the workout data to the buffer
                 self.workout_db_buffer = {
+                    "session_id": self.session_id,
+                    "user_id": self.user_id,
                     "workout_name": self.workout_name,
                     "timestamp_start": self.time,
                     "rep_goal": self.goal_reps,
@@ -194,9 +281,6 @@ class GymBuddy:
 
             # Form check
             self.current_workout.form = self.current_workout.get_form()
-            print(f"down: {self.current_workout.down}")
-            print(f"form: {self.current_workout.form}")
-            print(f"fix form: {self.current_workout.fix_form}")
 
             # update analysis data
             analysis_data["rep_count"] = self.count_rep
@@ -205,51 +289,42 @@ class GymBuddy:
             analysis_data["display_angles"] = self.current_workout.get_display_angles()
             analysis_data["is_down_phase"] = self.current_workout.down
 
-            # add the analysis data to the buffer
-            # retrieve angles data from the current workout
-            angles = analysis_data["display_angles"].copy()
-            print(f"angles data: {angles}")
-            for angle in angles:
-                angle["joint_indices"] = list(angle["joint_indices"])
-            angles_json = json.dumps(angles)
-            print(angles_json)
-
-            data_to_buffer = {
-                "frame": self.frame_count,
-                "timestamp": datetime.now(),
-                "rep_count": self.count_rep,
-                "down": self.current_workout.down,
-                "form_issues": self.current_workout.fix_form,
-                "angles_data": angles_json,
-            }
-            self.wo_analysis_buffer.append(data_to_buffer)
-
-            # add landmarks to the landmarks buffer
-            raw_landmarks = {
-                "frame": self.frame_count,
-                "timestamp": datetime.now(),
-                "landmarks": analysis_data["landmarks"],
-            }
-            self.raw_landmarks_buffer.append(raw_landmarks)
+            # add the analysis data and the landmarks to the columnar buffer
+            display_angles = analysis_data["display_angles"]
+            if not self.frame_buffer.angle_names:
+                self.frame_buffer.set_angles(
+                    [angle["name"] for angle in display_angles],
+                    [angle["joint_indices"] for angle in display_angles],
+                )
+            self.frame_buffer.append(
+                frame=self.frame_count,
+                rep_count=self.count_rep,
+                down=self.current_workout.down,
+                form_issues=self.current_workout.fix_form,
+                angles=[angle["value"] for angle in display_angles],
+                landmarks=res.xy,
+                timestamp_us=timestamp_us,
+            )
 
             # increment frame count
             self.frame_count += 1
 
+        self.metrics.observe("rep_logic", time.perf_counter() - start)
         return analysis_data
 
     def get_data_to_save(self) -> Dict[str, Any]:
-        """Get the data to save to the database"""
+        """Get the data to save to the database.
+        The frames are a zero-copy view on the buffer, save them before resetting it."""
+        frames: FrameBatch = self.frame_buffer.view()
         data_to_save = {
             "workout_db_buffer": self.workout_db_buffer.copy(),
-            "wo_analysis_buffer": self.wo_analysis_buffer.copy(),
-            "raw_landmarks_buffer": self.raw_landmarks_buffer.copy(),
+            "frames": frames,
         }
         return data_to_save
 
     def reset_data_buffers(self) -> None:
         """Reset the data buffers after saving"""
         self.workout_db_buffer.clear()
-        self.wo_analysis_buffer.clear()
-        self.raw_landmarks_buffer.clear()
+        self.frame_buffer.clear()
         self.frame_count = 0
-        print("Data buffers reset.")
+        logger.debug("Data buffers reset.")
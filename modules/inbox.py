@@ -0,0 +1,54 @@
+import asyncio
+from collections import deque
+from typing import Any
+from modules.metrics import METRICS
+
+
+class SessionInbox:
+    """
+    Per-session mailbox between the websocket receive path and the processing path.
+    Messages are served in arrival order. A video frame that arrives while the previous
+    frame is still waiting, with no control (text) message in between, replaces it and
+    the superseded frame is counted as dropped. This keeps the processing latency bounded
+    when the inference is slower than the client's rate, while a frame captured before a
+    control message is still analysed under the settings it was captured with.
+    The messages are ASGI websocket messages, as returned by WebSocket.receive.
+    """
+
+    def __init__(self):
+        self._messages: deque = deque()
+        self._event: asyncio.Event = asyncio.Event()
+        self.closed: bool = False
+        self.frames_received: int = 0
+        self.frames_dropped: int = 0
+
+    def put(self, message: dict[str, Any]) -> None:
+        """Add a message received from the websocket."""
+        if message.get("bytes") is not None:
+            self.frames_received += 1
+            METRICS.inc("frames_received")
+            if self._messages and self._messages[-1].get("bytes") is not None:
+                # only a newer frame supersedes a frame
+                self.frames_dropped += 1
+                METRICS.inc("frames_dropped")
+                self._messages.pop()
+        self._messages.append(message)
+        self._event.set()
+
+    def close(self) -> None:
+        """Mark the websocket as disconnected, get returns a disconnect message once drained."""
+        self.closed = True
+        self._event.set()
+
+    async def get(self, timeout: float | None = None) -> dict[str, Any]:
+        """
+        Return the oldest message left to process.
+        Raises asyncio.TimeoutError if nothing arrives within timeout seconds.
+        """
+        while True:
+            if self._messages:
+                return self._messages.popleft()
+            if self.closed:
+                return {"type": "websocket.disconnect", "code": 1000}
+            self._event.clear()
+            await asyncio.wait_for(self._event.wait(), timeout)
@@ -0,0 +1,302 @@
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import threading
+import zlib
+from multiprocessing import shared_memory
+from typing import Any, Callable
+import numpy as np
+from modules.metrics import METRICS
+from modules.utils import LandmarkFrame
+
+logger = logging.getLogger(__name__)
+
+# largest frame a slot can hold (height * width * channels)
+DEFAULT_SLOT_BYTES: int = 1280 * 1280 * 3
+# seconds a detection is waited for, the frame is given up after it
+DETECT_TIMEOUT_SECONDS: float = 5.0
+# seconds between two checks that the worker of a waiting detection is still alive
+LIVENESS_INTERVAL_SECONDS: float = 0.5
+
+
+def _default_landmarker_factory(model_path: str):
+    from modules.gymBuddy import create_landmarker
+
+    return create_landmarker(model_path)
+
+
+def _worker_main(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    shm_name: str,
+    slot_bytes: int,
+    model_path: str,
+    landmarker_factory: Callable[[str], Any],
+    requests: Any,
+    results: Any,
+) -> None:
+    """
+    Inference worker process.
+    Frames are read in place from the worker's shared memory slots. Every session gets
+    its own VIDEO mode landmarker so the timestamps stay monotonic per user; a spare one
+    is kept warm so a new session does not wait for the model to load.
+    """
+    import mediapipe as mp
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    landmarkers: dict[str, Any] = {}
+    spare = landmarker_factory(model_path)
+    try:
+        while True:
+            message = requests.get()
+            if message is None:
+                break
+            if message[0] == "close":
+                landmarker = landmarkers.pop(message[1], None)
+                if landmarker is not None:
+                    landmarker.close()
+                continue
+            _, request_id, session_id, slot, shape, timestamp = message
+            try:
+                landmarker = landmarkers.get(session_id)
+                if landmarker is None:
+                    landmarker = landmarkers[session_id] = spare
+                    spare = landmarker_factory(model_path)
+                image = np.ndarray(
+                    shape, dtype=np.uint8, buffer=shm.buf, offset=slot * slot_bytes
+                )
+                mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=image)
+                result = landmarker.detect_for_video(mp_image, timestamp)
+                landmarks = None
+                if result and result.pose_landmarks:
+                    # a (33, 3) float32 array, a few hundred bytes back to the server
+                    landmarks = LandmarkFrame.from_landmarks(result.pose_landmarks[0]).data
+                results.put((request_id, landmarks, None))
+            except Exception as e:
+                results.put((request_id, None, f"{type(e).__name__}: {e}"))
+    finally:
+        for landmarker in list(landmarkers.values()) + [spare]:
+            landmarker.close()
+        shm.close()
+
+
+class _Worker:
+    """Parent side of an inference worker: its process, request queue and frame slots."""
+
+    def __init__(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        ctx,
+        slots: int,
+        slot_bytes: int,
+        model_path: str,
+        landmarker_factory: Callable[[str], Any],
+        results: Any,
+    ):
+        self.ctx = ctx
+        self.slots: int = slots
+        self.slot_bytes: int = slot_bytes
+        self.model_path: str = model_path
+        self.landmarker_factory: Callable[[str], Any] = landmarker_factory
+        self.results: Any = results
+        self.shm = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+        self.free_slots: asyncio.Queue = asyncio.Queue()
+        self.requests: Any = None
+        self.process: Any = None
+        self.start()
+
+    def start(self) -> None:
+        """
+        Start the process on a new request queue, attached to the same shared memory,
+        with every slot free. Also restarts a dead worker: the queue of the dead process
+        is dropped with its requests, as it may have died holding the queue lock.
+        """
+        if self.requests is not None:
+            self.requests.cancel_join_thread()
+            self.requests.close()
+        self.requests = self.ctx.Queue()
+        while not self.free_slots.empty():
+            self.free_slots.get_nowait()
+        for slot in range(self.slots):
+            self.free_slots.put_nowait(slot)
+        self.process = self.ctx.Process(
+            target=_worker_main,
+            args=(
+                self.shm.name,
+                self.slot_bytes,
+                self.model_path,
+                self.landmarker_factory,
+                self.requests,
+                self.results,
+            ),
+            daemon=True,
+        )
+        self.process.start()
+
+    def slot_view(self, slot: int, shape: tuple[int, ...]) -> np.ndarray:
+        return np.ndarray(
+            shape, dtype=np.uint8, buffer=self.shm.buf, offset=slot * self.slot_bytes
+        )
+
+
+class InferencePool:
+    """
+    Pool of worker processes running the pose model.
+    Each worker holds warm PoseLandmarkers and a ring of shared memory slots. A frame is
+    copied once into a free slot of its session's worker, only the slot index travels
+    through the request queue and the (33, 3) landmark array comes back. Sessions are
+    pinned to a worker so their VIDEO mode timestamps stay monotonic.
+    Must be created and used from the asyncio event loop.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        workers: int,
+        model_path: str = "models/pose_landmarker_lite.task",
+        *,
+        slots_per_worker: int = 4,
+        slot_bytes: int = DEFAULT_SLOT_BYTES,
+        landmarker_factory: Callable[[str], Any] = _default_landmarker_factory,
+    ):
+        # mediapipe is not fork safe, the workers are spawned
+        ctx = multiprocessing.get_context("spawn")
+        self.slot_bytes: int = slot_bytes
+        self._loop = asyncio.get_running_loop()
+        self._results = ctx.Queue()
+        # futures of the awaited detections, and the slot of every request until its
+        # worker answers: a slot is only reused once the worker is done reading it
+        self._pending: dict[int, asyncio.Future] = {}
+        self._slots: dict[int, tuple[_Worker, int]] = {}
+        self._request_ids = itertools.count()
+        self._workers: list[_Worker] = [
+            _Worker(
+                ctx,
+                slots_per_worker,
+                slot_bytes,
+                model_path,
+                landmarker_factory,
+                self._results,
+            )
+            for _ in range(max(int(workers), 1))
+        ]
+        self._reader = threading.Thread(
+            target=self._read_results, name="gymbuddy-inference-results", daemon=True
+        )
+        self._reader.start()
+
+    def _worker_for(self, session_id: str) -> _Worker:
+        # stable hash, the session always goes to the same worker
+        return self._workers[zlib.crc32(session_id.encode()) % len(self._workers)]
+
+    async def detect(
+        self, session_id: str, frame: np.ndarray, timestamp: int
+    ) -> LandmarkFrame | None:
+        """
+        Detect the pose on a frame.
+        Args:
+            session_id (str): the session, used for the worker affinity.
+            frame (np.ndarray): (height, width, 3) uint8 image.
+            timestamp (int): timestamp of the frame in ms, monotonic for the session.
+        Returns:
+            LandmarkFrame | None: the landmarks of the first pose, None if no pose is found
+            or if the worker died on the frame (it is restarted).
+        Raises:
+            TimeoutError: no result within DETECT_TIMEOUT_SECONDS.
+            RuntimeError: the worker failed on the frame.
+        """
+        if frame.nbytes > self.slot_bytes:
+            raise ValueError(
+                f"Frame of {frame.nbytes} bytes does not fit in a {self.slot_bytes} bytes slot."
+            )
+        worker = self._worker_for(session_id)
+        deadline = self._loop.time() + DETECT_TIMEOUT_SECONDS
+        slot = await self._wait(worker, asyncio.ensure_future(worker.free_slots.get()), deadline)
+        try:
+            worker.slot_view(slot, frame.shape)[...] = frame
+        except BaseException:
+            worker.free_slots.put_nowait(slot)
+            raise
+        request_id = next(self._request_ids)
+        future = self._loop.create_future()
+        self._pending[request_id] = future
+        # returned by _resolve when the worker answers, even if this call is cancelled
+        self._slots[request_id] = (worker, slot)
+        worker.requests.put(("detect", request_id, session_id, slot, frame.shape, timestamp))
+        try:
+            landmarks = await self._wait(worker, future, deadline)
+        finally:
+            self._pending.pop(request_id, None)
+        return None if landmarks is None else LandmarkFrame(landmarks)
+
+    async def _wait(self, worker: _Worker, future: asyncio.Future, deadline: float) -> Any:
+        """
+        Wait for a future of a worker, giving up at the deadline. A dead worker is
+        restarted, which resolves its pending detections and frees its slots.
+        """
+        try:
+            while not future.done():
+                if not worker.process.is_alive():
+                    self._restart(worker)
+                    continue
+                remaining = deadline - self._loop.time()
+                if remaining <= 0:
+                    raise TimeoutError("No result from the inference worker in time.")
+                await asyncio.wait({future}, timeout=min(remaining, LIVENESS_INTERVAL_SECONDS))
+        finally:
+            if not future.done():
+                future.cancel()
+        return future.result()
+
+    def _restart(self, worker: _Worker) -> None:
+        """Restart a dead worker, its frames in flight are given no pose."""
+        logger.warning(
+            "Inference worker died (exit code %s), restarting it", worker.process.exitcode
+        )
+        METRICS.inc("inference_worker_restarts")
+        for request_id, (owner, _) in list(self._slots.items()):
+            if owner is not worker:
+                continue
+            del self._slots[request_id]
+            future = self._pending.pop(request_id, None)
+            if future is not None and not future.done():
+                future.set_result(None)
+        worker.start()
+
+    def _read_results(self) -> None:
+        while True:
+            message = self._results.get()
+            if message is None:
+                break
+            self._loop.call_soon_threadsafe(self._resolve, *message)
+
+    def _resolve(self, request_id: int, landmarks: Any, error: str | None) -> None:
+        worker_slot = self._slots.pop(request_id, None)
+        if worker_slot is not None:
+            worker, slot = worker_slot
+            worker.free_slots.put_nowait(slot)
+        future = self._pending.pop(request_id, None)
+        if future is None or future.done():
+            return
+        if error is not None:
+            future.set_exception(RuntimeError(f"Inference worker error: {error}"))
+        else:
+            future.set_result(landmarks)
+
+    def release_session(self, session_id: str) -> None:
+        """Free the landmarker held for a session by its worker."""
+        self._worker_for(session_id).requests.put(("close", session_id))
+
+    def close(self) -> None:
+        """Stop the workers and free the shared memory."""
+        for worker in self._workers:
+            worker.requests.put(None)
+        for worker in self._workers:
+            worker.process.join(timeout=10)
+            if worker.process.is_alive():
+                worker.process.terminate()
+            worker.shm.close()
+            worker.shm.unlink()
+        self._results.put(None)
+        self._reader.join(timeout=10)
+        for future in self._pending.values():
+            future.cancel()
+        self._pending.clear()
+        self._slots.clear()
@@ -0,0 +1,164 @@
+import logging
+import queue
+import threading
+from typing import Any, Callable
+import numpy as np
+from modules.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# blank frame run through every landmarker when it is created and returned to the pool
+WARM_UP_SHAPE: tuple[int, int, int] = (256, 256, 3)
+# timestamp gap (ms) between two leases of a landmarker
+RESET_GAP_MS: int = 1000
+
+
+def _default_landmarker_factory(
+    model_path: str, live: bool = False, result_callback=None, segmentation: bool = False
+):
+    from modules.gymBuddy import create_landmarker
+
+    return create_landmarker(
+        model_path, live=live, result_callback=result_callback, segmentation=segmentation
+    )
+
+
+def _blank_image():
+    import mediapipe as mp
+
+    return mp.Image(image_format=mp.ImageFormat.SRGB, data=np.zeros(WARM_UP_SHAPE, np.uint8))
+
+
+class LeasedLandmarker:
+    """
+    Landmarker leased by one session, in VIDEO or LIVE_STREAM mode.
+    MediaPipe requires increasing timestamps for the whole life of a landmarker, every
+    lease starts its own sequence at 0 which is shifted after the last timestamp of the
+    previous lease. In LIVE_STREAM mode the results go to the result_handler of the
+    current lease, with the timestamps of its sequence.
+    """
+
+    def __init__(self, live: bool = False):
+        self.live: bool = live
+        self.landmarker: Any = None
+        self.base_ms: int = 0
+        self.last_ms: int = -1
+        self.result_handler: Callable[[Any, int], None] | None = None
+
+    def _next_timestamp(self, timestamp_ms: int) -> int:
+        self.last_ms = self.base_ms + int(timestamp_ms)
+        return self.last_ms
+
+    def detect_for_video(self, image: Any, timestamp_ms: int) -> Any:
+        return self.landmarker.detect_for_video(image, self._next_timestamp(timestamp_ms))
+
+    def detect_async(self, image: Any, timestamp_ms: int) -> None:
+        self.landmarker.detect_async(image, self._next_timestamp(timestamp_ms))
+
+    def set_result_handler(self, handler: Callable[[Any, int], None] | None) -> None:
+        """Deliver the LIVE_STREAM results to handler, None stops the delivery."""
+        self.result_handler = handler
+
+    def on_result(self, result: Any, _output_image: Any, timestamp_ms: int) -> None:
+        """LIVE_STREAM callback, called from a MediaPipe thread."""
+        handler = self.result_handler
+        # the results of a previous lease or of the reset frame are not delivered
+        if handler is None or timestamp_ms <= self.base_ms:
+            return
+        handler(result, timestamp_ms - self.base_ms)
+
+    def reset(self, image: Any) -> None:
+        """
+        Start a new timestamp sequence. The blank frame has no pose, so the tracking and
+        the smoothing of the previous session do not carry over to the next one.
+        """
+        self.set_result_handler(None)
+        self.base_ms = self.last_ms + RESET_GAP_MS
+        if self.live:
+            self.detect_async(image, 0)
+        else:
+            self.detect_for_video(image, 0)
+        self.base_ms = self.last_ms + RESET_GAP_MS
+
+    def close(self) -> None:
+        self.landmarker.close()
+
+
+class LandmarkerPool:
+    """
+    Process-wide pool of landmarkers, created and warmed up at startup and leased by the
+    sessions, so a connection does not load the model. All of them run in VIDEO mode, or
+    in LIVE_STREAM mode (modules.live_inference) when live is set.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        model_path: str,
+        size: int = 4,
+        landmarker_factory: Callable[..., Any] = _default_landmarker_factory,
+        *,
+        live: bool = False,
+        segmentation: bool = False,
+    ):
+        self.model_path: str = model_path
+        self.size: int = size
+        self.live: bool = live
+        # segmentation masks are only computed when a consumer asks for them
+        self.segmentation: bool = segmentation
+        self.landmarker_factory: Callable[..., Any] = landmarker_factory
+        self._idle: queue.LifoQueue = queue.LifoQueue(maxsize=size)
+        self._blank: Any = None
+        self._lock = threading.Lock()
+
+    def _blank_frame(self) -> Any:
+        with self._lock:
+            if self._blank is None:
+                self._blank = _blank_image()
+        return self._blank
+
+    def _create(self) -> LeasedLandmarker:
+        landmarker = LeasedLandmarker(self.live)
+        landmarker.landmarker = self.landmarker_factory(
+            self.model_path,
+            live=self.live,
+            result_callback=landmarker.on_result,
+            segmentation=self.segmentation,
+        )
+        # the first inference initialises the graph, not the first frame of a session
+        landmarker.reset(self._blank_frame())
+        METRICS.inc("landmarkers_created")
+        return landmarker
+
+    def warm_up(self) -> None:
+        """Fill the pool with warmed up landmarkers."""
+        while not self._idle.full():
+            try:
+                self._idle.put_nowait(self._create())
+            except queue.Full:
+                break
+
+    def acquire(self) -> LeasedLandmarker:
+        """Lease a landmarker, a new one is created if none is idle."""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            logger.info("Landmarker pool empty, creating a landmarker")
+            return self._create()
+
+    def release(self, landmarker: LeasedLandmarker) -> None:
+        """Reset a leased landmarker and give it back to the pool."""
+        try:
+            landmarker.reset(self._blank_frame())
+            self._idle.put_nowait(landmarker)
+        except queue.Full:
+            landmarker.close()
+        except Exception as e:
+            logger.warning("Dropping a landmarker that failed to reset: %s", e)
+            landmarker.close()
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
@@ -0,0 +1,106 @@
+import asyncio
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable
+import numpy as np
+from modules.metrics import SessionMetrics
+from modules.utils import LandmarkFrame
+
+# type of the inbox messages carrying a pipelined inference result
+LIVE_RESULT: str = "inference.result"
+
+
+@dataclass
+class LiveResult:
+    """Landmarks of a frame submitted to LiveInference, None when no pose was found."""
+
+    timestamp_ms: int
+    landmarks: LandmarkFrame | None
+    context: Any
+
+
+class LiveInference:
+    """
+    Pipelined pose inference of one session on a LIVE_STREAM landmarker (a
+    LeasedLandmarker of a live LandmarkerPool).
+    submit returns as soon as the frame is handed to MediaPipe, so the next frame can be
+    received and decoded while this one is inferred. The results come back on a MediaPipe
+    thread, are matched to their frame by timestamp and delivered on the event loop to
+    deliver, e.g. SessionInbox.put.
+    MediaPipe skips the frames submitted while its graph is busy. Those never get a
+    result: they are dropped once a later frame's result arrives.
+    """
+
+    def __init__(
+        self,
+        landmarker: Any,
+        deliver: Callable[[dict[str, Any]], None],
+        metrics: SessionMetrics | None = None,
+        max_in_flight: int = 2,
+    ):
+        self.landmarker: Any = landmarker
+        self.deliver: Callable[[dict[str, Any]], None] = deliver
+        self.metrics: SessionMetrics | None = metrics
+        self.max_in_flight: int = max_in_flight
+        self.loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        # timestamp -> (context, submit time) of the frames waiting for their result
+        self._pending: dict[int, tuple[Any, float]] = {}
+        self._lock = threading.Lock()
+        self.frames_skipped: int = 0
+        self.closed: bool = False
+        landmarker.set_result_handler(self._on_result)
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._pending)
+
+    def submit(self, frame: Any, timestamp_ms: int, context: Any = None) -> bool:
+        """
+        Hand a decoded RGB frame to the model, False if it was skipped because
+        max_in_flight frames are still waiting for their result.
+        """
+        import mediapipe as mp
+
+        with self._lock:
+            if len(self._pending) >= self.max_in_flight:
+                self.frames_skipped += 1
+                return False
+            self._pending[timestamp_ms] = (context, time.perf_counter())
+        # the image is copied by MediaPipe, the decoder can reuse the frame buffer
+        image = mp.Image(image_format=mp.ImageFormat.SRGB, data=np.ascontiguousarray(frame))
+        try:
+            self.landmarker.detect_async(image, timestamp_ms)
+        except Exception:
+            with self._lock:
+                self._pending.pop(timestamp_ms, None)
+            raise
+        return True
+
+    def _on_result(self, result: Any, timestamp_ms: int) -> None:
+        landmarks = None
+        if result and result.pose_landmarks:
+            # copied out of the result, which is only valid during the callback
+            landmarks = LandmarkFrame.from_landmarks(result.pose_landmarks[0])
+        with self._lock:
+            entry = self._pending.pop(timestamp_ms, None)
+            # the earlier frames were skipped by MediaPipe
+            for skipped in [t for t in self._pending if t < timestamp_ms]:
+                del self._pending[skipped]
+                self.frames_skipped += 1
+        if entry is None or self.closed:
+            return
+        context, submitted = entry
+        if self.metrics is not None:
+            self.metrics.observe("inference", time.perf_counter() - submitted)
+        message = {"type": LIVE_RESULT, "result": LiveResult(timestamp_ms, landmarks, context)}
+        try:
+            self.loop.call_soon_threadsafe(self.deliver, message)
+        except RuntimeError:
+            # the event loop is closed, the session is over
+            pass
+
+    def close(self) -> None:
+        """Stop delivering the results, the landmarker goes back to its pool."""
+        self.closed = True
+        self.landmarker.set_result_handler(None)
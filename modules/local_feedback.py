@@ -0,0 +1,131 @@
+import re
+from collections import Counter
+from typing import Any, Mapping
+
+# rolling summary of a session before its first set
+NO_ROLLING_SUMMARY: str = "No previous sets in this session."
+
+# correction of every form issue reported by the workouts (modules/workouts)
+ISSUE_TIPS: dict[str, str] = {
+    "shoulders not aligned with wrists": "Keep your shoulders stacked right above your wrists.",
+    "knees on floor": "Keep your knees off the floor, push through your toes.",
+    "body not straight": "Brace your core and glutes to keep your body in a straight line.",
+    "knees not aligned with toes": "Push your knees out so they track over your toes.",
+    "knees not aligned with ankles": "Stand up with your knees right above your ankles.",
+    "hips angle not between 45 and 90 degrees": "Sit back into your hips, aiming for a hip angle between 45 and 90 degrees.",
+    "You are not standing straight": "Fully extend your hips at the top of each rep.",
+    "your shoulders are not over your ankles": "Keep your chest up so your shoulders stay over your ankles.",
+}
+
+# a comfortable pace, in seconds per repetition
+STEADY_PACE: tuple[float, float] = (1.5, 4.0)
+
+_ANGLE_DETAIL = re.compile(r"\s*\(angle: [^)]*\)")
+
+
+def _is_good_form(issue: str) -> bool:
+    return issue.startswith("Good form")
+
+
+def issue_counts(form_issues: list[tuple[str, int]]) -> Counter:
+    """
+    Frames per single issue. The frames of a workout store the issues joined by ", "
+    with the measured angle, e.g. "knees on floor, body not straight".
+    """
+    counts: Counter = Counter()
+    for issues, count in form_issues:
+        if _is_good_form(issues):
+            continue
+        for issue in _ANGLE_DETAIL.sub("", issues).split(", "):
+            counts[issue] += count
+    return counts
+
+
+def set_summary(metadata: Mapping[str, Any], analysis: Mapping[str, Any]) -> str:
+    """One line describing a set, as kept in the rolling summary of the session."""
+    counts = issue_counts(analysis.get("form_issues", []))
+    issues = ", ".join(issue for issue, _ in counts.most_common())
+    return (
+        f"Set {metadata.get('series_number', 'N/A')}: "
+        f"{analysis.get('total_repetitions', 0)} {metadata.get('workout_name', '')} "
+        f"(goal {metadata.get('rep_goal', 'N/A')}), {issues or 'good form'}."
+    )
+
+
+def roll_summary(previous: str, metadata: Mapping[str, Any], analysis: Mapping[str, Any]) -> str:
+    """Rolling summary of the session once the set is done."""
+    current = set_summary(metadata, analysis)
+    return current if previous == NO_ROLLING_SUMMARY else f"{previous} {current}"
+
+
+def local_feedback(
+    metadata: Mapping[str, Any],
+    analysis: Mapping[str, Any],
+    previous_rolling_summary: str = NO_ROLLING_SUMMARY,
+) -> dict[str, str]:
+    """
+    Rule-based feedback of a set, with the fields of the LLM feedback.
+    Built from the extracted statistics only, in well under a millisecond, it is served
+    when the LLM is too slow or unavailable.
+    Args:
+        metadata (Mapping[str, Any]): the workout metadata (FeedbackAgent.metadata).
+        analysis (Mapping[str, Any]): the extracted analysis (FeedbackAgent.extract_analysis).
+        previous_rolling_summary (str): the rolling summary of the session so far.
+    Returns:
+        dict[str, str]: the feedback fields (FEEDBACK_FIELDS).
+    """
+    workout = metadata.get("workout_name", "reps")
+    goal = int(metadata.get("rep_goal", 0) or 0)
+    reps = int(analysis.get("total_repetitions", 0) or 0)
+    # not timed when no rep was completed
+    rep_time = analysis.get("average_time_repetitions") or None
+    form_issues = analysis.get("form_issues", [])
+    total_frames = sum(count for _, count in form_issues)
+    good_frames = sum(count for issue, count in form_issues if _is_good_form(issue))
+    good_share = good_frames / total_frames if total_frames else 0.0
+    issues = issue_counts(form_issues).most_common()
+    steady = rep_time is not None and STEADY_PACE[0] <= rep_time <= STEADY_PACE[1]
+
+    if goal and reps >= goal:
+        encouragement = f"Great job, you completed all {reps} {workout}!"
+    else:
+        encouragement = f"Good effort, {reps} of {goal} {workout} done!"
+
+    if good_share >= 0.8:
+        positive_point = f"Your form was good on {good_share:.0%} of the set."
+    elif steady:
+        positive_point = f"You kept a steady pace of {rep_time:.1f} s per rep."
+    else:
+        positive_point = "You kept going until the end of the set."
+
+    tips = [ISSUE_TIPS.get(issue, f"Watch out for: {issue}.") for issue, _ in issues]
+    if tips:
+        main_feedback = f"Most frequent issue: {issues[0][0]}. {tips[0]}"
+    else:
+        main_feedback = "No form issue detected, keep the same technique."
+
+    if len(tips) > 1:
+        secondary_feedback = f"Also: {issues[1][0]}. {tips[1]}"
+    elif analysis.get("worst_reps"):
+        worst = ", ".join(str(rep) for rep, _ in analysis["worst_reps"])
+        secondary_feedback = f"Reps {worst} had the most issues, slow down when you get tired."
+    elif rep_time is not None and not steady:
+        secondary_feedback = (
+            "Slow down a bit to control each rep."
+            if rep_time < STEADY_PACE[0]
+            else "Try a smoother, more regular pace."
+        )
+    else:
+        secondary_feedback = "Consider a harder variation or more reps next set."
+
+    pace = f", {rep_time:.1f} s per rep" if rep_time is not None else ""
+    summary = f"{reps}/{goal} {workout}, {good_share:.0%} of the set in good form{pace}."
+
+    return {
+        "encouragement": encouragement,
+        "positive_point": positive_point,
+        "main_feedback": main_feedback,
+        "secondary_feedback": secondary_feedback,
+        "summary": summary,
+        "Rolling_Summary": roll_summary(previous_rolling_summary, metadata, analysis),
+    }
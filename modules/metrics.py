@@ -0,0 +1,185 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+# upper bounds (seconds) of the latency buckets, from sub-millisecond steps to LLM calls
+DEFAULT_BUCKETS: tuple[float, ...] = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+# the stages timed along a frame and a set
+STAGES: tuple[str, ...] = (
+    "receive",
+    "decode",
+    "inference",
+    "rep_logic",
+    "serialize",
+    "send",
+    "db_save",
+    "sql_extract",
+    "llm_first_token",
+    "llm",
+)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram, cumulative like a Prometheus histogram once exported."""
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets: tuple[float, ...] = buckets
+        # one count per bucket plus the +Inf bucket, not cumulative
+        self.counts: list[int] = [0] * (len(buckets) + 1)
+        self.count: int = 0
+        self.sum: float = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def cumulative(self) -> list[int]:
+        """Counts of the observations below each bucket bound, the last one is +Inf."""
+        with self._lock:
+            counts = list(self.counts)
+        total = 0
+        for i, count in enumerate(counts):
+            total += count
+            counts[i] = total
+        return counts
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q quantile (0 <= q <= 1), inf if above the last one."""
+        counts = self.cumulative()
+        if counts[-1] == 0:
+            return 0.0
+        rank = q * counts[-1]
+        for bound, count in zip(self.buckets, counts):
+            if count >= rank:
+                return bound
+        return float("inf")
+
+
+class MetricsRegistry:
+    """
+    Process-wide stage timers and counters, exported in the Prometheus text format.
+    Every histogram is labelled by stage, e.g. gymbuddy_stage_seconds{stage="inference"}.
+    """
+
+    def __init__(self, prefix: str = "gymbuddy"):
+        self.prefix: str = prefix
+        self.stages: dict[str, Histogram] = {}
+        self.counters: dict[str, int] = {}
+        self.gauges: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, stage: str) -> Histogram:
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self.stages.setdefault(stage, Histogram())
+        return histogram
+
+    def observe(self, stage: str, seconds: float) -> None:
+        self.histogram(stage).observe(seconds)
+
+    def inc(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float) -> None:
+        self.gauges[name] = value
+
+    @contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        """Time the enclosed block into the histogram of a stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def render(self) -> str:
+        """Export all the metrics in the Prometheus text exposition format."""
+        name = f"{self.prefix}_stage_seconds"
+        lines = [
+            f"# HELP {name} Time spent per processing stage.",
+            f"# TYPE {name} histogram",
+        ]
+        for stage, histogram in sorted(self.stages.items()):
+            counts = histogram.cumulative()
+            for bound, count in zip(histogram.buckets, counts):
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {counts[-1]}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.sum}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {counts[-1]}')
+        for counter, value in sorted(self.counters.items()):
+            lines.append(f"# TYPE {self.prefix}_{counter}_total counter")
+            lines.append(f"{self.prefix}_{counter}_total {value}")
+        for gauge, value in sorted(self.gauges.items()):
+            lines.append(f"# TYPE {self.prefix}_{gauge} gauge")
+            lines.append(f"{self.prefix}_{gauge} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# metrics of the whole process, served at /metrics
+METRICS = MetricsRegistry()
+
+
+class SessionMetrics:
+    """
+    Stage timers of one websocket session. Every observation is also recorded in the
+    process-wide registry, the session histograms are only summarised when it ends.
+    """
+
+    def __init__(self, session_id: str | None = None, registry: MetricsRegistry = METRICS):
+        self.session_id: str | None = session_id
+        self.registry: MetricsRegistry = registry
+        self.stages: dict[str, Histogram] = {}
+
+    def observe(self, stage: str, seconds: float) -> None:
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages[stage] = Histogram()
+        histogram.observe(seconds)
+        self.registry.observe(stage, seconds)
+
+    @contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        """Time the enclosed block into the session and process histograms of a stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        """Count, mean and approximate p50/p95 (ms) of every stage timed in the session."""
+        return {
+            stage: {
+                "count": histogram.count,
+                "mean_ms": 1000 * histogram.sum / max(histogram.count, 1),
+                "p50_ms": 1000 * histogram.quantile(0.5),
+                "p95_ms": 1000 * histogram.quantile(0.95),
+            }
+            for stage, histogram in self.stages.items()
+        }
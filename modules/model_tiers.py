@@ -0,0 +1,219 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Callable
+from modules.capture_rate import TRANSITION_FPS
+from modules.landmarker_pool import LandmarkerPool, LeasedLandmarker, _default_landmarker_factory
+from modules.metrics import METRICS, SessionMetrics
+
+logger = logging.getLogger(__name__)
+
+# pose landmarker variants, from the fastest to the most accurate
+MODEL_TIERS: tuple[str, ...] = ("lite", "full", "heavy")
+DEFAULT_TIER: str = "lite"
+
+# seconds per frame at the highest capture rate, the inference has to fit in it
+FRAME_BUDGET_SECONDS: float = 1 / TRANSITION_FPS
+# inference observations averaged before a decision
+WINDOW_FRAMES: int = 30
+# step down when the mean inference takes this share of the frame budget ...
+STEP_DOWN_SHARE: float = 0.8
+# ... step up under this share, the next tier being 2-3 times slower
+STEP_UP_SHARE: float = 0.3
+# load average per CPU above which the sessions step down, and under which they may step up
+HIGH_LOAD: float = 0.9
+LOW_LOAD: float = 0.6
+# seconds at a tier before stepping up, a step down is never delayed
+STEP_UP_AFTER_SECONDS: float = 30.0
+
+
+def model_path_for(tier: str, models_dir: str = "models") -> str:
+    return os.path.join(models_dir, f"pose_landmarker_{tier}.task")
+
+
+def available_tiers(models_dir: str = "models") -> list[str]:
+    """The tiers whose model file is present, in MODEL_TIERS order."""
+    return [tier for tier in MODEL_TIERS if os.path.exists(model_path_for(tier, models_dir))]
+
+
+def server_load() -> float:
+    """1-minute load average per CPU, 0 where the platform has none (Windows)."""
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (AttributeError, OSError):
+        return 0.0
+
+
+class TierController:
+    """
+    Picks the model tier of a session from its measured inference latency (the
+    "inference" stage of its SessionMetrics, queueing included) and the server load.
+    The session steps down as soon as a window of frames does not fit in the frame
+    budget or the server is overloaded, and steps back up after STEP_UP_AFTER_SECONDS
+    of headroom.
+    """
+
+    def __init__(
+        self,
+        tiers: list[str],
+        tier: str = DEFAULT_TIER,
+        load: Callable[[], float] = server_load,
+    ):
+        self.tiers: list[str] = list(tiers)
+        self.tier: str = tier if tier in tiers else tiers[0]
+        self.load: Callable[[], float] = load
+        self.changed_at: float = time.monotonic()
+        # inference count and total time at the start of the window
+        self._count: int = 0
+        self._sum: float = 0.0
+
+    def start_window(self, metrics: SessionMetrics) -> None:
+        """Average only the frames from now on, e.g. those of a new landmarker."""
+        histogram = metrics.stages.get("inference")
+        if histogram is not None:
+            self._count, self._sum = histogram.count, histogram.sum
+
+    def update(self, metrics: SessionMetrics, now: float | None = None) -> str | None:
+        """
+        Follow the inference latency of the session after a frame.
+        Returns:
+            str | None: the tier to switch to, None to keep the current one.
+        """
+        histogram = metrics.stages.get("inference")
+        if histogram is None or histogram.count - self._count < WINDOW_FRAMES:
+            return None
+        now = time.monotonic() if now is None else now
+        mean = (histogram.sum - self._sum) / (histogram.count - self._count)
+        self._count, self._sum = histogram.count, histogram.sum
+        load = self.load()
+        index = self.tiers.index(self.tier)
+        if mean > STEP_DOWN_SHARE * FRAME_BUDGET_SECONDS or load > HIGH_LOAD:
+            index -= 1
+        elif (
+            mean < STEP_UP_SHARE * FRAME_BUDGET_SECONDS
+            and load < LOW_LOAD
+            and now - self.changed_at >= STEP_UP_AFTER_SECONDS
+        ):
+            index += 1
+        if not 0 <= index < len(self.tiers) or self.tiers[index] == self.tier:
+            return None
+        step = "up" if index > self.tiers.index(self.tier) else "down"
+        logger.info(
+            "Model tier %s -> %s (inference %.1f ms, load %.2f)",
+            self.tier,
+            self.tiers[index],
+            1000 * mean,
+            load,
+        )
+        METRICS.inc(f"model_tier_steps_{step}")
+        self.tier = self.tiers[index]
+        self.changed_at = now
+        return self.tier
+
+
+class TieredLandmarkerPools:
+    """
+    One LandmarkerPool per available model tier. Only the default tier is warmed up at
+    startup, the landmarkers of the other tiers are created when a session first steps
+    to them and then pooled like the others.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        models_dir: str,
+        size: int = 4,
+        default_tier: str = DEFAULT_TIER,
+        landmarker_factory: Callable[..., Any] = _default_landmarker_factory,
+        *,
+        live: bool = False,
+        segmentation: bool = False,
+    ):
+        self.tiers: list[str] = available_tiers(models_dir) or [DEFAULT_TIER]
+        self.default_tier: str = default_tier if default_tier in self.tiers else self.tiers[0]
+        self.live: bool = live
+        self.pools: dict[str, LandmarkerPool] = {
+            tier: LandmarkerPool(
+                model_path_for(tier, models_dir),
+                size=size,
+                landmarker_factory=landmarker_factory,
+                live=live,
+                segmentation=segmentation,
+            )
+            for tier in self.tiers
+        }
+
+    @property
+    def default(self) -> LandmarkerPool:
+        return self.pools[self.default_tier]
+
+    def warm_up(self) -> None:
+        self.default.warm_up()
+
+    def close(self) -> None:
+        for pool in self.pools.values():
+            pool.close()
+
+
+class SessionLandmarker:
+    """
+    Landmarker of a session, leased from the pool of its current tier. When its
+    TierController steps, the landmarker of the new tier is acquired in a thread while
+    the session keeps inferring on the current one, then they are swapped.
+    """
+
+    def __init__(self, pools: TieredLandmarkerPools, adaptive: bool = True):
+        self.pools: TieredLandmarkerPools = pools
+        self.tier: str = pools.default_tier
+        self.controller: TierController | None = (
+            TierController(pools.tiers, self.tier) if adaptive and len(pools.tiers) > 1 else None
+        )
+        self.landmarker: LeasedLandmarker | None = None
+        self._switch: asyncio.Task | None = None
+
+    async def acquire(self) -> LeasedLandmarker:
+        self.landmarker = await asyncio.to_thread(self.pools.pools[self.tier].acquire)
+        return self.landmarker
+
+    async def follow(self, metrics: SessionMetrics) -> bool:
+        """Follow the inference latency after a frame, True when the landmarker was replaced."""
+        if self.controller is None:
+            return False
+        if self._switch is None:
+            tier = self.controller.update(metrics)
+            if tier is not None:
+                self._switch = asyncio.create_task(
+                    asyncio.to_thread(self.pools.pools[tier].acquire)
+                )
+            return False
+        if not self._switch.done():
+            return False
+        switch, self._switch = self._switch, None
+        try:
+            landmarker = switch.result()
+        except Exception as e:
+            # not retried by this session
+            logger.warning("Could not load the %s model: %s", self.controller.tier, e)
+            self.controller.tiers.remove(self.controller.tier)
+            self.controller.tier = self.tier
+            return False
+        previous, previous_tier = self.landmarker, self.tier
+        self.landmarker, self.tier = landmarker, self.controller.tier
+        self.controller.start_window(metrics)
+        if previous is not None:
+            await asyncio.to_thread(self.pools.pools[previous_tier].release, previous)
+        return True
+
+    async def release(self) -> None:
+        """Give the landmarkers of the session back to their pools."""
+        if self._switch is not None:
+            try:
+                landmarker = await self._switch
+            except Exception:
+                pass
+            else:
+                await asyncio.to_thread(self.pools.pools[self.controller.tier].release, landmarker)
+            self._switch = None
+        if self.landmarker is not None:
+            await asyncio.to_thread(self.pools.pools[self.tier].release, self.landmarker)
+            self.landmarker = None
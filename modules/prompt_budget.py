@@ -0,0 +1,160 @@
+import logging
+from typing import Any, Mapping
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from modules.local_feedback import issue_counts
+from modules.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# rough size of a token for English text and numbers, the Gemini tokenizer is only
+# reachable through the API
+CHARS_PER_TOKEN: int = 4
+
+# compaction levels of the set statistics, from the full statistics (0) to the smallest
+# layout (COMPACTION_LEVELS - 1)
+COMPACTION_LEVELS: int = 4
+_MAX_ISSUES: tuple[int | None, ...] = (None, None, 3, 1)
+_MAX_WORST_REPS: tuple[int, ...] = (3, 3, 1, 0)
+# characters of the rolling summary kept, its most recent part
+_MAX_SUMMARY_CHARS: tuple[int | None, ...] = (None, 800, 400, 200)
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate number of tokens of a text."""
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def format_issues(form_issues: list[tuple[str, int]], max_issues: int | None = None) -> str:
+    """
+    Frames and share of the set of every single issue, most frequent first.
+    The issues are merged across their combinations and measured angles, so the size
+    does not grow with the number of distinct per-frame strings.
+    """
+    total = sum(count for _, count in form_issues) or 1
+    issues = issue_counts(form_issues).most_common(max_issues)
+    if not issues:
+        return "none"
+    return ", ".join(f"{issue} ({count} frames, {count / total:.0%})" for issue, count in issues)
+
+
+def format_worst_reps(worst_reps: list[tuple[int, int]], max_reps: int = 3) -> str:
+    if not worst_reps or max_reps == 0:
+        return "none"
+    return ", ".join(f"Rep {rep} ({count} issues)" for rep, count in worst_reps[:max_reps])
+
+
+def format_angle_stats(angle_stats: list[dict[str, Any]], level: int = 0) -> str:
+    """One line of statistics (degrees) per angle, fewer of them at higher levels."""
+    lines = []
+    for stats in angle_stats:
+        if level == 0:
+            joints = ", ".join(str(joint) for joint in stats["joints"] or [])
+            lines.append(
+                f"{stats['name']} ({joints}): mean {stats['mean']}, std {stats['std']}, "
+                f"min {stats['min']}, 25% {stats['q25']}, median {stats['median']}, "
+                f"75% {stats['q75']}, max {stats['max']}, "
+                f"mean on frames with form issues {stats['mean_with_issues']} "
+                f"({stats['count']} frames)"
+            )
+        elif level == 1:
+            lines.append(
+                f"{stats['name']}: mean {stats['mean']} (std {stats['std']}), "
+                f"range {stats['min']}-{stats['max']}, "
+                f"mean with form issues {stats['mean_with_issues']}"
+            )
+        else:
+            lines.append(
+                f"{stats['name']}: mean {_round(stats['mean'])}, "
+                f"range {_round(stats['min'])}-{_round(stats['max'])}"
+            )
+    return "\n".join(lines)
+
+
+def _round(value: Any) -> Any:
+    return round(value) if isinstance(value, float) else value
+
+
+def shorten_summary(summary: str, max_chars: int | None) -> str:
+    """Keep the most recent part of the rolling summary, cut at a sentence."""
+    if max_chars is None or len(summary) <= max_chars:
+        return summary
+    tail = summary[-max_chars:]
+    start = tail.find(". ")
+    return "... " + (tail[start + 2 :] if start != -1 else tail)
+
+
+def compact_inputs(
+    metadata: Mapping[str, Any],
+    analysis: Mapping[str, Any],
+    rolling_summary: str,
+    level: int = 0,
+) -> dict[str, Any]:
+    """
+    Prompt inputs describing a set, at a compaction level.
+    Args:
+        metadata (Mapping[str, Any]): the workout metadata (FeedbackAgent.metadata).
+        analysis (Mapping[str, Any]): the extracted analysis (FeedbackAgent.extract_analysis).
+        rolling_summary (str): the rolling summary of the session so far.
+        level (int): 0 for the full statistics up to COMPACTION_LEVELS - 1.
+    Returns:
+        dict[str, Any]: the inputs of the prompt, without the format instructions.
+    """
+    return {
+        "rep_goal": metadata.get("rep_goal", "N/A"),
+        "workout_name": metadata.get("workout_name", "N/A"),
+        "strictness_crit": metadata.get("strictness_crit", "N/A"),
+        "strictness_definition": metadata.get("strictness_definition", "N/A"),
+        "series_number": metadata.get("series_number", "N/A"),
+        "total_repetitions": analysis.get("total_repetitions", 0),
+        "duration": metadata.get("duration", 0),
+        "average_time_repetitions": analysis.get("average_time_repetitions", 0),
+        "form_issues": format_issues(analysis.get("form_issues", []), _MAX_ISSUES[level]),
+        "worst_reps": format_worst_reps(analysis.get("worst_reps", []), _MAX_WORST_REPS[level]),
+        "angle_stats": format_angle_stats(analysis.get("angles_desc_stats", []), level),
+        "rolling_summary": shorten_summary(rolling_summary, _MAX_SUMMARY_CHARS[level]),
+    }
+
+
+class TokenUsageRecorder(BaseCallbackHandler):
+    """
+    Record the prompt and response tokens of the LLM calls, from the usage metadata
+    returned by the model or estimated from the text when it has none.
+    """
+
+    def __init__(self, prompt_tokens: int):
+        # estimated when the prompt was built
+        self.prompt_tokens: int = prompt_tokens
+        self.response_tokens: int = 0
+        self.estimated: bool = True
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        usage = None
+        text = ""
+        for generations in response.generations:
+            for generation in generations:
+                text += generation.text
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None) or usage
+        if usage:
+            self.prompt_tokens = usage.get("input_tokens", self.prompt_tokens)
+            self.response_tokens = usage.get("output_tokens", 0)
+            self.estimated = False
+        else:
+            self.response_tokens = estimate_tokens(text)
+        METRICS.inc("llm_calls")
+        METRICS.inc("llm_prompt_tokens", self.prompt_tokens)
+        METRICS.inc("llm_response_tokens", self.response_tokens)
+        logger.info(
+            "LLM call: %s prompt tokens, %s response tokens%s",
+            self.prompt_tokens,
+            self.response_tokens,
+            " (estimated)" if self.estimated else "",
+        )
+
+    def usage(self) -> dict[str, Any]:
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "response_tokens": self.response_tokens,
+            "estimated": self.estimated,
+        }
@@ -0,0 +1,132 @@
+import json
+import struct
+from typing import Any
+import numpy as np
+from modules.utils import LandmarkFrame
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+# name of the binary result protocol, negotiated with a {"type": "protocol"} message
+BINARY_PROTOCOL: str = "binary-v1"
+
+RESULT_MAGIC: bytes = b"GB"
+PROTOCOL_VERSION: int = 1
+
+# flag bits of the result header
+FLAG_FORM_OK: int = 1
+FLAG_DOWN_PHASE: int = 2
+FLAG_LANDMARKS: int = 4
+FLAG_FLOAT32: int = 8
+
+# magic, version, flags, rep_count, goal_reps, n_landmarks, n_angles, form_message length
+_HEADER = struct.Struct("<2sBBHHBBH")
+# angle value, joint indices, name length
+_ANGLE = struct.Struct("<f3BB")
+
+
+def dumps(obj: Any) -> str:
+    """Encode a control message as JSON, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+    return json.dumps(obj)
+
+
+def encode_analysis(
+    analysis: dict,
+    landmarks: LandmarkFrame | None,
+    goal_reps: int,
+    float32: bool = False,
+) -> bytes:
+    """
+    Pack the analysis of a frame into one binary message.
+    Layout (little-endian):
+        header: magic "GB", version u8, flags u8, rep_count u16, goal_reps u16,
+            n_landmarks u8, n_angles u8, form_message_len u16
+        landmarks: n_landmarks (x, y) pairs, float16 (float32 if FLAG_FLOAT32)
+        angles: n_angles times value f32, 3 joint indices u8, name_len u8, name utf-8
+        form message: utf-8
+    Args:
+        analysis (dict): the analysis data returned by GymBuddy.analyze_landmarks.
+        landmarks (LandmarkFrame | None): the landmarks of the frame.
+        goal_reps (int): the rep goal of the set.
+        float32 (bool): send the landmarks as float32 instead of float16.
+    Returns:
+        bytes: the message.
+    """
+    flags = 0
+    if analysis.get("form_ok"):
+        flags |= FLAG_FORM_OK
+    if analysis.get("is_down_phase"):
+        flags |= FLAG_DOWN_PHASE
+    if float32:
+        flags |= FLAG_FLOAT32
+    points = b""
+    n_landmarks = 0
+    if landmarks is not None:
+        flags |= FLAG_LANDMARKS
+        n_landmarks = len(landmarks)
+        points = landmarks.xy.astype("<f4" if float32 else "<f2").tobytes()
+    angles = analysis.get("display_angles", [])
+    angle_parts = []
+    for angle in angles:
+        name = angle["name"].encode()
+        angle_parts.append(
+            _ANGLE.pack(float(angle["value"]), *angle["joint_indices"], len(name))
+        )
+        angle_parts.append(name)
+    message = str(analysis.get("form_message", "")).encode()
+    header = _HEADER.pack(
+        RESULT_MAGIC,
+        PROTOCOL_VERSION,
+        flags,
+        min(int(analysis.get("rep_count", 0)), 0xFFFF),
+        min(int(goal_reps), 0xFFFF),
+        n_landmarks,
+        len(angles),
+        len(message),
+    )
+    return b"".join([header, points, *angle_parts, message])
+
+
+def decode_analysis(payload: bytes) -> dict:
+    """Decode a message packed by encode_analysis into the JSON analysis layout."""
+    (
+        magic,
+        version,
+        flags,
+        rep_count,
+        goal_reps,
+        n_landmarks,
+        n_angles,
+        message_len,
+    ) = _HEADER.unpack_from(payload)
+    if magic != RESULT_MAGIC or version != PROTOCOL_VERSION:
+        raise ValueError("Not a GymBuddy binary result message.")
+    offset = _HEADER.size
+    dtype = "<f4" if flags & FLAG_FLOAT32 else "<f2"
+    points = np.frombuffer(payload, dtype=dtype, count=n_landmarks * 2, offset=offset)
+    offset += points.nbytes
+    display_angles = []
+    for _ in range(n_angles):
+        value, idx1, idx2, idx3, name_len = _ANGLE.unpack_from(payload, offset)
+        offset += _ANGLE.size
+        name = payload[offset : offset + name_len].decode()
+        offset += name_len
+        display_angles.append(
+            {"name": name, "value": value, "joint_indices": (idx1, idx2, idx3)}
+        )
+    form_message = payload[offset : offset + message_len].decode()
+    return {
+        "landmarks": [
+            {"x": x, "y": y} for x, y in points.reshape(-1, 2).astype(float).tolist()
+        ],
+        "rep_count": rep_count,
+        "goal_reps": goal_reps,
+        "form_ok": bool(flags & FLAG_FORM_OK),
+        "form_message": form_message,
+        "display_angles": display_angles,
+        "is_down_phase": bool(flags & FLAG_DOWN_PHASE),
+    }
@@ -0,0 +1,425 @@
+"""
+Re-score stored sets from their raw landmarks, without running the pose model again.
+
+    python -m modules.rescoring --strictness strict [--workouts 12 13] [--thresholds push-ups=95,145]
+
+The landmarks of all the selected sets are loaded from DuckDB in one block, live tables
+and Parquet archive alike. The sets are scored per workout type and side, over all their
+frames at once: the angle series are computed in one vectorized call, the form rules are
+evaluated on the whole block, and the reps are segmented with the hysteresis of
+Workout.incr_count using array operations. Every run is saved as a new version of the
+analysis, the original workout_analysis rows are left untouched.
+"""
+
+import argparse
+import json
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any
+import duckdb
+import numpy as np
+from modules.archive import DEFAULT_ARCHIVE_DIR, archive_scan, has_archive
+from modules.db_setup import DEFAULT_DB_PATH, DuckDBStore, landmark_columns
+from modules.utils import compute_angles
+from modules.workouts.pushups import PushUps
+from modules.workouts.squats import Squats
+from modules.workouts.workoutParent import Workout
+
+logger = logging.getLogger(__name__)
+
+WORKOUT_CLASSES: dict[str, type[Workout]] = {"push-ups": PushUps, "squats": Squats}
+
+
+@dataclass
+class StoredSets:
+    """Landmarks of several sets, ordered by set and frame."""
+
+    workouts: dict[int, dict[str, Any]]  # id -> workout_name, left_side, strictness_crit
+    workout_id: np.ndarray  # (N,) int32
+    frame: np.ndarray  # (N,) int32
+    timestamp: np.ndarray  # (N,) datetime64
+    landmarks: np.ndarray  # (N, 33, 2) float32
+
+    def __len__(self) -> int:
+        return len(self.frame)
+
+
+@dataclass
+class Rescored:
+    """Per-frame results of a re-scored block, the form issues coded like FrameBatch."""
+
+    down: np.ndarray  # (N,) bool
+    rep_count: np.ndarray  # (N,) int32
+    form_issue_code: np.ndarray  # (N,) int32, index in form_issue_labels
+    form_issue_labels: list[str]
+    # (N,) bool, False for the frames of the workouts without rules, all scored when None
+    scored: np.ndarray | None = None
+
+    def form_issues(self) -> list[str]:
+        return [self.form_issue_labels[code] for code in self.form_issue_code.tolist()]
+
+
+def _source(table: str, columns: str, archive_dir: str) -> str:
+    """
+    Rows of a table, from the live table and the archived sets no longer in it. Checked
+    per table, a set whose archiving was interrupted is read from both sides.
+    """
+    live = f"SELECT {columns} FROM {table}"
+    if not archive_dir or not has_archive(archive_dir, table):
+        return live
+    id_column = "id" if table == "workout" else "workout_id"
+    return (
+        f"{live} UNION ALL SELECT {columns} FROM {archive_scan(archive_dir, table)} "
+        f"WHERE {id_column} NOT IN (SELECT {id_column} FROM {table})"
+    )
+
+
+def load_sets(
+    conn: duckdb.DuckDBPyConnection,
+    workout_ids: list[int] | None = None,
+    archive_dir: str = "",
+) -> StoredSets:
+    """
+    Load the raw landmarks of stored sets.
+    Args:
+        conn (duckdb.DuckDBPyConnection): connection to the database.
+        workout_ids (list[int] | None): the sets to load, all of them when None.
+        archive_dir (str): also read the sets archived there, "" for the live tables only.
+    Returns:
+        StoredSets: the landmarks of the sets, ordered by set and frame.
+    """
+    selected = "" if workout_ids is None else "WHERE {id} IN (SELECT unnest(?::INTEGER[]))"
+    params = [] if workout_ids is None else [list(workout_ids)]
+    rows = conn.execute(
+        f"""
+        SELECT id, workout_name, left_side, strictness_crit
+        FROM ({_source("workout", "id, workout_name, left_side, strictness_crit", archive_dir)})
+        {selected.format(id="id")}""",
+        params,
+    ).fetchall()
+    workouts = {
+        row[0]: {"workout_name": row[1], "left_side": row[2], "strictness_crit": row[3]}
+        for row in rows
+    }
+    columns = landmark_columns()
+    selection = f"workout_id, frame, timestamp, {', '.join(columns)}"
+    block = conn.execute(
+        f"""
+        SELECT {selection}
+        FROM ({_source("raw_landmarks", selection, archive_dir)})
+        {selected.format(id="workout_id")}
+        ORDER BY workout_id, frame""",
+        params,
+    ).fetchnumpy()
+    landmarks = np.stack([np.asarray(block[name]) for name in columns], axis=1)
+    landmarks = landmarks.astype(np.float32, copy=False).reshape(-1, len(columns) // 2, 2)
+    return StoredSets(
+        workouts=workouts,
+        workout_id=np.asarray(block["workout_id"], dtype=np.int32),
+        frame=np.asarray(block["frame"], dtype=np.int32),
+        timestamp=np.asarray(block["timestamp"]),
+        landmarks=landmarks,
+    )
+
+
+def _forward_fill(mask: np.ndarray) -> np.ndarray:
+    """Index of the last True of mask at or before every position (0 before the first)."""
+    index = np.where(mask, np.arange(len(mask)), 0)
+    return np.maximum.accumulate(index)
+
+
+def rescore_block(
+    workout: Workout,
+    xy: np.ndarray,
+    starts: np.ndarray,
+    deviation: "float | np.ndarray",
+) -> Rescored:
+    """
+    Score consecutive sets of one workout type and side.
+    Replays GymBuddy.analyze_landmarks on every frame of a set, from a fresh workout: the
+    rep logic of a frame is gated by the form of the previous frame, then the form of the
+    frame is checked in its new phase.
+    Args:
+        workout (Workout): the workout, its indices, thresholds and form rules are used.
+        xy (np.ndarray): (N, n_landmarks, 2) landmarks of the frames, set after set.
+        starts (np.ndarray): (N,) True on the first frame of every set.
+        deviation (float | np.ndarray): the strictness deviation, per frame or for all.
+    Returns:
+        Rescored: the phase, rep count and form issues of every frame.
+    """
+    n_frames = len(xy)
+    triples = workout.get_angle_triples()
+    values = compute_angles(xy, list(triples.values()))
+    angles = {name: values[:, i] for i, name in enumerate(triples)}
+
+    # the form rules in both phases, the phase is only known once the reps are segmented
+    issues_up = workout.form_issues(xy, angles, np.zeros(n_frames, dtype=bool), deviation)
+    issues_down = workout.form_issues(xy, angles, np.ones(n_frames, dtype=bool), deviation)
+    form_up = ~np.any([mask for _, mask in issues_up], axis=0)
+    form_down = ~np.any([mask for _, mask in issues_down], axis=0)
+
+    # the form of the previous frame of the set, in the phase of that frame
+    gate_up = np.roll(form_up, 1)
+    gate_down = np.roll(form_down, 1)
+    gate_up[starts] = gate_down[starts] = False
+
+    # each frame either forces the phase (down below the down threshold, up above the up
+    # threshold, both gated) or keeps it: the phase is the last forced one
+    angle = angles[workout.rep_angle]
+    event = np.zeros(n_frames, dtype=np.int8)
+    event[gate_up & (angle <= workout.down_threshold)] = 1
+    event[gate_down & (angle >= workout.up_threshold)] = -1
+    # every set starts up
+    event[starts] = -1
+    down = event[_forward_fill(event != 0)] == 1
+
+    # a rep is counted when the phase goes from down to up
+    was_down = np.roll(down, 1)
+    was_down[starts] = False
+    reps = np.cumsum(was_down & ~down, dtype=np.int32)
+    # no rep on the first frame of a set, the count restarts there
+    rep_count = reps - reps[_forward_fill(starts)]
+
+    masks = np.stack(
+        [
+            np.where(down, mask_down, mask_up)
+            for (_, mask_up), (_, mask_down) in zip(issues_up, issues_down)
+        ],
+        axis=1,
+    )
+    issues = [(message, masks[:, i]) for i, (message, _) in enumerate(issues_up)]
+    code, labels = _form_issue_codes(workout, issues, masks, angles)
+    return Rescored(down=down, rep_count=rep_count, form_issue_code=code, form_issue_labels=labels)
+
+
+def _form_issue_codes(
+    workout: Workout,
+    issues: list[tuple[str, np.ndarray]],
+    masks: np.ndarray,
+    angles: dict[str, np.ndarray],
+) -> tuple[np.ndarray, list[str]]:
+    """Code the form messages, only the messages quoting an angle are built per frame."""
+    combination = masks.astype(np.int64) @ (1 << np.arange(masks.shape[1], dtype=np.int64))
+    quoting = np.array(["{" in message for message, _ in issues])
+    code = np.zeros(len(masks), dtype=np.int32)
+    labels: list[str] = []
+    for value in np.unique(combination).tolist():
+        rows = np.flatnonzero(combination == value)
+        if masks[rows[0]][quoting].any():
+            code[rows] = np.arange(len(labels), len(labels) + len(rows))
+            labels.extend(workout.describe_form(issues, angles, row) for row in rows.tolist())
+        else:
+            code[rows] = len(labels)
+            labels.append(workout.describe_form(issues, angles, rows[0]))
+    return code, labels
+
+
+def rescore_sets(
+    sets: StoredSets,
+    strictness: str | None = None,
+    thresholds: dict[str, tuple[int, int]] | None = None,
+) -> Rescored:
+    """
+    Score stored sets, grouped by workout type and side.
+    Args:
+        sets (StoredSets): the sets, see load_sets.
+        strictness (str | None): strict, moderate or loose, the strictness of every set
+            when None.
+        thresholds (dict[str, tuple[int, int]] | None): (down, up) rep thresholds replacing
+            those of the workout classes, by workout name.
+    Returns:
+        Rescored: the results of every frame of sets, in the same order.
+    """
+    n_frames = len(sets)
+    down = np.zeros(n_frames, dtype=bool)
+    rep_count = np.zeros(n_frames, dtype=np.int32)
+    code = np.zeros(n_frames, dtype=np.int32)
+    labels: list[str] = []
+    scored = np.zeros(n_frames, dtype=bool)
+    starts = np.ones(n_frames, dtype=bool)
+    starts[1:] = sets.workout_id[1:] != sets.workout_id[:-1]
+    groups: dict[tuple[str, bool], list[int]] = {}
+    for workout_id, workout in sets.workouts.items():
+        key = (workout["workout_name"], bool(workout["left_side"]))
+        groups.setdefault(key, []).append(workout_id)
+    for (workout_name, left_side), workout_ids in groups.items():
+        if workout_name not in WORKOUT_CLASSES:
+            logger.warning("No rules for %s, sets %s not re-scored", workout_name, workout_ids)
+            continue
+        rows = np.flatnonzero(np.isin(sets.workout_id, workout_ids))
+        if len(rows) == 0:
+            continue
+        workout = WORKOUT_CLASSES[workout_name](
+            goal_reps=0, ldmrk_res=None, left_side=left_side, strictness_crit=strictness or "loose"
+        )
+        if thresholds and workout_name in thresholds:
+            workout.down_threshold, workout.up_threshold = thresholds[workout_name]
+        if strictness is None:
+            # the deviation of the strictness of every set
+            ids = np.array(sorted(workout_ids))
+            deviations = np.zeros(len(ids))
+            for i, workout_id in enumerate(ids.tolist()):
+                workout.strictness_crit = sets.workouts[workout_id]["strictness_crit"]
+                deviations[i] = workout.get_strictness_deviation()
+            deviation = deviations[np.searchsorted(ids, sets.workout_id[rows])]
+        else:
+            deviation = workout.get_strictness_deviation()
+        result = rescore_block(workout, sets.landmarks[rows], starts[rows], deviation)
+        down[rows] = result.down
+        rep_count[rows] = result.rep_count
+        code[rows] = result.form_issue_code + len(labels)
+        labels.extend(result.form_issue_labels)
+        scored[rows] = True
+    return Rescored(
+        down=down,
+        rep_count=rep_count,
+        form_issue_code=code,
+        form_issue_labels=labels,
+        scored=scored,
+    )
+
+
+def write_analysis_version(  # pylint: disable=too-many-arguments
+    conn: duckdb.DuckDBPyConnection,
+    sets: StoredSets,
+    rescored: Rescored,
+    *,
+    strictness: str | None = None,
+    thresholds: dict[str, tuple[int, int]] | None = None,
+    description: str | None = None,
+) -> int:
+    """
+    Save re-scored sets as a new analysis version, the frames that were not scored (no
+    rules for their workout) are left out.
+    Returns:
+        int: the id of the version.
+    """
+    rules = json.dumps({"thresholds": thresholds or {}}, sort_keys=True)
+    keep = slice(None) if rescored.scored is None else rescored.scored
+    version_batch = {
+        "workout_id": sets.workout_id[keep],
+        "frame": sets.frame[keep],
+        "timestamp": sets.timestamp[keep],
+        "rep_count": rescored.rep_count[keep],
+        "down": rescored.down[keep],
+        "form_issue_code": rescored.form_issue_code[keep],
+    }
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        conn.register("version_batch", version_batch)
+        version = conn.execute(
+            """
+            INSERT INTO analysis_version (created_at, strictness_crit, rules, description)
+            VALUES (?, ?, ?, ?) RETURNING ID""",
+            [datetime.now(), strictness, rules, description],
+        ).fetchone()[0]
+        conn.execute(
+            """
+            INSERT INTO workout_analysis_version BY NAME
+            SELECT ?::INTEGER AS version, workout_id, frame, timestamp, rep_count, down,
+            list_extract(?::VARCHAR[], form_issue_code + 1) AS form_issues
+            FROM version_batch""",
+            [version, rescored.form_issue_labels],
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.unregister("version_batch")
+    return version
+
+
+def rescore_workouts(  # pylint: disable=too-many-arguments
+    conn: duckdb.DuckDBPyConnection,
+    workout_ids: list[int] | None = None,
+    *,
+    strictness: str | None = None,
+    thresholds: dict[str, tuple[int, int]] | None = None,
+    archive_dir: str = "",
+    description: str | None = None,
+) -> int:
+    """
+    Re-score stored sets from their raw landmarks and save them as a new analysis version.
+    Args:
+        conn (duckdb.DuckDBPyConnection): connection to the database.
+        workout_ids (list[int] | None): the sets to re-score, all of them when None.
+        strictness (str | None): strictness of the form rules, that of every set when None.
+        thresholds (dict[str, tuple[int, int]] | None): (down, up) rep thresholds by
+            workout name, those of the workout classes otherwise.
+        archive_dir (str): also re-score the sets archived there.
+        description (str | None): note stored with the version.
+    Returns:
+        int: the id of the new version.
+    """
+    sets = load_sets(conn, workout_ids, archive_dir)
+    rescored = rescore_sets(sets, strictness, thresholds)
+    version = write_analysis_version(
+        conn,
+        sets,
+        rescored,
+        strictness=strictness,
+        thresholds=thresholds,
+        description=description,
+    )
+    logger.info(
+        "Re-scored %s sets (%s frames) as analysis version %s",
+        len(sets.workouts),
+        len(sets),
+        version,
+    )
+    return version
+
+
+def _parse_thresholds(values: list[str]) -> dict[str, tuple[int, int]]:
+    thresholds = {}
+    for value in values:
+        name, _, bounds = value.partition("=")
+        down, up = (int(bound) for bound in bounds.split(","))
+        thresholds[name] = (down, up)
+    return thresholds
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Re-score stored GymBuddy sets from their raw landmarks."
+    )
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="DuckDB database file")
+    parser.add_argument(
+        "--archive-dir",
+        default=DEFAULT_ARCHIVE_DIR,
+        help='Parquet archive of the completed sessions, "" for the live tables only',
+    )
+    parser.add_argument("--workouts", type=int, nargs="*", help="set ids, all sets by default")
+    parser.add_argument(
+        "--strictness",
+        choices=["strict", "moderate", "loose"],
+        help="strictness of the form rules, that of each set by default",
+    )
+    parser.add_argument(
+        "--thresholds",
+        nargs="*",
+        default=[],
+        help="rep thresholds replacing the defaults, as workout=down,up (e.g. squats=95,150)",
+    )
+    parser.add_argument("--description", help="note stored with the version")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    store = DuckDBStore(args.db, pool_size=1)
+    try:
+        version = rescore_workouts(
+            store.conn,
+            args.workouts or None,
+            strictness=args.strictness,
+            thresholds=_parse_thresholds(args.thresholds),
+            archive_dir=args.archive_dir,
+            description=args.description,
+        )
+    finally:
+        store.close()
+    print(f"analysis version {version}")
+
+
+if __name__ == "__main__":
+    main()
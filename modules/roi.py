@@ -0,0 +1,136 @@
+import numpy as np
+from modules.metrics import METRICS
+from modules.utils import LandmarkFrame
+
+# landmarks at least this visible bound the region of interest
+VISIBILITY_MIN: float = 0.5
+# fewer visible landmarks than this and the tracking is lost
+MIN_TRACKED_POINTS: int = 8
+# margin added on every side of the pose box, as a share of its largest side, so the
+# next frame still contains the moving limbs
+PADDING: float = 0.3
+# smallest side of the region, as a share of the smallest side of the frame
+MIN_SIDE: float = 0.3
+# a region covering this share of the frame is not worth a crop
+MAX_AREA: float = 0.8
+# the region is kept while the pose box stays this share of its sides away from its
+# borders (the frame borders excepted) ...
+HOLD_MARGIN: float = 0.1
+# ... and no side of the pose box changes by more than this share of its size
+RESIZE_THRESHOLD: float = 0.25
+
+
+class RoiTracker:
+    """
+    Tracks the region of the frame the person is in, from the landmarks of the previous
+    frame. The next frame is cropped to a padded box around the last pose before the
+    inference, and its landmarks are mapped back to full-frame coordinates.
+    The tracking is lost when a frame has no pose or too few visible landmarks, the next
+    frame then goes to the model whole.
+    The region is only moved once the pose gets close to its borders or changes size, a
+    fixed crop keeps the scale of the person steady from one frame to the next.
+    """
+
+    def __init__(self):
+        # last pose box (x0, y0, x1, y1), normalized full-frame coordinates
+        self.box: tuple[float, float, float, float] | None = None
+        # region in use, with the frame shape and the pose box size (pixels) it was fit to
+        self._held: (
+            tuple[tuple[int, int, int, int], tuple[int, int], tuple[float, float]] | None
+        ) = None
+
+    def region(self, height: int, width: int) -> tuple[int, int, int, int] | None:
+        """Pixel region (x0, y0, x1, y1) to crop the next frame to, None for the whole frame."""
+        if self.box is None:
+            self._held = None
+            return None
+        x0, y0, x1, y1 = self.box
+        box = (x0 * width, y0 * height, x1 * width, y1 * height)
+        if self._held is not None and self._holds(box, height, width):
+            return self._held[0]
+        roi = self._fit(box, height, width)
+        self._held = (
+            None if roi is None else (roi, (height, width), (box[2] - box[0], box[3] - box[1]))
+        )
+        return roi
+
+    def _holds(self, box: tuple[float, float, float, float], height: int, width: int) -> bool:
+        """Whether the held region still fits the pose box (pixels)."""
+        (left, top, right, bottom), shape, size = self._held
+        if shape != (height, width):
+            return False
+        for new, old in zip((box[2] - box[0], box[3] - box[1]), size):
+            if abs(new - old) > RESIZE_THRESHOLD * old:
+                return False
+        margin_x, margin_y = HOLD_MARGIN * (right - left), HOLD_MARGIN * (bottom - top)
+        # a region against a frame border cannot move further, the pose can reach it
+        return (
+            box[0] >= (left + margin_x if left > 0 else 0)
+            and box[1] >= (top + margin_y if top > 0 else 0)
+            and box[2] <= (right - margin_x if right < width else width)
+            and box[3] <= (bottom - margin_y if bottom < height else height)
+        )
+
+    @staticmethod
+    def _fit(
+        box: tuple[float, float, float, float], height: int, width: int
+    ) -> tuple[int, int, int, int] | None:
+        """Padded region around the pose box (pixels), None when it is not worth a crop."""
+        x0, y0, x1, y1 = box
+        box_width, box_height = x1 - x0, y1 - y0
+        # the same margin on both axes, a flat pose (push-ups) can still raise its arms
+        margin = 2 * PADDING * max(box_width, box_height)
+        min_side = MIN_SIDE * min(height, width)
+        crop_width = min(max(box_width + margin, min_side), width)
+        crop_height = min(max(box_height + margin, min_side), height)
+        if crop_width * crop_height >= MAX_AREA * height * width:
+            return None
+        # inside the frame, shifted rather than clipped at the borders
+        left = int(min(max((x0 + x1) / 2 - crop_width / 2, 0), width - crop_width))
+        top = int(min(max((y0 + y1) / 2 - crop_height / 2, 0), height - crop_height))
+        return left, top, left + int(crop_width), top + int(crop_height)
+
+    def crop(self, frame: np.ndarray) -> tuple[np.ndarray, tuple[int, int, int, int] | None]:
+        """
+        Crop a (height, width, 3) frame to the region of interest.
+        Returns:
+            tuple[np.ndarray, tuple | None]: the cropped frame (a view, the whole frame when
+            the tracking is lost) and the region to give to to_frame.
+        """
+        roi = self.region(frame.shape[0], frame.shape[1])
+        if roi is None:
+            METRICS.inc("roi_full_frames")
+            return frame, None
+        left, top, right, bottom = roi
+        METRICS.inc("roi_cropped_frames")
+        return frame[top:bottom, left:right], roi
+
+    def to_frame(
+        self,
+        landmarks: LandmarkFrame | None,
+        roi: tuple[int, int, int, int] | None,
+        height: int,
+        width: int,
+    ) -> LandmarkFrame | None:
+        """Map the landmarks detected on a crop back to full-frame coordinates."""
+        if landmarks is None or roi is None:
+            return landmarks
+        left, top, right, bottom = roi
+        data = landmarks.data.copy()
+        data[:, LandmarkFrame.X] = (data[:, LandmarkFrame.X] * (right - left) + left) / width
+        data[:, LandmarkFrame.Y] = (data[:, LandmarkFrame.Y] * (bottom - top) + top) / height
+        return LandmarkFrame(data)
+
+    def update(self, landmarks: LandmarkFrame | None) -> None:
+        """Follow the pose of the last frame (full-frame coordinates), or lose the track."""
+        visible = (
+            None if landmarks is None else landmarks.xy[landmarks.visibility >= VISIBILITY_MIN]
+        )
+        if visible is None or len(visible) < MIN_TRACKED_POINTS:
+            if self.box is not None:
+                METRICS.inc("roi_tracking_lost")
+            self.box = None
+            return
+        x0, y0 = np.clip(visible.min(axis=0), 0.0, 1.0).tolist()
+        x1, y1 = np.clip(visible.max(axis=0), 0.0, 1.0).tolist()
+        self.box = (x0, y0, x1, y1)
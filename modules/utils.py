@@ -1,3 +1,4 @@
+from typing import Any, Sequence
 import numpy as np
 from pydantic import BaseModel
 
@@ -8,6 +9,97 @@ class Landmark(BaseModel):
     visibility: float = 0
 
 
+class LandmarkFrame:
+    """Compact, array-backed view of one MediaPipe pose result.
+
+    Holds the 33 pose landmarks of a frame as a (33, 3) float32 array with the
+    columns x, y and visibility. It is built once per frame and shared by the
+    rep counting, form checks and buffers instead of per-point Landmark objects.
+    """
+
+    __slots__ = ("data",)
+
+    X: int = 0
+    Y: int = 1
+    VISIBILITY: int = 2
+
+    def __init__(self, data: np.ndarray):
+        data = np.asarray(data, dtype=np.float32)
+        if data.ndim != 2 or data.shape[1] < 2:
+            raise ValueError(
+                f"Landmark data should have shape (n_landmarks, 2|3), got {data.shape}."
+            )
+        if data.shape[1] == 2:
+            data = np.column_stack([data, np.zeros(len(data), dtype=np.float32)])
+        self.data: np.ndarray = data
+
+    @classmethod
+    def from_landmarks(cls, landmarks: Sequence[Any]) -> "LandmarkFrame":
+        """
+        Build a frame from a sequence of MediaPipe NormalizedLandmarks (or any
+        object exposing x, y and visibility attributes).
+        """
+        data = np.array(
+            [(lm.x, lm.y, lm.visibility or 0.0) for lm in landmarks], dtype=np.float32
+        )
+        return cls(data.reshape(-1, 3))
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    @property
+    def x(self) -> np.ndarray:
+        return self.data[:, self.X]
+
+    @property
+    def y(self) -> np.ndarray:
+        return self.data[:, self.Y]
+
+    @property
+    def visibility(self) -> np.ndarray:
+        return self.data[:, self.VISIBILITY]
+
+    @property
+    def xy(self) -> np.ndarray:
+        return self.data[:, :2]
+
+    def landmark(self, index: int) -> Landmark:
+        """Return a single point as a Landmark, for callers at the API edges."""
+        x, y, visibility = self.data[index].tolist()
+        return Landmark(x=x, y=y, visibility=visibility)
+
+    def to_dicts(self) -> list[dict[str, float]]:
+        """Return the x, y coordinates as a list of dicts (websocket payload format)."""
+        return [{"x": x, "y": y} for x, y in self.xy.tolist()]
+
+
+def compute_angles(
+    frame: "LandmarkFrame | np.ndarray", triples: Sequence[Sequence[int]]
+) -> np.ndarray:
+    """
+    Compute several joint angles in one vectorized call.
+    Args:
+        frame (LandmarkFrame | np.ndarray): the landmarks, either a LandmarkFrame or an
+            array of shape (..., n_landmarks, >=2). Leading dimensions are kept, so a
+            block of frames (N, 33, 2) gives one angle series per triple.
+        triples (Sequence[Sequence[int]]): (idx1, idx2, idx3) landmark indices for every
+            angle, idx2 being the joint at which the angle is measured.
+    Returns:
+        np.ndarray: the angles in degrees, shape (..., len(triples)).
+    """
+    xy = frame.xy if isinstance(frame, LandmarkFrame) else np.asarray(frame)[..., :2]
+    idx = np.asarray(triples, dtype=np.intp).reshape(-1, 3)
+    # points gathered as (..., n_angles, 3, 2)
+    pts = xy[..., idx, :].astype(np.float64, copy=False)
+    vec1 = pts[..., 0, :] - pts[..., 1, :]
+    vec2 = pts[..., 2, :] - pts[..., 1, :]
+    dot_product = np.einsum("...i,...i->...", vec1, vec2)
+    magnitudes = np.linalg.norm(vec1, axis=-1) * np.linalg.norm(vec2, axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cos_angle = np.clip(dot_product / magnitudes, -1.0, 1.0)
+    return np.degrees(np.arccos(cos_angle))
+
+
 def compute_angle(point1: Landmark, point2: Landmark, point3: Landmark) -> float:
     """
     description: takes three 2D points with attributes x and y and computes the angle between the vector point1point2 and point2point3
@@ -16,55 +108,22 @@ def compute_angle(point1: Landmark, point2: Landmark, point3: Landmark) -> float
     """
     if not all(isinstance(p, Landmark) for p in [point1, point2, point3]):
         raise TypeError("Input points must be Landmark objects")
-    
-    vec1 = np.array([point1.x, point1.y]) - np.array([point2.x, point2.y])
-    vec2 = np.array([point3.x, point3.y]) - np.array([point2.x, point2.y])
 
-    # Dot product
-    dot_product = np.dot(vec1, vec2)
+    points = [[point1.x, point1.y], [point2.x, point2.y], [point3.x, point3.y]]
+    return float(compute_angles(np.array(points), [(0, 1, 2)])[0])
 
-    # Magnitude of vectors
-    mag_vec1 = np.sqrt(np.dot(vec1, vec1))
-    mag_vec2 = np.sqrt(np.dot(vec2, vec2))
 
-    # Cosine of angle
-    cos_angle = dot_product / (mag_vec1 * mag_vec2)
-
-    # Angle in radians
-    angle_rad = np.arccos(cos_angle)
-
-    # Convert to degrees if needed
-    angle_deg = np.degrees(angle_rad)
-
-    return angle_deg
-
-
-def is_left_side(pose_landmarks: list) -> bool:
+def is_left_side(pose_landmarks: "list | LandmarkFrame") -> bool:
     """ Determines which shoulder is more visible on the first frame.
         This is used to asses if the user is face right or left.
-        input: pose_landmarks: A list of the NormalizedLandmarks
+        input: pose_landmarks: A list of the NormalizedLandmarks or a LandmarkFrame
         output: True if the user is facing left, false if right."""
-    if not isinstance(pose_landmarks,list):
+    if isinstance(pose_landmarks, LandmarkFrame):
+        return bool(pose_landmarks.visibility[13] > pose_landmarks.visibility[14])
+    if not isinstance(pose_landmarks, list):
         raise TypeError("Input must be a list.")
-    
-    left_elbow = Landmark(
-        x=pose_landmarks[13].x,
-        y=pose_landmarks[13].y,
-        visibility=pose_landmarks[13].visibility,
-    )
-    right_elbow = Landmark(
-        x=pose_landmarks[14].x,
-        y=pose_landmarks[14].y,
-        visibility=pose_landmarks[14].visibility,
-    )
-    if left_elbow.visibility > right_elbow.visibility:
-        print("left", left_elbow)
-        print("right", right_elbow)
-        return True
-
-    print("left", left_elbow)
-    print("right", right_elbow)
-    return False
+
+    return pose_landmarks[13].visibility > pose_landmarks[14].visibility
 
 
 def extend_row(row: list[dict[str,float]]) -> list:
@@ -78,8 +137,6 @@ def extend_row(row: list[dict[str,float]]) -> list:
     if not isinstance(row,list):
         raise TypeError(f"Input should be a list,{type(row)} received instead.")
     extended_row = []
-    print(f'row: {row}')
     for landmark in row:
-        print(f'landmark: {landmark}')
         extended_row.extend([landmark["x"], landmark["y"]])
     return extended_row
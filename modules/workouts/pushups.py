@@ -1,11 +1,16 @@
 from modules.workouts.workoutParent import Workout
 import numpy as np
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 
 
 class PushUps(Workout):
     """Pushups workout class implementing the Workout interface."""
 
+    # angle counting the reps and its thresholds (degrees)
+    rep_angle: str = "elbow"
+    down_threshold: int = 90
+    up_threshold: int = 150
+
     def update_indices(self) -> None:
         self.shoulder_idx: int = 11 if self.left_side else 12
         self.elbow_idx: int = 13 if self.left_side else 14
@@ -15,72 +20,54 @@ class PushUps(Workout):
         self.knee_idx: int = 25 if self.left_side else 26
         self.toes_idx: int = 31 if self.left_side else 32
 
+    def get_angle_triples(self) -> Dict[str, Tuple[int, int, int]]:
+        return {
+            "elbow": (self.wrist_idx, self.elbow_idx, self.shoulder_idx),
+            "body": (self.shoulder_idx, self.hip_idx, self.knee_idx),
+        }
+
     def count_reps(self) -> int:
         # handles the logic of when to determine if pu is counted
-        angle: float = self._compute_and_store_angle(
-            "elbow", self.wrist_idx, self.elbow_idx, self.shoulder_idx
-        )
-        count: int = self.incr_count(angle, down_threshold=90, up_threshold=150)
-        print("down", self.down)
+        angle: float = self.angles[self.rep_angle]
+        count: int = self.incr_count(angle, self.down_threshold, self.up_threshold)
         return count
 
-    def get_form(self) -> bool:
+    def form_issues(
+        self,
+        xy: np.ndarray,
+        angles: Dict[str, np.ndarray],
+        down: np.ndarray,
+        deviation: "float | np.ndarray",
+    ) -> List[Tuple[str, np.ndarray]]:
         """starting form for pu:
         1) shoulders above wrists
         2) knees not on floor (y knees > y wrist)
         3) hips wide open
         """
-        # get the landmarks
-        wrist = self._get_landmark(self.wrist_idx)
-        shoulder = self._get_landmark(self.shoulder_idx)
-        knee = self._get_landmark(self.knee_idx)
-        toes = self._get_landmark(self.toes_idx)
-
-        # compute the angles
-        self._compute_and_store_angle(
-            "body", self.shoulder_idx, self.hip_idx, self.knee_idx
+        # get the landmarks, rounded like the python floats they were read as
+        xy = np.asarray(xy, dtype=np.float64)
+        wrist_x, shoulder_x = xy[:, [self.wrist_idx, self.shoulder_idx], 0].round(1).T
+        wrist_y, knee_y, toes_y = (
+            xy[:, [self.wrist_idx, self.knee_idx, self.toes_idx], 1].round(2).T
         )
-        angle_elbow: float = self.angles["elbow"]
 
         # compute form criteria
         variation: int = 5
         goal_all_body: int = 180
-        deviations: float = self.get_strictness_deviation()
         elbow_threshold: float = 165
 
         # compute the form criterions
-        body_aligned: bool = (
-            self.angles["body"] > goal_all_body - (deviations + variation)
-            and self.angles["body"] < goal_all_body + deviations + variation
+        body_aligned = (angles["body"] > goal_all_body - (deviation + variation)) & (
+            angles["body"] < goal_all_body + deviation + variation
         )
-        shoulders_aligned: bool = (
-            np.round(wrist.x, 1) == np.round(shoulder.x, 1)
-            or angle_elbow <= elbow_threshold
-        )
-
-        knees_up: bool = np.round(knee.y, 2) < min(
-            np.round(wrist.y, 2), np.round(toes.y, 2)
-        )
-        print(
-            f"knees:{np.round(knee.y, 2)}, wrist: {np.round(wrist.y, 2)}, toes: {np.round(toes.y, 2)}"
-        )
-
-        # Determine form and fixes
-        form_issues: list = []
-        if not shoulders_aligned:
-            form_issues.append("shoulders not aligned with wrists")
-        if not knees_up:
-            form_issues.append("knees on floor")
-        if not body_aligned:
-            form_issues.append("body not straight")
-
-        # Set form feedback
+        shoulders_aligned = (wrist_x == shoulder_x) | (angles["elbow"] <= elbow_threshold)
+        knees_up = knee_y < np.minimum(wrist_y, toes_y)
 
-        if form_issues:
-            self.fix_form = ", ".join(form_issues)
-            return False
-        self.fix_form = "Good form"
-        return True
+        return [
+            ("shoulders not aligned with wrists", ~shoulders_aligned),
+            ("knees on floor", ~knees_up),
+            ("body not straight", ~body_aligned),
+        ]
 
     def get_display_angles(self) -> List[Dict[str, Any]]:
         """Returns data for angles to be displayed (Elbow and Body)."""
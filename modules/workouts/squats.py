@@ -1,12 +1,18 @@
 from modules.workouts.workoutParent import Workout
 import numpy as np
-from typing import List, Dict, Any
-from modules.utils import Landmark
+from typing import List, Dict, Any, Tuple
 
 
 class Squats(Workout):
     """Squats workout class implementing the Workout interface."""
 
+    good_form: str = "Good form! Keep Going!"
+
+    # angle counting the reps and its thresholds (degrees)
+    rep_angle: str = "knee"
+    down_threshold: int = 90
+    up_threshold: int = 150
+
     def update_indices(self) -> None:
         self.shoulder_idx: int = 11 if self.left_side else 12
         self.wrist_idx: int = 15 if self.left_side else 16
@@ -15,16 +21,25 @@ class Squats(Workout):
         self.knee_idx: int = 25 if self.left_side else 26
         self.toes_idx: int = 31 if self.left_side else 32
 
+    def get_angle_triples(self) -> Dict[str, Tuple[int, int, int]]:
+        return {
+            "knee": (self.ankle_idx, self.knee_idx, self.hip_idx),
+            "hips": (self.shoulder_idx, self.hip_idx, self.knee_idx),
+        }
+
     def count_reps(self) -> int:
         # handles the logic of when to determine if squat is counted
-        angle = self._compute_and_store_angle(
-            "knee", self.ankle_idx, self.knee_idx, self.hip_idx
-        )
-        count: int = self.incr_count(angle, down_threshold=90, up_threshold=150)
-        print("down", self.down)
+        angle: float = self.angles[self.rep_angle]
+        count: int = self.incr_count(angle, self.down_threshold, self.up_threshold)
         return count
 
-    def get_form(self) -> bool:
+    def form_issues(
+        self,
+        xy: np.ndarray,
+        angles: Dict[str, np.ndarray],
+        down: np.ndarray,
+        deviation: "float | np.ndarray",
+    ) -> List[Tuple[str, np.ndarray]]:
         """starting form for squats:
         1) knees to feet:
             if up: knees aligned with ankles
@@ -34,77 +49,48 @@ class Squats(Workout):
             if down: hips angle (ankle, knee, hip) < 90 > 45
         3) shoulders over ankles
         """
-        # get the landmarks
-        ankle: Landmark = self._get_landmark(self.ankle_idx)
-        knee: Landmark = self._get_landmark(self.knee_idx)
-        shoulder: Landmark = self._get_landmark(self.shoulder_idx)
-        toes: Landmark = self._get_landmark(self.toes_idx)
+        # get the landmarks, rounded like the python floats they were read as
+        points = [self.ankle_idx, self.knee_idx, self.shoulder_idx, self.toes_idx]
+        ankle_x, knee_x, shoulder_x, toes_x = (
+            np.asarray(xy, dtype=np.float64)[:, points, 0].round(1).T
+        )
 
-        # get the parameters
+        # get the parameters, the thresholds of the reps (a re-scoring can tune them)
         variation: int = 5
-        deviation: float = self.get_strictness_deviation()
-        up_threshold: int = 150
-        down_threshold: int = 90
+        up_threshold: int = self.up_threshold
+        down_threshold: int = self.down_threshold
 
         # Get the angles
-        hips_angle: float = self._compute_and_store_angle(
-            "hips", self.shoulder_idx, self.hip_idx, self.knee_idx
-        )
+        knee_angle: np.ndarray = angles["knee"]
+        hips_angle: np.ndarray = angles["hips"]
 
         # conditions
-        knee_to_foot: bool = False
-        hips_angles_bool: bool = False
-        shoulders_over_ankles: bool = (
-            np.round(shoulder.x, 1) - np.round(ankle.x, 1) < variation
+        shoulders_over_ankles = shoulder_x - ankle_x < variation
+        knee_to_foot = np.where(
+            down, knee_x - toes_x < variation, knee_x - ankle_x < variation
+        )
+        hips_angles_bool = np.where(
+            down,
+            # between the thresholds any hips angle is fine
+            ((knee_angle < up_threshold) & (knee_angle > down_threshold))
+            | ((45 - deviation < hips_angle) & (hips_angle < 90 + deviation)),
+            # standing up
+            (knee_angle <= up_threshold) | ((180 - hips_angle) < deviation),
         )
 
-        if not self.down:
-            knee_to_foot = np.round(knee.x, 1) - np.round(ankle.x, 1) < variation
-            if self.angles["knee"] > up_threshold:
-                print(f'moving state: {self.angles["knee"]> up_threshold}')
-                hips_angles_bool = (180 - hips_angle) < deviation
-            else:
-                hips_angles_bool = True
-        else:
-            knee_to_foot = np.round(knee.x, 1) - np.round(toes.x, 1) < variation
-            if (
-                self.angles["knee"] < up_threshold
-                and self.angles["knee"] > down_threshold
-            ):
-                print(
-                    f'moving state: {self.angles["knee"]< up_threshold and self.angles["knee"] > down_threshold}'
-                )
-                hips_angles_bool = True
-            else:
-                hips_angles_bool = 45 - deviation < hips_angle < (90 + deviation)
-
-        # Determine form and fixes
-        form_issues: list = []
-        if not knee_to_foot:
-            if self.down:
-                form_issues.append("knees not aligned with toes")
-            else:
-                form_issues.append("knees not aligned with ankles")
-
-        if not hips_angles_bool:
-            if self.down:
-                form_issues.append(
-                    f"hips angle not between 45 and 90 degrees (angle: {hips_angle:.1f} degrees)"
-                )
-            else:
-                form_issues.append(
-                    f"You are not standing straight (angle: {hips_angle:.1f} degrees)"
-                )
-
-        if not shoulders_over_ankles:
-            form_issues.append("your shoulders are not over your ankles")
-
-        # Set form feedback
-        if form_issues:
-            self.fix_form = ", ".join(form_issues)
-            return False
-        self.fix_form = "Good form! Keep Going!"
-        return True
+        return [
+            ("knees not aligned with toes", ~knee_to_foot & down),
+            ("knees not aligned with ankles", ~knee_to_foot & ~down),
+            (
+                "hips angle not between 45 and 90 degrees (angle: {hips:.1f} degrees)",
+                ~hips_angles_bool & down,
+            ),
+            (
+                "You are not standing straight (angle: {hips:.1f} degrees)",
+                ~hips_angles_bool & ~down,
+            ),
+            ("your shoulders are not over your ankles", ~shoulders_over_ankles),
+        ]
 
     def get_display_angles(self) -> List[Dict[str, Any]]:
         """Return data needed for displaying angles."""
@@ -1,11 +1,19 @@
 from abc import abstractmethod
-from typing import List, Dict, Any
-from modules.utils import Landmark
+from typing import List, Dict, Any, Tuple
+import numpy as np
+from modules.utils import Landmark, LandmarkFrame, compute_angles
 
 
 class Workout:
     """Base class for all workout types."""
 
+    # angle counting the reps and its thresholds (degrees), set by the child classes
+    rep_angle: str = ""
+    down_threshold: int = 90
+    up_threshold: int = 150
+    # form message of a frame without issues
+    good_form: str = "Good form"
+
     def __init__(
         self, goal_reps: int, ldmrk_res, left_side: bool, strictness_crit: str = "loose"
     ):
@@ -13,6 +21,7 @@ class Workout:
         self.down: bool = False
         self.goal_reps: int = goal_reps
         self.ldmrk_res = ldmrk_res
+        self.frame: LandmarkFrame | None = None
         self.left_side: bool = left_side
         self.strictness_crit: str = strictness_crit
         self.down: bool = False
@@ -24,11 +33,29 @@ class Workout:
 
     def set_res(self, ldmrk_res):
         """
-        description: set the pose landmarks result from the mediapipe model
-        input: ldmrk_res: list of pose landmarks
+        description: set the pose landmarks result from the mediapipe model and
+        compute all the angles of the workout for this frame in one call.
+        input: ldmrk_res: LandmarkFrame, or list of pose landmarks as returned by mediapipe
         output: None
         """
         self.ldmrk_res = ldmrk_res
+        if isinstance(ldmrk_res, LandmarkFrame):
+            self.frame = ldmrk_res
+        elif ldmrk_res and len(ldmrk_res) > 0:
+            self.frame = LandmarkFrame.from_landmarks(ldmrk_res[0])
+        else:
+            self.frame = None
+        self.update_angles()
+
+    def update_angles(self) -> Dict[str, float]:
+        """Compute every angle returned by get_angle_triples on the current frame."""
+        triples = self.get_angle_triples()
+        if self.frame is None:
+            self.angles = {name: 0.0 for name in triples}
+            return self.angles
+        values = compute_angles(self.frame, list(triples.values())).tolist()
+        self.angles = dict(zip(triples.keys(), values))
+        return self.angles
 
     def get_strictness_deviation(self) -> float:
         deviation_all_body: dict = {"strict": 5, "moderate": 10, "loose": 15}
@@ -38,13 +65,60 @@ class Workout:
     def update_indices(self):
         """Abstract method to set the correct landmark indices based on self.left_side."""
 
+    @abstractmethod
+    def get_angle_triples(self) -> Dict[str, Tuple[int, int, int]]:
+        """
+        Abstract method to return the angles used by the workout.
+        Maps the angle name to the (idx1, joint_idx, idx3) landmark indices.
+        """
+
     @abstractmethod
     def count_reps(self) -> int:
         """Abstract method to calculate and return rep increment for the current frame."""
 
     @abstractmethod
+    def form_issues(
+        self,
+        xy: np.ndarray,
+        angles: Dict[str, np.ndarray],
+        down: np.ndarray,
+        deviation: "float | np.ndarray",
+    ) -> List[Tuple[str, np.ndarray]]:
+        """
+        Abstract method to evaluate the form rules over a block of frames.
+        Args:
+            xy (np.ndarray): (N, n_landmarks, 2) landmark coordinates.
+            angles (Dict[str, np.ndarray]): the (N,) series of every angle of get_angle_triples.
+            down (np.ndarray): (N,) down phase of every frame.
+            deviation (float | np.ndarray): the strictness deviation, per frame or for all.
+        Returns:
+            List[Tuple[str, np.ndarray]]: every issue in message order, with the (N,) mask of
+            the frames having it. A message may hold {angle name} fields, see describe_form.
+        """
+
     def get_form(self) -> bool:
-        """Abstract method to check form, update self.form and self.fix_form, and return form status."""
+        """Check the form of the current frame, update self.fix_form and return form status."""
+        if self.frame is None:
+            raise ValueError("No landmarks to check the form on.")
+        angles = {name: np.array([value]) for name, value in self.angles.items()}
+        issues = self.form_issues(
+            self.frame.xy[None], angles, np.array([self.down]), self.get_strictness_deviation()
+        )
+        self.fix_form = self.describe_form(issues, angles, 0)
+        return not any(mask[0] for _, mask in issues)
+
+    def describe_form(
+        self, issues: List[Tuple[str, np.ndarray]], angles: Dict[str, np.ndarray], index: int
+    ) -> str:
+        """Form message of a frame of a block evaluated by form_issues."""
+        messages = [
+            message.format(**{name: values[index] for name, values in angles.items()})
+            if "{" in message
+            else message
+            for message, mask in issues
+            if mask[index]
+        ]
+        return ", ".join(messages) if messages else self.good_form
 
     @abstractmethod
     def get_display_angles(self) -> List[Dict[str, Any]]:
@@ -54,37 +128,21 @@ class Workout:
         """
 
     def _get_landmark(self, index: int) -> Landmark:
-        """Helper to safely get a landmark from the results."""
-        if (
-            self.ldmrk_res
-            and len(self.ldmrk_res) > 0
-            and len(self.ldmrk_res[0]) > index
-        ):
-            return Landmark(
-                x=self.ldmrk_res[0][index].x,
-                y=self.ldmrk_res[0][index].y,
-                visibility=self.ldmrk_res[0][index].visibility,
-            )
+        """Helper to safely get a landmark from the results (API edges only)."""
+        if self.frame is not None and len(self.frame) > index:
+            return self.frame.landmark(index)
         raise ValueError(
             f"Landmark index {index} out of range for the current results."
         )
 
-    def _compute_and_store_angle(
-        self, name: str, idx1: int, idx2: int, idx3: int
-    ) -> float:
-        """Helper to compute angle between three landmarks and store it."""
-        pt1: Landmark = self._get_landmark(idx1)
-        pt2: Landmark = self._get_landmark(idx2)
-        pt3: Landmark = self._get_landmark(idx3)
-
-        if pt1 and pt2 and pt3:
-            from modules.utils import compute_angle
-
-            angle_value = compute_angle(pt1, pt2, pt3)
-            self.angles[name] = angle_value
-            return angle_value
-        self.angles[name] = 0.0  # Default if landmarks missing
-        return 0.0
+    def _get_xy(self, index: int) -> Tuple[float, float]:
+        """Helper to get the (x, y) coordinates of a landmark of the current frame."""
+        if self.frame is not None and len(self.frame) > index:
+            x, y = self.frame.xy[index].tolist()
+            return x, y
+        raise ValueError(
+            f"Landmark index {index} out of range for the current results."
+        )
 
     def incr_count(self, angle: float, down_threshold: int, up_threshold: int) -> int:
         "increases the count of rep by one or set the attribute down to true"
@@ -99,6 +157,18 @@ class Workout:
                     return 1
         return 0
 
+    def rep_margin(self) -> float | None:
+        """
+        Degrees left before the rep angle crosses the next threshold of incr_count: the
+        up threshold in the down phase, else the down threshold. None without a pose.
+        """
+        if self.frame is None or self.rep_angle not in self.angles:
+            return None
+        angle: float = self.angles[self.rep_angle]
+        if self.down:
+            return max(self.up_threshold - angle, 0.0)
+        return max(angle - self.down_threshold, 0.0)
+
     @abstractmethod
     def get_indices(self) -> Dict[str, int]:
         """
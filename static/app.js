@@ -28,6 +28,82 @@ const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
 const ws = new WebSocket(`${protocol}//${window.location.host}/ws`);
 ws.binaryType = "arraybuffer";
 
+// Ask the server for compact binary per-frame results instead of JSON
+const USE_BINARY_PROTOCOL = true;
+const BINARY_PROTOCOL = 'binary-v1';
+const textDecoder = new TextDecoder();
+
+// Encoding of the frames sent to the server: 'jpeg', 'webp' or 'raw-rgb'.
+// raw-rgb skips the encode/decode round trip at the cost of more bandwidth (LAN only).
+const FRAME_ENCODING = 'jpeg';
+const FRAME_SIZE = 256;
+const FRAME_MIME_TYPES = { jpeg: 'image/jpeg', webp: 'image/webp' };
+// Frames per second sent to the server, adjusted by its capture_rate hints (low between
+// the sets and when still, high close to a rep transition)
+const DEFAULT_CAPTURE_FPS = 10;
+const MIN_CAPTURE_FPS = 1;
+const MAX_CAPTURE_FPS = 30;
+let captureFps = DEFAULT_CAPTURE_FPS;
+
+// --- Binary result decoding (see modules/protocol.py for the layout) ---
+
+function halfToFloat(h) {
+    const sign = (h & 0x8000) ? -1 : 1;
+    const exponent = (h >> 10) & 0x1f;
+    const fraction = h & 0x03ff;
+    if (exponent === 0) return sign * Math.pow(2, -14) * (fraction / 1024);
+    if (exponent === 0x1f) return fraction ? NaN : sign * Infinity;
+    return sign * Math.pow(2, exponent - 15) * (1 + fraction / 1024);
+}
+
+function decodeAnalysis(buffer) {
+    const view = new DataView(buffer);
+    // magic "GB", version 1
+    if (view.getUint8(0) !== 0x47 || view.getUint8(1) !== 0x42 || view.getUint8(2) !== 1) return null;
+    const flags = view.getUint8(3);
+    const float32 = (flags & 8) !== 0;
+    const nLandmarks = view.getUint8(8);
+    const nAngles = view.getUint8(9);
+    const messageLength = view.getUint16(10, true);
+    let offset = 12;
+
+    const landmarks = [];
+    for (let i = 0; i < nLandmarks; i++) {
+        let x, y;
+        if (float32) {
+            x = view.getFloat32(offset, true);
+            y = view.getFloat32(offset + 4, true);
+            offset += 8;
+        } else {
+            x = halfToFloat(view.getUint16(offset, true));
+            y = halfToFloat(view.getUint16(offset + 2, true));
+            offset += 4;
+        }
+        landmarks.push({ x, y });
+    }
+
+    const displayAngles = [];
+    for (let i = 0; i < nAngles; i++) {
+        const value = view.getFloat32(offset, true);
+        const jointIndices = [view.getUint8(offset + 4), view.getUint8(offset + 5), view.getUint8(offset + 6)];
+        const nameLength = view.getUint8(offset + 7);
+        offset += 8;
+        const name = textDecoder.decode(new Uint8Array(buffer, offset, nameLength));
+        offset += nameLength;
+        displayAngles.push({ name, value, joint_indices: jointIndices });
+    }
+
+    return {
+        landmarks,
+        rep_count: view.getUint16(4, true),
+        goal_reps: view.getUint16(6, true),
+        form_ok: (flags & 1) !== 0,
+        is_down_phase: (flags & 2) !== 0,
+        form_message: textDecoder.decode(new Uint8Array(buffer, offset, messageLength)),
+        display_angles: displayAngles,
+    };
+}
+
 // --- Drawing Helpers ---
 
 // MediaPipe standard connections for drawing the skeleton
@@ -212,36 +288,43 @@ function resizeAndPad(videoElement, targetSize = 256) {
 }
 
 
+function canvasToRgb(canvas) {
+    // RGBA pixels of the canvas packed into tightly laid out RGB bytes
+    const rgba = canvas.getContext('2d').getImageData(0, 0, canvas.width, canvas.height).data;
+    const rgb = new Uint8Array((rgba.length / 4) * 3);
+    for (let i = 0, j = 0; i < rgba.length; i += 4, j += 3) {
+        rgb[j] = rgba[i];
+        rgb[j + 1] = rgba[i + 1];
+        rgb[j + 2] = rgba[i + 2];
+    }
+    return rgb;
+}
+
 function captureAndSendFrame() {
     if (!videoElement || !isCapturing || ws.readyState !== WebSocket.OPEN) return;
 
-   /* const tempCanvas = document.createElement('canvas');
-    tempCanvas.width = videoElement.videoWidth;
-    tempCanvas.height = videoElement.videoHeight;
-    const tempCtx = tempCanvas.getContext('2d');
-    tempCtx.drawImage(videoElement, 0, 0);*/
-
-    console.log(`Before resize: ${videoElement.videoWidth}x${videoElement.videoHeight}`);
-    const processedCanvas = resizeAndPad(videoElement, 256);
-    console.log(`After resize: ${processedCanvas.width}x${processedCanvas.height}`);
-    //tempCanvas.toBlob((blob) => {
-    processedCanvas.toBlob((blob) => {
-    if (blob) {
-        blob.arrayBuffer().then(buffer => ws.send(buffer));
+    const processedCanvas = resizeAndPad(videoElement, FRAME_SIZE);
+    if (FRAME_ENCODING === 'raw-rgb') {
+        ws.send(canvasToRgb(processedCanvas));
+        return;
     }
-}, 'image/jpeg', 0.8);
+    processedCanvas.toBlob((blob) => {
+        if (blob) {
+            blob.arrayBuffer().then(buffer => ws.send(buffer));
+        }
+    }, FRAME_MIME_TYPES[FRAME_ENCODING], 0.8);
 }
 
 
 function startFrameCapture() {
     isCapturing = true;
-    const captureInterval = setInterval(() => {
-        if (!isCapturing) {
-            clearInterval(captureInterval);
-            return;
-        }
+    // a timeout per frame, so a capture_rate hint of the server applies to the next one
+    const captureNextFrame = () => {
+        if (!isCapturing) return;
         captureAndSendFrame();
-    }, 100); // Send frames at 10 FPS
+        setTimeout(captureNextFrame, 1000 / captureFps);
+    };
+    captureNextFrame();
 }
 
 function renderLoop() {
@@ -269,27 +352,39 @@ function renderLoop() {
     requestAnimationFrame(renderLoop);
 }
 
+function handleAnalysisData(data) {
+    lastAnalysisData = data;
+    const currentReps = lastAnalysisData.rep_count;
+    const goalReps = lastAnalysisData.goal_reps;
+
+    if (currentReps > previousRepCount && currentReps != goalReps && goalReps>0) { // A rep was made
+            repCompleteSound.play().catch(e => console.error("Error playing rep sound:", e));
+        }
+        previousRepCount = currentReps;
+
+    // Reset flags and counts if workout is reset (e.g., goal_reps becomes 0, or rep_count is reset by server)
+    if (goalReps === 0 || currentReps === 0) {
+        previousRepCount = 0;
+        workoutCompletedSoundPlayed = false; // Reset flag
+    }
+}
+
 // WebSocket message handler
 ws.onmessage = (event) => {
-    if (typeof event.data === "string") {
+    if (event.data instanceof ArrayBuffer) {
+        // binary per-frame result, it also carries the rep count
+        const data = decodeAnalysis(event.data);
+        if (!data) return;
+        handleAnalysisData(data);
+        if (!completedSeries) {
+            updateStatus(`Current rep count: ${data.rep_count}`, "In Progress");
+        }
+    } else if (typeof event.data === "string") {
         const data = JSON.parse(event.data);
         console.log('Received:', data);
 
         if (data.landmarks) {
-            lastAnalysisData = data;
-            const currentReps = lastAnalysisData.rep_count;
-            const goalReps = lastAnalysisData.goal_reps;
-
-            if (currentReps > previousRepCount && currentReps != goalReps && goalReps>0) { // A rep was made
-                    repCompleteSound.play().catch(e => console.error("Error playing rep sound:", e));
-                }
-                previousRepCount = currentReps;
-
-            // Reset flags and counts if workout is reset (e.g., goal_reps becomes 0, or rep_count is reset by server)
-            if (goalReps === 0 || currentReps === 0) {
-                previousRepCount = 0;
-                workoutCompletedSoundPlayed = false; // Reset flag
-            }
+            handleAnalysisData(data);
         } else if (data.type === 'data') {
             updateStatus(data.message, data.status);
             if (data.status === 'completed') {
@@ -300,10 +395,15 @@ ws.onmessage = (event) => {
                 workoutCompletedSoundPlayed = false; // Reset flag for the next workout session
                 completedSeries = true; // Mark series as completed
             }
+        } else if (data.type === 'capture_rate') {
+            captureFps = Math.min(Math.max(Number(data.fps) || DEFAULT_CAPTURE_FPS, MIN_CAPTURE_FPS), MAX_CAPTURE_FPS);
         } else if (data.type === 'history') {
             updateHistory(data.message);
+        } else if (data.type === 'feedback_partial') {
+            showPartialFeedback(data.fields);
         } else if (data.type === 'feedback') {
-            addFeedbackToHistory(data.message);
+            // the rule-based feedback is replaced by the LLM one when it arrives
+            addFeedbackToHistory(data.message, data.source);
         }
         console.log("Updated status:", data.message, "Status:", data.status);
     }
@@ -325,13 +425,34 @@ function updateHistory(htmlContent) {
     }
 }
 
-function addFeedbackToHistory(feedback) {
-    console.log('Feedback received:', feedback);
-    
-    if (!feedback || feedback.trim() === '') {
-        return;
+function escapeHtml(text) {
+    const div = document.createElement('div');
+    div.textContent = text;
+    return div.innerHTML;
+}
+
+// Fields of the feedback shown while it is generated, in the order of the final layout
+const PARTIAL_FEEDBACK_FIELDS = [
+    ['encouragement', '💪'],
+    ['positive_point', '🔥'],
+    ['summary', '🏋️'],
+    ['main_feedback', '🔎'],
+    ['secondary_feedback', ''],
+];
+
+function showPartialFeedback(fields) {
+    if (!fields) return;
+    const paragraphs = PARTIAL_FEEDBACK_FIELDS
+        .filter(([name]) => fields[name])
+        .map(([name, icon]) => `<p>${icon} ${escapeHtml(String(fields[name]))}</p>`);
+    if (paragraphs.length === 0) return;
+    const feedbackContent = getFeedbackContent();
+    if (feedbackContent) {
+        feedbackContent.innerHTML = `<div class="feedback-item feedback-partial">${paragraphs.join('')}</div>`;
     }
-    
+}
+
+function getFeedbackContent() {
     // Create or find feedback section
     let feedbackSection = document.querySelector('.feedback-section');
     
@@ -346,8 +467,17 @@ function addFeedbackToHistory(feedback) {
             historyDiv.parentNode.insertBefore(feedbackSection, historyDiv.nextSibling);
         }
     }
-    
-    const feedbackContent = feedbackSection.querySelector('.feedback-content');
+    return feedbackSection.querySelector('.feedback-content');
+}
+
+function addFeedbackToHistory(feedback, source = 'llm') {
+    console.log('Feedback received:', feedback);
+
+    if (!feedback || feedback.trim() === '') {
+        return;
+    }
+
+    const feedbackContent = getFeedbackContent();
     if (feedbackContent) {
         feedbackContent.innerHTML = `<div class="feedback-item">${feedback}</div>`;
         
@@ -356,7 +486,7 @@ function addFeedbackToHistory(feedback) {
         if (feedbackItem) {
             feedbackItem.style.padding = '10px';
             feedbackItem.style.backgroundColor = '#e8f5e8';
-            feedbackItem.style.border = '1px solid #4caf50';
+            feedbackItem.style.border = source === 'local' ? '1px dashed #4caf50' : '1px solid #4caf50';
             feedbackItem.style.borderRadius = '5px';
             feedbackItem.style.marginTop = '10px';
             feedbackItem.style.animation = 'fadeIn 0.5s ease-in-out';
@@ -405,10 +535,28 @@ goButton?.addEventListener('click', () => {
 // WebSocket event handlers
 ws.onopen = () => {
     console.log("WebSocket connected");
+    if (USE_BINARY_PROTOCOL) {
+        ws.send(JSON.stringify({ type: 'protocol', value: BINARY_PROTOCOL }));
+    }
+    ws.send(JSON.stringify({
+        type: 'encoding', value: FRAME_ENCODING, width: FRAME_SIZE, height: FRAME_SIZE
+    }));
     initCamera();
 };
 
-ws.onclose = () => {
+ws.onclose = (event) => {
+    if (event.code === 1013) {
+        // the server is still warming up
+        updateStatus("Server starting, reconnecting...", "ready");
+        setTimeout(() => window.location.reload(), 2000);
+        return;
+    }
+    if (event.code === 1011) {
+        // the server failed to start, reloading would not help
+        updateStatus("The server is unavailable. Please try again later.", "error");
+        isCapturing = false;
+        return;
+    }
     console.log("WebSocket disconnected");
     updateStatus("Connection lost. Please refresh the page.", "error");
     isCapturing = false;
@@ -0,0 +1,142 @@
+"""
+Micro-benchmarks of the per-frame hot path.
+
+They are skipped by the normal test run. Run them with:
+    python -m pytest tests/benchmarks --benchmark --benchmark-json=bench-results.json
+Each benchmark reports the median, min and mean time per call. A benchmark fails when its
+median is above its budget in thresholds.json multiplied by --benchmark-tolerance.
+"""
+
+import json
+import os
+import platform
+import statistics
+import time
+from datetime import datetime
+from typing import Any, Callable
+import pytest
+
+THRESHOLDS_PATH: str = os.path.join(os.path.dirname(__file__), "thresholds.json")
+
+_RESULTS: list[dict[str, Any]] = []
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("benchmarks")
+    group.addoption(
+        "--benchmark", action="store_true", help="run the micro-benchmarks"
+    )
+    group.addoption(
+        "--benchmark-json", default=None, help="write the results to this JSON file"
+    )
+    group.addoption(
+        "--benchmark-thresholds",
+        default=THRESHOLDS_PATH,
+        help="JSON file mapping the benchmark names to their median budget in µs",
+    )
+    group.addoption(
+        "--benchmark-tolerance",
+        type=float,
+        default=1.0,
+        help="multiplier applied to the budgets (e.g. 2 on a slow CI machine)",
+    )
+    group.addoption(
+        "--benchmark-rounds", type=int, default=15, help="timed rounds per benchmark"
+    )
+
+
+class BenchmarkRunner:
+    """Times a callable with timeit-style rounds and checks it against its budget."""
+
+    def __init__(self, config):
+        self.rounds: int = config.getoption("--benchmark-rounds")
+        self.tolerance: float = config.getoption("--benchmark-tolerance")
+        with open(config.getoption("--benchmark-thresholds")) as f:
+            self.thresholds: dict[str, float] = json.load(f)
+
+    def __call__(
+        self, name: str, func: Callable[[], Any], min_round_time: float = 0.005
+    ) -> dict[str, Any]:
+        """
+        Benchmark func, called without arguments.
+        Args:
+            name (str): name of the benchmark, the key of its budget in the thresholds.
+            func (Callable[[], Any]): the code to time.
+            min_round_time (float): the calls per round are calibrated to last at least this long.
+        Returns:
+            dict[str, Any]: the result, times are in µs per call.
+        """
+        func()  # warm up
+        number = 1
+        while True:
+            start = time.perf_counter()
+            for _ in range(number):
+                func()
+            if time.perf_counter() - start >= min_round_time or number >= 1 << 20:
+                break
+            number *= 2
+        timings = []
+        for _ in range(self.rounds):
+            start = time.perf_counter()
+            for _ in range(number):
+                func()
+            timings.append((time.perf_counter() - start) / number * 1e6)
+        threshold = self.thresholds.get(name)
+        result = {
+            "name": name,
+            "median_us": statistics.median(timings),
+            "min_us": min(timings),
+            "mean_us": statistics.fmean(timings),
+            "stdev_us": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+            "rounds": self.rounds,
+            "calls_per_round": number,
+            "threshold_us": threshold,
+        }
+        _RESULTS.append(result)
+        if threshold is not None:
+            budget = threshold * self.tolerance
+            assert result["median_us"] <= budget, (
+                f"{name}: median {result['median_us']:.1f} µs over its {budget:.1f} µs budget"
+            )
+        return result
+
+
+@pytest.fixture
+def bench(request) -> BenchmarkRunner:
+    if not request.config.getoption("--benchmark", default=False):
+        pytest.skip("benchmarks only run with --benchmark")
+    return BenchmarkRunner(request.config)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    path = session.config.getoption("--benchmark-json", default=None)
+    if not path or not _RESULTS:
+        return
+    with open(path, "w") as f:
+        json.dump(
+            {
+                "datetime": datetime.now().isoformat(),
+                "machine": {
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "processor": platform.processor(),
+                    "cpu_count": os.cpu_count(),
+                },
+                "benchmarks": _RESULTS,
+            },
+            f,
+            indent=2,
+        )
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not _RESULTS:
+        return
+    terminalreporter.section("benchmarks (µs per call)")
+    for result in _RESULTS:
+        budget = result["threshold_us"]
+        terminalreporter.write_line(
+            f"{result['name']:<48} median {result['median_us']:>10.1f}"
+            f"  min {result['min_us']:>10.1f}"
+            f"  budget {budget if budget is not None else '-':>8}"
+        )
@@ -0,0 +1,147 @@
+from datetime import datetime
+import cv2
+import numpy as np
+import pytest
+from modules.buffers import FrameBuffer
+from modules.db_setup import connect_in_memory_db, save_data_to_db
+from modules.gymBuddy import GymBuddy
+from modules.utils import Landmark, LandmarkFrame, compute_angle
+from modules.workouts.pushups import PushUps
+from modules.workouts.squats import Squats
+
+METADATA = {
+    "workout_name": "push-ups",
+    "timestamp_start": datetime.now(),
+    "rep_goal": 10,
+    "series_number": 1,
+    "strictness_crit": "loose",
+    "strictness_definition": 15,
+    "left_side": False,
+    "ldmrks_keys": ["shoulder", "elbow", "wrist"],
+    "ldmrks_values": [12, 14, 16],
+}
+
+
+class _Point:
+    def __init__(self, x, y, visibility):
+        self.x, self.y, self.visibility = x, y, visibility
+
+
+class _Result:
+    def __init__(self, pose_landmarks):
+        self.pose_landmarks = pose_landmarks
+
+
+class StubLandmarker:
+    """Stands in for the pose model: a fixed pose, so only the code around it is timed."""
+
+    def __init__(self, frame: LandmarkFrame):
+        self.points = [_Point(x, y, v) for x, y, v in frame.data.tolist()]
+
+    def detect_for_video(self, mp_image, timestamp):
+        return _Result([self.points])
+
+
+def pose_frame(seed: int = 0) -> LandmarkFrame:
+    """A plausible push-up pose, seen from the right side."""
+    data = np.random.default_rng(seed).random((33, 3), dtype=np.float32)
+    data[:, 2] = 0.9
+    # wrist 16, elbow 14, shoulder 12, hip 24, knee 26, ankle 28, toes 32
+    for idx, (x, y) in {
+        16: (0.30, 0.90),
+        14: (0.32, 0.70),
+        12: (0.30, 0.50),
+        24: (0.60, 0.55),
+        26: (0.80, 0.60),
+        28: (0.95, 0.65),
+        32: (1.00, 0.70),
+    }.items():
+        data[idx, :2] = (x, y)
+    return LandmarkFrame(data)
+
+
+def sample_frame(width: int, height: int) -> bytes:
+    """A JPEG like the ones sent by the client: smooth content, quality 80."""
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    image = np.stack([x + 0 * y, 0 * x + y, (x + y) / 2], axis=-1).astype(np.uint8)
+    cv2.circle(image, (width // 2, height // 2), min(width, height) // 4, (30, 200, 60), -1)
+    ok, data = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 80])
+    assert ok
+    return data.tobytes()
+
+
+def set_frames(n: int):
+    buffer = FrameBuffer(capacity=n)
+    buffer.set_angles(["elbow", "body"], [(16, 14, 12), (12, 24, 26)])
+    rng = np.random.default_rng(0)
+    for i in range(n):
+        buffer.append(
+            frame=i,
+            rep_count=i // 60,
+            down=bool((i // 30) % 2),
+            form_issues="Good form" if i % 5 else "body not straight",
+            angles=[90.0 + i % 60, 175.0],
+            landmarks=rng.random((33, 2), dtype=np.float32),
+        )
+    return buffer.view()
+
+
+def test_compute_angle(bench):
+    p1, p2, p3 = Landmark(x=0.3, y=0.9), Landmark(x=0.32, y=0.7), Landmark(x=0.3, y=0.5)
+    bench("utils.compute_angle", lambda: compute_angle(p1, p2, p3))
+
+
+def test_get_landmark(bench):
+    workout = PushUps(goal_reps=10, ldmrk_res=None, left_side=False)
+    workout.set_res(pose_frame())
+    bench("workout._get_landmark", lambda: workout._get_landmark(14))
+
+
+@pytest.mark.parametrize("workout_class", [PushUps, Squats])
+def test_workout_frame(bench, workout_class):
+    workout = workout_class(goal_reps=10, ldmrk_res=None, left_side=False)
+    frames = [pose_frame(seed) for seed in range(8)]
+    state = {"i": 0}
+
+    def step():
+        workout.set_res(frames[state["i"] % 8])
+        state["i"] += 1
+        workout.count_reps()
+        workout.form = workout.get_form()
+        workout.get_display_angles()
+
+    bench(f"{workout_class.__name__.lower()}.frame", step)
+
+
+@pytest.mark.parametrize("size", [(256, 256), (640, 480), (1280, 720)])
+def test_process_frame_from_bytes(bench, size):
+    buddy = GymBuddy(load_model=False)
+    data = sample_frame(*size)
+    bench(
+        f"gymbuddy.process_frame_from_bytes[{size[0]}x{size[1]}]",
+        lambda: buddy.process_frame_from_bytes(data),
+    )
+
+
+def test_detect_from_frame(bench):
+    buddy = GymBuddy(load_model=False)
+    buddy.model = StubLandmarker(pose_frame())
+    buddy.set_reps(10_000)
+    frame = buddy.process_frame_from_bytes(sample_frame(256, 256)).copy()
+    bench("gymbuddy.detect_from_frame[stub model]", lambda: buddy.detect_from_frame(frame))
+
+
+@pytest.mark.parametrize("n_frames", [300, 1800])
+def test_save_data_to_db(bench, n_frames):
+    # a 10 s and a 60 s set at 30 fps
+    conn = connect_in_memory_db()
+    frames = set_frames(n_frames)
+    try:
+        bench(
+            f"db_setup.save_data_to_db[{n_frames} frames]",
+            lambda: save_data_to_db(conn, METADATA, frames),
+            min_round_time=0.0,
+        )
+    finally:
+        conn.close()
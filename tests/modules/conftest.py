@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+from datetime import datetime
+from modules.buffers import FrameBuffer
+from modules.db_setup import connect_in_memory_db
+
+
+@pytest.fixture
+def conn():
+    conn = connect_in_memory_db()
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def metadata() -> dict:
+    """Metadata of a push-up set, as buffered by GymBuddy."""
+    return {
+        "workout_name": "push-ups",
+        "timestamp_start": datetime.now(),
+        "rep_goal": 2,
+        "series_number": 1,
+        "strictness_crit": "loose",
+        "strictness_definition": 15,
+        "left_side": False,
+        "ldmrks_keys": ["shoulder", "elbow", "wrist"],
+        "ldmrks_values": [12, 14, 16],
+    }
+
+
+@pytest.fixture
+def make_frames():
+    """
+    Builds the frames of a set: rep_count = frame // 50, every 4th frame has a form issue,
+    the elbow angle goes from 90 to 149 degrees.
+    """
+
+    def make(n: int):
+        buffer = FrameBuffer(capacity=16)
+        buffer.set_angles(["elbow", "body"], [(16, 14, 12), (12, 24, 28)])
+        for i in range(n):
+            buffer.append(
+                frame=i,
+                rep_count=i // 50,
+                down=bool(i % 2),
+                form_issues="Good form" if i % 4 else "body not straight",
+                angles=[90.0 + i % 60, 175.0],
+                landmarks=np.random.default_rng(i).random((33, 3), dtype=np.float32),
+            )
+        return buffer.view()
+
+    return make
+
+
+@pytest.fixture
+def feedback() -> dict:
+    """A complete answer of the LLM."""
+    return {
+        "encouragement": "Well done!",
+        "positive_point": "Steady pace.",
+        "main_feedback": "Keep your body straight.",
+        "secondary_feedback": "Go a bit lower.",
+        "summary": "Good set.",
+        "Rolling_Summary": "Set 1: 2 push-ups, body not straight.",
+    }
@@ -0,0 +1,131 @@
+from datetime import date
+import duckdb
+import pyarrow as pa
+import pytest
+from modules.archive import (
+    archive_scan,
+    archive_session,
+    arrow_ipc_stream,
+    create_archive_views,
+    has_archive,
+    query_archive,
+)
+from modules.db_setup import save_data_to_db
+
+
+def test_archive_session_moves_rows_to_partitioned_parquet(conn, tmp_path, metadata, make_frames):
+    archive_dir = str(tmp_path / "archive")
+    save_data_to_db(conn, dict(metadata, session_id="a"), make_frames(30))
+    save_data_to_db(conn, dict(metadata, session_id="a", series_number=2), make_frames(10))
+    save_data_to_db(conn, dict(metadata, session_id="b"), make_frames(5))
+
+    assert archive_session(conn, "a", archive_dir) == 2
+    assert archive_session(conn, "missing", archive_dir) == 0
+    # only the other session is left in the live tables
+    assert conn.sql("SELECT session_id FROM workout").fetchall() == [("b",)]
+    assert conn.sql("SELECT count(*) FROM raw_landmarks").fetchone() == (5,)
+    day = metadata["timestamp_start"].date().isoformat()
+    assert (tmp_path / "archive" / "raw_landmarks" / f"date={day}" / "workout=push-ups").is_dir()
+
+    assert create_archive_views(conn, archive_dir) == [
+        "archive_workout",
+        "archive_workout_analysis",
+        "archive_raw_landmarks",
+    ]
+    rows = conn.sql(
+        """SELECT w.series_number, count(*) FROM archive_raw_landmarks r
+        JOIN archive_workout w ON r.workout_id = w.id
+        WHERE r.session_id = 'a' GROUP BY ALL ORDER BY 1"""
+    ).fetchall()
+    assert rows == [(1, 30), (2, 10)]
+
+
+class FailingConnection:
+    """Runs the statements on conn, raises on the first one containing fail_on."""
+
+    def __init__(self, conn, fail_on: str):
+        self.conn, self.fail_on = conn, fail_on
+
+    def execute(self, sql, *args):
+        if self.fail_on is not None and self.fail_on in sql:
+            self.fail_on = None
+            raise duckdb.IOException("disk full")
+        return self.conn.execute(sql, *args)
+
+
+def archived_rows(conn, archive_dir: str, table: str) -> int:
+    return conn.sql(f"SELECT count(*) FROM {archive_scan(archive_dir, table)}").fetchone()[0]
+
+
+@pytest.mark.parametrize("fail_on", ["COPY", "DELETE FROM workout_analysis"])
+def test_failed_archiving_leaves_no_files(conn, tmp_path, fail_on, metadata, make_frames):
+    archive_dir = str(tmp_path / "archive")
+    save_data_to_db(conn, dict(metadata, session_id="a"), make_frames(30))
+    with pytest.raises(duckdb.IOException):
+        archive_session(FailingConnection(conn, fail_on), "a", archive_dir)
+    assert not has_archive(archive_dir, "raw_landmarks")
+    assert conn.sql("SELECT count(*) FROM raw_landmarks").fetchone() == (30,)
+    # the retry archives every row once
+    assert archive_session(conn, "a", archive_dir) == 1
+    assert archived_rows(conn, archive_dir, "raw_landmarks") == 30
+
+
+def test_interrupted_archiving_is_finished_by_a_retry(conn, tmp_path, metadata, make_frames):
+    archive_dir = str(tmp_path / "archive")
+    save_data_to_db(conn, dict(metadata, session_id="a"), make_frames(30))
+    with pytest.raises(duckdb.IOException):
+        archive_session(FailingConnection(conn, "DELETE FROM workout "), "a", archive_dir)
+    # the frames are archived, the live workout row is left
+    assert conn.sql("SELECT count(*) FROM workout_analysis").fetchone() == (0,)
+    assert conn.sql("SELECT count(*) FROM workout").fetchone() == (1,)
+    assert archive_session(conn, "a", archive_dir) == 1
+    assert conn.sql("SELECT count(*) FROM workout").fetchone() == (0,)
+    for table, rows in (("workout", 1), ("workout_analysis", 30), ("raw_landmarks", 30)):
+        assert archived_rows(conn, archive_dir, table) == rows
+
+
+def test_arrow_ipc_export(conn, tmp_path, metadata, make_frames):
+    archive_dir = str(tmp_path / "archive")
+    assert not has_archive(archive_dir, "workout_analysis")
+    save_data_to_db(conn, dict(metadata, session_id="a"), make_frames(50))
+    archive_session(conn, "a", archive_dir)
+
+    reader = query_archive(conn, "workout_analysis", archive_dir, session_id="a", batch_rows=16)
+    table = pa.ipc.open_stream(b"".join(arrow_ipc_stream(reader))).read_all()
+    assert table.num_rows == 50
+    assert {"session_id", "angles_data", "date", "workout"} <= set(table.column_names)
+
+    today = metadata["timestamp_start"].date()
+    empty = query_archive(conn, "workout_analysis", archive_dir, end=date(today.year - 1, 1, 1))
+    assert empty.read_all().num_rows == 0
+    with pytest.raises(ValueError):
+        query_archive(conn, "workout; DROP TABLE workout", archive_dir)
+
+
+def test_export_scoped_to_the_user(conn, tmp_path, metadata, make_frames):
+    archive_dir = str(tmp_path / "archive")
+    save_data_to_db(conn, dict(metadata, session_id="a", user_id="ann"), make_frames(20))
+    save_data_to_db(conn, dict(metadata, session_id="b", user_id="bob"), make_frames(5))
+    archive_session(conn, "a", archive_dir)
+    archive_session(conn, "b", archive_dir)
+    for table in ("workout", "workout_analysis", "raw_landmarks"):
+        rows = query_archive(conn, table, archive_dir, user_id="bob").read_all()
+        assert set(rows.column("session_id").to_pylist()) == {"b"}
+    # another user's session is not returned
+    other = query_archive(conn, "raw_landmarks", archive_dir, user_id="bob", session_id="a")
+    assert other.read_all().num_rows == 0
+
+
+def test_feedback_extraction_does_not_block_archiving(conn, tmp_path, monkeypatch, metadata, make_frames):
+    from modules.feedbackAgent import FeedbackAgent
+
+    monkeypatch.setenv("GOOGLE_API_KEY", "test")
+    save_data_to_db(conn, dict(metadata, session_id="s"), make_frames(120))
+    # the agent reads on a session cursor, the archive runs on the writer connection
+    agent = FeedbackAgent(conn.cursor(), session_id="s")
+    id_frame = agent.get_id_frame()
+    agent.id_used, agent.frame_start = id_frame["id"], id_frame["frame_start"]
+    agent.metadata = agent.extract_metadata()
+    assert agent.extract_analysis()["total_repetitions"] == 2
+    assert archive_session(conn, "s", str(tmp_path / "archive")) == 1
+    assert conn.sql("SELECT count(*) FROM workout").fetchone() == (0,)
@@ -0,0 +1,133 @@
+import cv2
+import duckdb
+import numpy as np
+import pytest
+from modules import batch
+from modules.batch import analyze_videos, split_chunks
+
+
+class _Point:
+    def __init__(self, x, y, visibility):
+        self.x, self.y, self.visibility = x, y, visibility
+
+
+class _Result:
+    def __init__(self, pose_landmarks):
+        self.pose_landmarks = pose_landmarks
+
+
+def pushup_pose(elbow_angle: float) -> list[_Point]:
+    """Right side push-up pose with the given elbow angle, in good form."""
+    points = [_Point(0.5, 0.5, 0.9) for _ in range(33)]
+    angle = np.deg2rad(elbow_angle)
+    points[14] = _Point(0.5, 0.5, 0.9)
+    points[16] = _Point(0.5, 0.7, 0.9)
+    points[12] = _Point(0.5 + 0.2 * np.sin(angle), 0.5 + 0.2 * np.cos(angle), 0.9)
+    points[24] = _Point(0.8, 0.45, 0.9)
+    points[26] = _Point(0.9, 0.3, 0.9)
+    points[32] = _Point(1.0, 0.9, 0.9)
+    return points
+
+
+class BrightnessLandmarker:
+    """Down pose on dark frames, up pose on bright ones, no pose on mid-grey ones."""
+
+    def __init__(self):
+        self.last_timestamp = -1
+
+    def detect_for_video(self, mp_image, timestamp):
+        assert timestamp > self.last_timestamp
+        self.last_timestamp = timestamp
+        mean = mp_image.numpy_view().mean()
+        if 100 < mean < 150:
+            return _Result([])
+        return _Result([pushup_pose(80 if mean < 100 else 170)])
+
+    def close(self):
+        pass
+
+
+def brightness_factory(model_path):
+    return BrightnessLandmarker()
+
+
+def failing_factory(model_path):
+    raise RuntimeError("model not found")
+
+
+@pytest.fixture
+def video(tmp_path):
+    # 6 reps at 10 fps: 5 bright (up) frames then 5 dark (down) ones, a frame without
+    # pose at the start
+    path = str(tmp_path / "set.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 10, (64, 64))
+    writer.write(np.full((64, 64, 3), 128, dtype=np.uint8))
+    for _ in range(6):
+        for value in (230, 20):
+            for _ in range(5):
+                writer.write(np.full((64, 64, 3), value, dtype=np.uint8))
+    writer.write(np.full((64, 64, 3), 230, dtype=np.uint8))
+    writer.release()
+    return path
+
+
+def test_split_chunks():
+    assert split_chunks(10, 4) == [(0, 4), (4, 8), (8, 10)]
+    assert split_chunks(0, 4) == []
+
+
+def test_chunked_analysis_counts_reps_across_boundaries(video, tmp_path):
+    db_path = str(tmp_path / "batch.duckdb")
+    # 1.3 s chunks cut the reps at different phases
+    summaries = analyze_videos(
+        [video, video],
+        db_path=db_path,
+        goal_reps=6,
+        workers=2,
+        chunk_seconds=1.3,
+        overlap_seconds=0.5,
+        landmarker_factory=brightness_factory,
+    )
+    assert [s["reps"] for s in summaries] == [6, 6]
+    assert [s["detected_frames"] for s in summaries] == [61, 61]
+    assert all(s["saved"] for s in summaries)
+
+    conn = duckdb.connect(db_path)
+    try:
+        assert conn.sql(
+            "SELECT series_number FROM workout ORDER BY id"
+        ).fetchall() == [(1,), (2,)]
+        frames, span = conn.sql(
+            """SELECT count(*), epoch(max(timestamp) - min(timestamp))
+            FROM workout_analysis WHERE workout_id = (SELECT min(id) FROM workout)"""
+        ).fetchone()
+        assert frames == 61
+        # timestamps follow the video time (frames 1 to 61 at 10 fps)
+        assert span == pytest.approx(6.0)
+        assert conn.sql("SELECT max(rep_count) FROM workout_analysis").fetchone()[0] == 6
+    finally:
+        conn.close()
+
+
+def test_store_closed_when_a_video_fails(video, tmp_path, monkeypatch):
+    stores = []
+
+    class RecordingStore(batch.DuckDBStore):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.closed = False
+            stores.append(self)
+
+        def close(self):
+            self.closed = True
+            super().close()
+
+    monkeypatch.setattr(batch, "DuckDBStore", RecordingStore)
+    with pytest.raises(RuntimeError, match="model not found"):
+        analyze_videos(
+            [video],
+            db_path=str(tmp_path / "batch.duckdb"),
+            workers=1,
+            landmarker_factory=failing_factory,
+        )
+    assert len(stores) == 1 and stores[0].closed
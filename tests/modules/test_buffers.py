@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+from modules.buffers import FrameBuffer
+
+
+def fill(buffer: FrameBuffer, n: int) -> None:
+    buffer.set_angles(["elbow", "body"], [(16, 14, 12), (12, 24, 28)])
+    for i in range(n):
+        buffer.append(
+            frame=i,
+            rep_count=i // 10,
+            down=bool(i % 2),
+            form_issues="Good form" if i % 3 else "knees on floor",
+            angles=[float(i), 180.0 - i],
+            landmarks=np.full((33, 3), i, dtype=np.float32),
+        )
+
+
+def test_append_and_view():
+    buffer = FrameBuffer(capacity=4)
+    fill(buffer, 25)
+    frames = buffer.view()
+    assert len(frames) == len(buffer) == 25
+    assert buffer.capacity >= 25
+    assert frames.frame.tolist() == list(range(25))
+    assert frames.rep_count[-1] == 2
+    assert frames.angles.shape == (25, 2)
+    assert frames.angles[7].tolist() == [7.0, 173.0]
+    assert frames.landmarks.shape == (25, 33, 2)
+    assert frames.landmarks[24, 0].tolist() == [24.0, 24.0]
+    assert frames.form_issue_labels == ["knees on floor", "Good form"]
+    assert frames.form_issues()[:3] == ["knees on floor", "Good form", "Good form"]
+    assert np.all(np.diff(frames.timestamp_us) >= 0)
+
+
+def test_view_is_zero_copy():
+    buffer = FrameBuffer(capacity=8)
+    fill(buffer, 5)
+    frames = buffer.view()
+    assert np.shares_memory(frames.landmarks, buffer._landmarks)
+    assert np.shares_memory(frames.angles, buffer._angles)
+
+
+def test_clear_keeps_storage():
+    buffer = FrameBuffer(capacity=8)
+    fill(buffer, 20)
+    capacity = buffer.capacity
+    buffer.clear()
+    assert len(buffer) == 0
+    assert buffer.capacity == capacity
+    assert buffer.angle_names == [] and buffer.form_issue_labels == []
+
+
+def test_set_angles_non_empty_buffer():
+    buffer = FrameBuffer()
+    fill(buffer, 1)
+    with pytest.raises(ValueError):
+        buffer.set_angles(["knee"], [(27, 25, 23)])
+
+
+def test_take_hands_over_storage():
+    buffer = FrameBuffer(capacity=4)
+    fill(buffer, 10)
+    first = buffer.take()
+    assert len(first) == 10 and len(buffer) == 0
+    assert buffer.capacity == 4
+    buffer.append(
+        frame=10,
+        rep_count=1,
+        down=False,
+        form_issues="knees on floor",
+        angles=[1.0, 2.0],
+        landmarks=np.zeros((33, 2), dtype=np.float32),
+    )
+    second = buffer.take()
+    # the codes stay consistent across the batches of a set
+    assert second.form_issues() == ["knees on floor"]
+    assert second.form_issue_code[0] == first.form_issue_code[0]
+    assert not np.shares_memory(first.frame, second.frame)
+    assert first.frame.tolist() == list(range(10))
@@ -0,0 +1,48 @@
+import numpy as np
+from modules.capture_rate import (
+    HOLD_SECONDS,
+    IDLE_AFTER_SECONDS,
+    IDLE_FPS,
+    MOVING_FPS,
+    TRANSITION_FPS,
+    CaptureRateController,
+)
+from modules.utils import LandmarkFrame
+from modules.workouts.pushups import PushUps
+
+
+def workout_at(angle: float | None, down: bool = False) -> PushUps:
+    wo = PushUps(goal_reps=5, ldmrk_res=None, left_side=False)
+    if angle is not None:
+        wo.frame = LandmarkFrame(np.zeros((33, 3)))
+        wo.angles = {"elbow": angle, "body": 180.0}
+    wo.down = down
+    return wo
+
+
+def test_rate_follows_the_rep():
+    controller = CaptureRateController()
+    # between the sets
+    assert controller.update(workout_at(None), detecting=False, now=10.0) == IDLE_FPS
+    # the set starts, nobody in the frame yet
+    assert controller.update(workout_at(None), detecting=True, now=10.5) == MOVING_FPS
+    # going down, far from the down threshold (90)
+    assert controller.update(workout_at(150), detecting=True, now=11.0) is None
+    # close to the down threshold, raised at once
+    assert controller.update(workout_at(105), detecting=True, now=11.2) == TRANSITION_FPS
+    # down, close to the up threshold (150)
+    assert controller.update(workout_at(140, down=True), detecting=True, now=11.4) is None
+
+
+def test_lower_rate_after_the_hold_and_idle():
+    controller = CaptureRateController()
+    controller.update(workout_at(None), detecting=True, now=10.0)
+    assert controller.update(workout_at(100), detecting=True, now=10.1) == TRANSITION_FPS
+    # far from the thresholds again, kept for HOLD_SECONDS
+    assert controller.update(workout_at(125), detecting=True, now=10.2) is None
+    assert controller.update(workout_at(126), detecting=True, now=10.1 + HOLD_SECONDS) == MOVING_FPS
+    # standing still
+    still = 10.2 + IDLE_AFTER_SECONDS
+    assert controller.update(workout_at(127), detecting=True, now=still) == IDLE_FPS
+    # moving again
+    assert controller.update(workout_at(135), detecting=True, now=still + 0.1) == MOVING_FPS
@@ -0,0 +1,61 @@
+import pytest
+from modules.db_setup import save_data_to_db, DuckDBStore
+
+
+def test_save_data_to_db(conn, metadata, make_frames):
+    frames = make_frames(120)
+    assert save_data_to_db(conn, metadata, frames)
+    rows = conn.sql(
+        "SELECT frame, form_issues, angles_data FROM workout_analysis ORDER BY frame"
+    ).fetchall()
+    assert len(rows) == 120
+    assert rows[0][1] == "body not straight" and rows[1][1] == "Good form"
+    assert rows[5][2][0] == {"name": "elbow", "value": 95.0, "joint_indices": [16, 14, 12]}
+    raw = conn.sql(
+        "SELECT landmark_0_x, landmark_32_y FROM raw_landmarks ORDER BY frame"
+    ).fetchnumpy()
+    assert len(raw["landmark_0_x"]) == 120
+    assert raw["landmark_32_y"] == pytest.approx(frames.landmarks[:, 32, 1])
+
+
+def test_raw_landmarks_every_set_is_stored(conn, metadata, make_frames):
+    for _ in range(3):
+        assert save_data_to_db(conn, metadata, make_frames(40))
+    counts = conn.sql(
+        "SELECT workout_id, count(*) FROM raw_landmarks GROUP BY workout_id ORDER BY workout_id"
+    ).fetchall()
+    assert counts == [(1, 40), (2, 40), (3, 40)]
+    column_type = conn.sql(
+        "SELECT data_type FROM information_schema.columns WHERE table_name = 'raw_landmarks' AND column_name = 'landmark_5_y'"
+    ).fetchone()
+    assert column_type == ("FLOAT",)
+
+
+def test_store_persists_across_restarts(tmp_path, metadata, make_frames):
+    path = str(tmp_path / "store" / "gymbuddy.duckdb")
+    store = DuckDBStore(path, pool_size=2)
+    with store.lease() as cursor:
+        session_metadata = dict(metadata, session_id="session-1", user_id="user-1")
+        assert save_data_to_db(cursor, session_metadata, make_frames(10))
+    store.close()
+
+    store = DuckDBStore(path, pool_size=2)
+    with store.lease() as cursor:
+        assert cursor.sql("SELECT session_id, user_id FROM workout").fetchall() == [
+            ("session-1", "user-1")
+        ]
+        assert cursor.sql(
+            "SELECT count(*) FROM workout_analysis WHERE session_id = 'session-1'"
+        ).fetchone() == (10,)
+    store.close()
+
+
+def test_store_lease_reuses_cursors():
+    store = DuckDBStore(":memory:", pool_size=1)
+    first = store.acquire()
+    second = store.acquire()  # pool empty, a new cursor is opened
+    assert first is not second
+    store.release(first)
+    store.release(second)  # pool full, closed
+    assert store.acquire() is first
+    store.close()
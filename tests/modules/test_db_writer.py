@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+from datetime import datetime
+from modules.buffers import FrameBuffer
+from modules.db_setup import connect_in_memory_db
+from modules.db_writer import DBWriter, SetRecorder
+
+METADATA = {
+    "workout_name": "squats",
+    "timestamp_start": datetime.now(),
+    "rep_goal": 3,
+    "series_number": 1,
+    "strictness_crit": "strict",
+    "strictness_definition": 5,
+    "left_side": True,
+    "ldmrks_keys": ["hip", "knee", "ankle"],
+    "ldmrks_values": [23, 25, 27],
+}
+
+
+@pytest.fixture
+def conn():
+    conn = connect_in_memory_db()
+    yield conn
+    conn.close()
+
+
+def append_frames(buffer: FrameBuffer, start: int, n: int) -> None:
+    if not buffer.angle_names:
+        buffer.set_angles(["knee"], [(27, 25, 23)])
+    for i in range(start, start + n):
+        buffer.append(
+            frame=i,
+            rep_count=0,
+            down=False,
+            form_issues="Good form! Keep Going!",
+            angles=[170.0],
+            landmarks=np.zeros((33, 2), dtype=np.float32),
+        )
+
+
+def test_recorder_streams_micro_batches(conn):
+    writer = DBWriter(conn)
+    recorder = SetRecorder(writer, flush_frames=10)
+    buffer = FrameBuffer(capacity=4)
+    for start in range(0, 35, 5):
+        append_frames(buffer, start, 5)
+        recorder.flush(METADATA, buffer)
+        assert len(buffer) < 10
+    workout_id = recorder.finish(METADATA, buffer).result(timeout=10)
+    writer.close()
+    assert workout_id == 1
+    assert conn.sql("SELECT count(*) FROM workout").fetchone()[0] == 1
+    frames = conn.sql(
+        "SELECT frame FROM workout_analysis WHERE workout_id = 1 ORDER BY frame"
+    ).fetchall()
+    assert [f[0] for f in frames] == list(range(35))
+    assert conn.sql("SELECT count(*) FROM raw_landmarks").fetchone()[0] == 35
+
+
+def test_recorder_finish_without_frames(conn):
+    writer = DBWriter(conn)
+    recorder = SetRecorder(writer)
+    assert recorder.finish({}, FrameBuffer()).result(timeout=10) == 0
+    writer.close()
+
+
+def test_call_runs_after_queued_writes(conn):
+    writer = DBWriter(conn)
+    recorder = SetRecorder(writer, flush_frames=1)
+    buffer = FrameBuffer()
+    append_frames(buffer, 0, 5)
+    recorder.flush(METADATA, buffer)
+    count = writer.call(
+        lambda cursor, table: cursor.sql(f"SELECT count(*) FROM {table}").fetchone()[0],
+        "raw_landmarks",
+    )
+    failed = writer.call(lambda cursor: cursor.sql("SELECT * FROM missing"))
+    assert count.result(timeout=10) == 5
+    with pytest.raises(Exception):
+        failed.result(timeout=10)
+    writer.close()
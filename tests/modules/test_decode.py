@@ -0,0 +1,52 @@
+import cv2
+import numpy as np
+import pytest
+from modules.decode import FrameDecoder, jpeg_size
+
+
+def bgr_image(width: int, height: int) -> np.ndarray:
+    image = np.zeros((height, width, 3), dtype=np.uint8)
+    image[..., 0] = 200  # blue in OpenCV's BGR order
+    image[..., 2] = 20
+    return image
+
+
+def encode(image: np.ndarray, ext: str) -> bytes:
+    ok, data = cv2.imencode(ext, image)
+    assert ok
+    return data.tobytes()
+
+
+def test_jpeg_size():
+    assert jpeg_size(encode(bgr_image(640, 480), ".jpg")) == (640, 480)
+    assert jpeg_size(encode(bgr_image(64, 48), ".png")) is None
+
+
+def test_decode_returns_rgb():
+    decoder = FrameDecoder()
+    frame = decoder.decode(encode(bgr_image(256, 256), ".png"))
+    assert frame.shape == (256, 256, 3)
+    assert frame[0, 0, 2] == 200 and frame[0, 0, 0] == 20
+
+
+def test_large_jpeg_is_decoded_at_reduced_size():
+    decoder = FrameDecoder(target_size=256)
+    frame = decoder.decode(encode(bgr_image(1280, 1024), ".jpg"))
+    # 1/4 keeps the smallest side above the target size, 1/8 would not
+    assert frame.shape == (256, 320, 3)
+    assert frame[0, 0, 2] > frame[0, 0, 0]
+
+
+def test_raw_rgb_frames():
+    decoder = FrameDecoder("raw-rgb", width=4, height=2)
+    rgb = np.arange(24, dtype=np.uint8).reshape(2, 4, 3)
+    assert np.array_equal(decoder.decode(rgb.tobytes()), rgb)
+    assert decoder.decode(b"\x00" * 5) is None
+    with pytest.raises(ValueError):
+        decoder.configure("raw-rgb")
+    with pytest.raises(ValueError):
+        decoder.configure("gif")
+
+
+def test_invalid_data():
+    assert FrameDecoder().decode(b"not an image") is None
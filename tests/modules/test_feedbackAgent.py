@@ -0,0 +1,84 @@
+import asyncio
+import json
+import pytest
+from modules.db_setup import connect_in_memory_db, save_data_to_db
+from modules.feedbackAgent import FeedbackAgent
+
+
+@pytest.fixture
+def agent(monkeypatch, metadata, make_frames):
+    monkeypatch.setenv("GOOGLE_API_KEY", "test")
+    conn = connect_in_memory_db()
+    save_data_to_db(conn, dict(metadata, session_id="s"), make_frames(120))
+    agent = FeedbackAgent(conn, session_id="s")
+    id_frame = agent.get_id_frame()
+    agent.id_used, agent.frame_start = id_frame["id"], id_frame["frame_start"]
+    agent.metadata = agent.extract_metadata()
+    yield agent
+    conn.close()
+
+
+def test_extract_analysis_single_pass(agent):
+    analysis = agent.extract_analysis()
+    # make_frames: rep_count = frame // 50, every 4th frame has a form issue
+    assert analysis["total_repetitions"] == 2
+    assert analysis["form_issues"] == [("Good form", 90), ("body not straight", 30)]
+    assert analysis["frames_with_issues"][0][1][:3] == [0, 4, 8]
+    assert analysis["worst_reps"] == [(1, 13), (2, 12), (3, 5)]
+    # rep goal of 2: the third (unfinished) rep is not timed
+    assert [rep[0] for rep in analysis["frames_reps"]] == [1, 2]
+
+    stats = {s["name"]: s for s in analysis["angles_desc_stats"]}
+    elbow = stats["elbow"]
+    assert elbow["count"] == 120
+    assert elbow["mean"] == pytest.approx(119.5)
+    assert (elbow["min"], elbow["median"], elbow["max"]) == (90.0, 119.5, 149.0)
+    # joint indices named from the workout's landmarks of interest
+    assert elbow["joints"] == ["wrist", "elbow", "shoulder"]
+    assert stats["body"]["joints"] == ["shoulder", "24", "28"]
+    assert "elbow (wrist, elbow, shoulder): mean 119.5" in agent.format_angle_stats(
+        analysis["angles_desc_stats"]
+    )
+
+
+def test_good_form_label_of_the_workout_is_not_an_issue(agent):
+    # the workouts label their good frames "Good form! Keep Going!"
+    agent.db_conn.execute(
+        "UPDATE workout_analysis SET form_issues = 'Good form! Keep Going!' "
+        "WHERE form_issues = 'Good form'"
+    )
+    analysis = agent.extract_analysis()
+    assert [issue for issue, _ in analysis["frames_with_issues"]] == ["body not straight"]
+    assert analysis["worst_reps"] == [(1, 13), (2, 12), (3, 5)]
+    elbow = {s["name"]: s for s in analysis["angles_desc_stats"]}["elbow"]
+    # only the frames with "body not straight", every 4th one
+    assert elbow["mean_with_issues"] == pytest.approx(118.0)
+
+
+def test_extract_analysis_without_frames(agent):
+    agent.id_used = 999
+    assert agent.extract_analysis() == {}
+
+
+def test_astream_pipeline_yields_partial_fields(agent, feedback):
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+    agent.llm = FakeListChatModel(responses=["```json\n" + json.dumps(feedback) + "\n```"])
+
+    async def collect():
+        return [event async for event in agent.astream_pipeline()]
+
+    events = asyncio.run(collect())
+    kinds = [kind for kind, _ in events]
+    assert kinds[-1] == "final" and set(kinds[:-1]) == {"partial"}
+    # the first fields are available before the whole answer is generated
+    first = next(fields for kind, fields in events if fields.get("encouragement"))
+    assert "Rolling_Summary" not in first
+    final = events[-1][1]
+    assert "Keep your body straight." in final["formatted_feedback"]
+    assert agent.previous_rolling_summary == feedback["Rolling_Summary"]
+
+
+def test_incomplete_feedback_is_rejected(agent):
+    with pytest.raises(ValueError):
+        agent.finalize_feedback({"encouragement": "Well done!"})
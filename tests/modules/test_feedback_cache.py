@@ -0,0 +1,131 @@
+import asyncio
+import json
+import threading
+import time
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from modules.db_setup import connect_in_memory_db, save_data_to_db
+from modules.feedbackAgent import FeedbackAgent
+from modules.feedback_cache import FeedbackCache, feedback_fingerprint
+from modules.metrics import METRICS
+
+METADATA = {
+    "workout_name": "push-ups",
+    "rep_goal": 10,
+    "strictness_crit": "loose",
+    "strictness_definition": 15,
+    "series_number": 2,
+}
+
+ANALYSIS = {
+    "total_repetitions": 10,
+    "average_time_repetitions": 2.1,
+    "form_issues": [("Good form", 92), ("body not straight", 28)],
+    "angles_desc_stats": [{"name": "elbow", "mean": 119.5, "min": 90.0, "max": 149.0}],
+}
+
+
+def test_fingerprint_is_quantized():
+    key = feedback_fingerprint(METADATA, ANALYSIS)
+    # small changes of the statistics and a later set of the session share the feedback
+    similar = dict(
+        ANALYSIS,
+        average_time_repetitions=2.2,
+        form_issues=[("body not straight", 29), ("Good form", 91)],
+        angles_desc_stats=[{"name": "elbow", "mean": 120.5, "min": 91.0, "max": 148.0}],
+    )
+    assert feedback_fingerprint(dict(METADATA, series_number=3), similar) == key
+    assert feedback_fingerprint(dict(METADATA, series_number=1), ANALYSIS) != key
+    assert feedback_fingerprint(METADATA, dict(ANALYSIS, total_repetitions=9)) != key
+    assert feedback_fingerprint(dict(METADATA, strictness_crit="strict"), ANALYSIS) != key
+
+
+def test_lru_ttl_and_metrics(monkeypatch):
+    cache = FeedbackCache(max_entries=2, ttl_seconds=60)
+    hits = METRICS.counters.get("feedback_cache_hits", 0)
+    cache.put("a", {"summary": "a"})
+    cache.put("b", {"summary": "b"})
+    assert cache.get("a") == {"summary": "a"}
+    # "b" is the least recently used one
+    cache.put("c", {"summary": "c"})
+    assert cache.get("b") is None
+    assert METRICS.counters["feedback_cache_hits"] == hits + 1
+
+    now = time.time()
+    monkeypatch.setattr("modules.feedback_cache.time.time", lambda: now + 61)
+    assert cache.get("a") is None
+    assert len(cache) == 1
+
+
+def test_persistence(tmp_path):
+    path = str(tmp_path / "cache" / "feedback.json")
+    cache = FeedbackCache(path=path)
+    cache.put("a", {"summary": "a"})
+    assert FeedbackCache(path=path).get("a") == {"summary": "a"}
+    assert FeedbackCache(path=path, ttl_seconds=-1).get("a") is None
+    (tmp_path / "cache" / "feedback.json").write_text("not json")
+    assert len(FeedbackCache(path=path)) == 0
+    # valid JSON, not a list of entries
+    (tmp_path / "cache" / "feedback.json").write_text('[["a", 1], {"b": 2}]')
+    assert len(FeedbackCache(path=path)) == 0
+
+
+def test_concurrent_saves(tmp_path):
+    path = tmp_path / "feedback.json"
+    cache = FeedbackCache(path=str(path))
+    threads = [
+        threading.Thread(target=cache.put, args=(str(i), {"summary": str(i)})) for i in range(16)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # the last save holds every entry and no temporary file is left behind
+    assert len(FeedbackCache(path=str(path))) == 16
+    assert [p.name for p in tmp_path.iterdir()] == ["feedback.json"]
+
+
+@pytest.fixture
+def conn(monkeypatch):
+    monkeypatch.setenv("GOOGLE_API_KEY", "test")
+    conn = connect_in_memory_db()
+    yield conn
+    conn.close()
+
+
+def test_hit_skips_the_llm(conn, metadata, make_frames, feedback):
+    cache = FeedbackCache()
+    for session_id in ("a", "b"):
+        save_data_to_db(conn, dict(metadata, session_id=session_id), make_frames(120))
+    first = FeedbackAgent(conn, session_id="a", cache=cache)
+    first.llm = FakeListChatModel(responses=[json.dumps(feedback)])
+    assert first.agent_pipeline()["main_feedback"] == feedback["main_feedback"]
+
+    second = FeedbackAgent(conn, session_id="b", cache=cache)
+    second.llm = FakeListChatModel(responses=[])  # fails if called
+    hit = second.agent_pipeline()
+    assert hit["main_feedback"] == feedback["main_feedback"]
+    # the rolling summary is this session's, not the cached one
+    assert hit["Rolling_Summary"] == "Set 1: 2 push-ups (goal 2), body not straight."
+    assert second.previous_rolling_summary == hit["Rolling_Summary"]
+
+
+@pytest.mark.parametrize("cached", [False, True])
+def test_astream_pipeline_with_cache(conn, cached, metadata, make_frames, feedback):
+    cache = FeedbackCache()
+    save_data_to_db(conn, dict(metadata, session_id="s"), make_frames(120))
+    agent = FeedbackAgent(conn, session_id="s", cache=cache)
+    agent.llm = FakeListChatModel(responses=[json.dumps(feedback)])
+    if cached:
+        agent.prepare_pipeline()
+        cache.put(agent.cache_key, dict(feedback, main_feedback="From the cache."))
+
+    async def collect():
+        return [event async for event in agent.astream_pipeline()]
+
+    events = asyncio.run(collect())
+    assert events[-1][0] == "final"
+    assert (len(events) == 1) == cached
+    expected = "From the cache." if cached else feedback["main_feedback"]
+    assert events[-1][1]["main_feedback"] == expected
+    assert cache.get(agent.cache_key)["main_feedback"] == expected
@@ -0,0 +1,61 @@
+import asyncio
+import pytest
+from modules.inbox import SessionInbox
+from modules.metrics import METRICS
+
+
+def frame(n: int) -> dict:
+    return {"type": "websocket.receive", "bytes": bytes([n])}
+
+
+def text(value: str) -> dict:
+    return {"type": "websocket.receive", "text": value}
+
+
+def test_latest_frame_wins_in_arrival_order():
+    async def scenario():
+        inbox = SessionInbox()
+        inbox.put(frame(0))
+        inbox.put(frame(1))
+        inbox.put(text("start"))
+        inbox.put(frame(2))
+        inbox.put(frame(3))
+        inbox.put(text("reps"))
+        inbox.put(frame(4))
+        got = [await inbox.get(timeout=1) for _ in range(5)]
+        return inbox, got
+
+    received, dropped = METRICS.counters.get("frames_received", 0), METRICS.counters.get(
+        "frames_dropped", 0
+    )
+    inbox, got = asyncio.run(scenario())
+    # a frame is only superseded by a newer frame, never served after a later control message
+    assert [m.get("text") or m.get("bytes") for m in got] == [
+        bytes([1]),
+        "start",
+        bytes([3]),
+        "reps",
+        bytes([4]),
+    ]
+    assert inbox.frames_received == 5
+    assert inbox.frames_dropped == 2
+    # counted process-wide as they arrive, for /metrics
+    assert METRICS.counters["frames_received"] - received == 5
+    assert METRICS.counters["frames_dropped"] - dropped == 2
+
+
+def test_get_timeout_and_close():
+    async def scenario():
+        inbox = SessionInbox()
+        with pytest.raises(asyncio.TimeoutError):
+            await inbox.get(timeout=0.01)
+        waiter = asyncio.create_task(inbox.get(timeout=1))
+        await asyncio.sleep(0)
+        inbox.put(frame(7))
+        first = await waiter
+        inbox.close()
+        return first, await inbox.get(timeout=1)
+
+    first, last = asyncio.run(scenario())
+    assert first["bytes"] == bytes([7])
+    assert last["type"] == "websocket.disconnect"
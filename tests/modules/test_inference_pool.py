@@ -0,0 +1,129 @@
+import asyncio
+import os
+import time
+import numpy as np
+import pytest
+from modules.inference_pool import InferencePool
+from modules.metrics import METRICS
+
+
+class _Point:
+    def __init__(self, x, y, visibility):
+        self.x, self.y, self.visibility = x, y, visibility
+
+
+class _FakeResult:
+    def __init__(self, pose_landmarks):
+        self.pose_landmarks = pose_landmarks
+
+
+class FakeLandmarker:
+    """Returns the mean pixel value of the frame and the timestamp as landmarks."""
+
+    def __init__(self):
+        self.last_timestamp = -1
+
+    def detect_for_video(self, mp_image, timestamp):
+        if timestamp <= self.last_timestamp:
+            raise ValueError("timestamps must be monotonically increasing")
+        self.last_timestamp = timestamp
+        image = mp_image.numpy_view()
+        if image.mean() == 0:
+            return _FakeResult([])
+        return _FakeResult([[_Point(float(image.mean()), float(timestamp), 1.0)] * 33])
+
+    def close(self):
+        pass
+
+
+def fake_factory(model_path):
+    return FakeLandmarker()
+
+
+class SlowLandmarker(FakeLandmarker):
+    def detect_for_video(self, mp_image, timestamp):
+        time.sleep(0.5)
+        return super().detect_for_video(mp_image, timestamp)
+
+
+def slow_factory(model_path):
+    return SlowLandmarker()
+
+
+def test_pool_detects_through_shared_memory():
+    async def scenario():
+        pool = InferencePool(workers=2, slots_per_worker=2, slot_bytes=64 * 64 * 3, landmarker_factory=fake_factory)
+        try:
+            frames = [np.full((64, 64, 3), value, dtype=np.uint8) for value in (10, 20, 30)]
+            # two sessions in parallel, each with its own monotonic timestamps
+            results = await asyncio.gather(
+                *[pool.detect(session, frame, ts) for ts, frame in enumerate(frames, 1) for session in ("a", "b")]
+            )
+            empty = await pool.detect("a", np.zeros((64, 64, 3), dtype=np.uint8), 10)
+            with pytest.raises(ValueError):
+                await pool.detect("a", np.zeros((128, 128, 3), dtype=np.uint8), 11)
+        finally:
+            pool.close()
+        return results, empty
+
+    results, empty = asyncio.run(scenario())
+    assert [r.x[0] for r in results] == pytest.approx([10, 10, 20, 20, 30, 30])
+    assert [r.y[0] for r in results] == pytest.approx([1, 1, 2, 2, 3, 3])
+    assert empty is None
+
+
+def test_cancelled_detection_keeps_its_slot_until_the_worker_answers():
+    async def scenario():
+        pool = InferencePool(
+            workers=1, slots_per_worker=1, slot_bytes=64 * 64 * 3, landmarker_factory=slow_factory
+        )
+        try:
+            first = asyncio.create_task(pool.detect("a", np.full((64, 64, 3), 10, np.uint8), 1))
+            await asyncio.sleep(0.2)
+            first.cancel()
+            await asyncio.gather(first, return_exceptions=True)
+            # the worker is still reading the frame from the only slot
+            assert not pool._pending and len(pool._slots) == 1
+            second = await pool.detect("a", np.full((64, 64, 3), 20, np.uint8), 2)
+            assert not pool._pending and not pool._slots
+        finally:
+            pool.close()
+        return second
+
+    assert asyncio.run(scenario()).x[0] == pytest.approx(20)
+
+
+class CrashOnceLandmarker(FakeLandmarker):
+    """Kills its worker on a frame of value 13."""
+
+    def detect_for_video(self, mp_image, timestamp):
+        if mp_image.numpy_view()[0, 0, 0] == 13:
+            os._exit(1)
+        return super().detect_for_video(mp_image, timestamp)
+
+
+def crash_once_factory(model_path):
+    return CrashOnceLandmarker()
+
+
+def test_dead_worker_is_restarted():
+    async def scenario():
+        pool = InferencePool(
+            workers=1, slots_per_worker=2, slot_bytes=64 * 64 * 3, landmarker_factory=crash_once_factory
+        )
+        try:
+            first_process = pool._workers[0].process
+            # no pose for the frame the worker died on
+            crashed = await pool.detect("a", np.full((64, 64, 3), 13, np.uint8), 1)
+            after = await pool.detect("a", np.full((64, 64, 3), 20, np.uint8), 2)
+            worker = pool._workers[0]
+            assert worker.process is not first_process and worker.process.is_alive()
+            assert not pool._pending and not pool._slots and worker.free_slots.qsize() == 2
+        finally:
+            pool.close()
+        return crashed, after
+
+    restarts = METRICS.counters.get("inference_worker_restarts", 0)
+    crashed, after = asyncio.run(scenario())
+    assert crashed is None and after.x[0] == pytest.approx(20)
+    assert METRICS.counters["inference_worker_restarts"] == restarts + 1
@@ -0,0 +1,74 @@
+import numpy as np
+from modules.landmarker_pool import RESET_GAP_MS, LandmarkerPool
+
+
+class FakeLandmarker:
+    """Checks the VIDEO mode contract: strictly increasing timestamps."""
+
+    created = 0
+
+    def __init__(self):
+        FakeLandmarker.created += 1
+        self.timestamps: list[int] = []
+        self.blank_frames = 0
+        self.closed = False
+
+    def detect_for_video(self, image, timestamp):
+        assert not self.timestamps or timestamp > self.timestamps[-1]
+        self.timestamps.append(timestamp)
+        if not np.any(image.numpy_view()):
+            self.blank_frames += 1
+
+    def close(self):
+        self.closed = True
+
+
+def fake_factory(model_path, live=False, result_callback=None, segmentation=False):
+    return FakeLandmarker()
+
+
+def test_pool_is_warmed_up_at_startup():
+    FakeLandmarker.created = 0
+    pool = LandmarkerPool("model.task", size=2, landmarker_factory=fake_factory)
+    pool.warm_up()
+    assert FakeLandmarker.created == 2
+    lease = pool.acquire()
+    # warmed up with a blank frame
+    assert lease.landmarker.blank_frames == 1
+    pool.acquire()
+    # the pool is empty, a third session gets a new landmarker
+    pool.acquire()
+    assert FakeLandmarker.created == 3
+
+
+def test_every_lease_starts_a_new_timestamp_sequence():
+    pool = LandmarkerPool("model.task", size=1, landmarker_factory=fake_factory)
+    for _ in range(3):
+        lease = pool.acquire()
+        # every session counts its timestamps from the start
+        for timestamp in (33, 66, 99):
+            lease.detect_for_video(_Image(1), timestamp)
+        pool.release(lease)
+    landmarker = lease.landmarker
+    assert pool.acquire() is lease
+    # a blank frame between the sessions, and a gap in the timestamps
+    assert landmarker.blank_frames == 4
+    assert landmarker.timestamps[4] - landmarker.timestamps[3] == RESET_GAP_MS
+
+
+def test_release_beyond_the_size_closes_the_landmarker():
+    pool = LandmarkerPool("model.task", size=1, landmarker_factory=fake_factory)
+    first, second = pool.acquire(), pool.acquire()
+    pool.release(first)
+    pool.release(second)
+    assert second.landmarker.closed and not first.landmarker.closed
+    pool.close()
+    assert first.landmarker.closed
+
+
+class _Image:
+    def __init__(self, value):
+        self.value = value
+
+    def numpy_view(self):
+        return np.full((2, 2, 3), self.value, dtype=np.uint8)
@@ -0,0 +1,128 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+import numpy as np
+from modules.inbox import SessionInbox
+from modules.landmarker_pool import LandmarkerPool
+from modules.live_inference import LIVE_RESULT, LiveInference
+
+
+class FakeLiveLandmarker:
+    """
+    LIVE_STREAM contract: detect_async returns at once and the result comes back on
+    another thread; a frame submitted while the graph is busy is skipped.
+    """
+
+    def __init__(self, result_callback):
+        self.result_callback = result_callback
+        self.busy = threading.Lock()
+        self.release = threading.Event()
+        self.release.set()
+        self.timestamps: list[int] = []
+        self.threads: list[threading.Thread] = []
+
+    def detect_async(self, image, timestamp):
+        assert not self.timestamps or timestamp > self.timestamps[-1]
+        self.timestamps.append(timestamp)
+        if not self.busy.acquire(blocking=False):
+            return
+        value = float(image.numpy_view()[0, 0, 0]) / 255
+        thread = threading.Thread(target=self._infer, args=(value, timestamp))
+        self.threads.append(thread)
+        thread.start()
+
+    def _infer(self, value, timestamp):
+        self.release.wait(5)
+        # no pose on a blank frame
+        poses = [[SimpleNamespace(x=value, y=value, visibility=1.0)] * 33] if value else []
+        self.busy.release()
+        self.result_callback(SimpleNamespace(pose_landmarks=poses), None, timestamp)
+
+    def close(self):
+        pass
+
+
+def live_factory(model_path, live=False, result_callback=None, segmentation=False):
+    assert live
+    return FakeLiveLandmarker(result_callback)
+
+
+def frame(value: int) -> np.ndarray:
+    return np.full((4, 4, 3), value, dtype=np.uint8)
+
+
+def test_results_are_delivered_to_the_inbox():
+    pool = LandmarkerPool("model.task", size=1, landmarker_factory=live_factory, live=True)
+    pool.warm_up()
+    lease = pool.acquire()
+    for thread in lease.landmarker.threads:
+        thread.join()
+
+    async def scenario():
+        inbox = SessionInbox()
+        live = LiveInference(lease, inbox.put)
+        assert live.submit(frame(51), 33, context="first")
+        first = await inbox.get(timeout=5)
+        assert live.submit(frame(102), 66)
+        second = await inbox.get(timeout=5)
+        return live, first, second
+
+    live, first, second = asyncio.run(scenario())
+    assert first["type"] == LIVE_RESULT
+    # the timestamps of the session, not the shifted ones of the landmarker
+    assert [first["result"].timestamp_ms, second["result"].timestamp_ms] == [33, 66]
+    assert first["result"].context == "first"
+    assert np.allclose(second["result"].landmarks.data[:, 0], 0.4)
+    assert live.in_flight == 0 and live.frames_skipped == 0
+
+
+def test_frames_skipped_while_busy():
+    pool = LandmarkerPool("model.task", size=1, landmarker_factory=live_factory, live=True)
+    lease = pool.acquire()
+    landmarker = lease.landmarker
+    for thread in landmarker.threads:
+        thread.join()
+
+    async def scenario():
+        inbox = SessionInbox()
+        live = LiveInference(lease, inbox.put, max_in_flight=2)
+        landmarker.release.clear()
+        # the first frame is inferred, MediaPipe skips the second one
+        assert live.submit(frame(51), 33)
+        assert live.submit(frame(51), 66)
+        # more than max_in_flight frames waiting
+        assert not live.submit(frame(51), 99)
+        landmarker.release.set()
+        first = await inbox.get(timeout=5)
+        assert live.submit(frame(51), 132)
+        second = await inbox.get(timeout=5)
+        return live, first, second
+
+    live, first, second = asyncio.run(scenario())
+    assert [first["result"].timestamp_ms, second["result"].timestamp_ms] == [33, 132]
+    # the frame over the limit and the one MediaPipe never answered
+    assert live.frames_skipped == 2
+    assert live.in_flight == 0
+
+
+def test_close_stops_the_delivery():
+    pool = LandmarkerPool("model.task", size=1, landmarker_factory=live_factory, live=True)
+    lease = pool.acquire()
+
+    async def scenario():
+        inbox = SessionInbox()
+        live = LiveInference(lease, inbox.put)
+        lease.landmarker.release.clear()
+        live.submit(frame(51), 33)
+        live.close()
+        lease.landmarker.release.set()
+        for thread in lease.landmarker.threads:
+            thread.join()
+        await asyncio.sleep(0.01)
+        return inbox
+
+    inbox = asyncio.run(scenario())
+    assert not inbox._messages
+    # a released landmarker does not deliver the results of the reset frame
+    pool.release(lease)
+    assert lease.result_handler is None
@@ -0,0 +1,136 @@
+import asyncio
+import json
+import threading
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from modules.db_setup import connect_in_memory_db, save_data_to_db
+import modules.feedbackAgent
+from modules.feedbackAgent import FEEDBACK_FIELDS, FeedbackAgent
+from modules.local_feedback import issue_counts, local_feedback
+
+ANALYSIS = {
+    "total_repetitions": 8,
+    "average_time_repetitions": 2.4,
+    "form_issues": [
+        ("Good form! Keep Going!", 60),
+        ("knees not aligned with toes, hips angle not between 45 and 90 degrees (angle: 97.2 degrees)", 25),
+        ("knees not aligned with toes", 15),
+    ],
+    "worst_reps": [(7, 12), (8, 10)],
+}
+
+
+def test_issue_counts_split_the_joined_issues():
+    assert issue_counts(ANALYSIS["form_issues"]).most_common() == [
+        ("knees not aligned with toes", 40),
+        ("hips angle not between 45 and 90 degrees", 25),
+    ]
+
+
+def test_local_feedback_fills_the_llm_fields():
+    metadata = {"workout_name": "squats", "rep_goal": 10, "series_number": 2}
+    feedback = local_feedback(metadata, ANALYSIS, "Set 1: 10 squats (goal 10), good form.")
+    assert set(feedback) == set(FEEDBACK_FIELDS)
+    assert feedback["encouragement"] == "Good effort, 8 of 10 squats done!"
+    assert feedback["positive_point"] == "You kept a steady pace of 2.4 s per rep."
+    assert feedback["main_feedback"].startswith("Most frequent issue: knees not aligned with toes.")
+    assert "45 and 90 degrees" in feedback["secondary_feedback"]
+    assert feedback["Rolling_Summary"] == (
+        "Set 1: 10 squats (goal 10), good form. Set 2: 8 squats (goal 10), "
+        "knees not aligned with toes, hips angle not between 45 and 90 degrees."
+    )
+    # without any data, the feedback is still complete
+    assert set(local_feedback({}, {})) == set(FEEDBACK_FIELDS)
+
+
+class SlowChatModel(FakeListChatModel):
+    """Fake chat model waiting before it answers, or failing."""
+
+    delay: float = 0.0
+    fail: bool = False
+
+    async def _astream(self, *args, **kwargs):
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("LLM unavailable")
+        async for chunk in super()._astream(*args, **kwargs):
+            yield chunk
+
+
+@pytest.fixture
+def agent(monkeypatch, metadata, make_frames):
+    monkeypatch.setenv("GOOGLE_API_KEY", "test")
+    conn = connect_in_memory_db()
+    save_data_to_db(conn, dict(metadata, session_id="s"), make_frames(120))
+    yield FeedbackAgent(conn, session_id="s")
+    conn.close()
+
+
+def run_hedged(agent, budget):
+    async def collect():
+        return [event async for event in agent.ahedged_pipeline(budget=budget)]
+
+    return asyncio.run(collect())
+
+
+def test_hedged_pipeline_within_budget(agent, feedback):
+    agent.llm = SlowChatModel(responses=[json.dumps(feedback)])
+    events = run_hedged(agent, budget=5.0)
+    assert "local" not in [kind for kind, _ in events]
+    assert events[-1][0] == "final"
+
+
+def test_hedged_pipeline_upgrades_a_late_llm(agent, feedback):
+    agent.llm = SlowChatModel(responses=[json.dumps(feedback)], delay=0.3)
+    events = run_hedged(agent, budget=0.05)
+    # no partial fields once the local feedback is served
+    assert [kind for kind, _ in events] == ["local", "final"]
+    assert "set statistics" in events[0][1]["formatted_feedback"]
+    assert events[1][1]["main_feedback"] == feedback["main_feedback"]
+    assert agent.previous_rolling_summary == feedback["Rolling_Summary"]
+
+
+def test_hedged_pipeline_serves_local_when_the_llm_fails(agent, feedback):
+    agent.llm = SlowChatModel(responses=[json.dumps(feedback)], fail=True)
+    events = run_hedged(agent, budget=5.0)
+    assert [kind for kind, _ in events] == ["local"]
+    assert agent.previous_rolling_summary == "Set 1: 2 push-ups (goal 2), body not straight."
+
+
+def test_hedged_pipeline_serves_local_without_an_llm_client(agent, monkeypatch):
+    def create_llm(model):
+        raise RuntimeError("no credentials")
+
+    monkeypatch.setattr(modules.feedbackAgent, "create_llm", create_llm)
+    agent = FeedbackAgent(agent.db_conn, session_id="s")
+    assert agent.llm is None
+    events = run_hedged(agent, budget=5.0)
+    assert [kind for kind, _ in events] == ["local"]
+
+
+def test_cancelled_feedback_waits_for_the_extraction(agent, feedback):
+    agent.llm = SlowChatModel(responses=[json.dumps(feedback)])
+    started, release = threading.Event(), threading.Event()
+    prepare_pipeline = agent.prepare_pipeline
+
+    def slow_prepare(workout_id=None):
+        started.set()
+        release.wait(5)
+        return prepare_pipeline(workout_id)
+
+    agent.prepare_pipeline = slow_prepare
+
+    async def scenario():
+        task = asyncio.create_task(anext(agent.ahedged_pipeline(budget=5.0)))
+        await asyncio.to_thread(started.wait, 5)
+        task.cancel()
+        await asyncio.sleep(0.05)
+        # the thread still uses the session cursor, the task is not over
+        waiting = not task.done()
+        release.set()
+        await asyncio.wait({task})
+        return waiting, task.cancelled()
+
+    assert asyncio.run(scenario()) == (True, True)
+    # the extraction ran to its end before the cancellation went on
+    assert agent.workout_analysis["total_repetitions"] == 2
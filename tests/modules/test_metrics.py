@@ -0,0 +1,30 @@
+from modules.metrics import Histogram, MetricsRegistry, SessionMetrics
+
+
+def test_histogram_buckets_and_quantiles():
+    histogram = Histogram(buckets=(0.01, 0.1, 1.0))
+    for value in (0.005, 0.005, 0.05, 0.5, 5.0):
+        histogram.observe(value)
+    assert histogram.cumulative() == [2, 3, 4, 5]
+    assert histogram.count == 5
+    assert histogram.quantile(0.4) == 0.01
+    assert histogram.quantile(0.6) == 0.1
+    assert histogram.quantile(1.0) == float("inf")
+    assert Histogram().quantile(0.5) == 0.0
+
+
+def test_session_metrics_feed_the_registry():
+    registry = MetricsRegistry()
+    session = SessionMetrics("abc", registry=registry)
+    with session.timer("decode"):
+        pass
+    session.observe("inference", 0.02)
+    registry.inc("frames_received", 3)
+    assert set(session.summary()) == {"decode", "inference"}
+    assert registry.histogram("inference").count == 1
+
+    text = registry.render()
+    assert "# TYPE gymbuddy_stage_seconds histogram" in text
+    assert 'gymbuddy_stage_seconds_bucket{stage="inference",le="0.025"} 1' in text
+    assert 'gymbuddy_stage_seconds_count{stage="decode"} 1' in text
+    assert "gymbuddy_frames_received_total 3" in text
@@ -0,0 +1,86 @@
+import asyncio
+from modules.metrics import SessionMetrics
+from modules.model_tiers import (
+    FRAME_BUDGET_SECONDS,
+    STEP_UP_AFTER_SECONDS,
+    WINDOW_FRAMES,
+    SessionLandmarker,
+    TierController,
+    TieredLandmarkerPools,
+)
+
+
+def observe(metrics: SessionMetrics, seconds: float, frames: int = WINDOW_FRAMES) -> None:
+    for _ in range(frames):
+        metrics.observe("inference", seconds)
+
+
+def test_step_down_under_pressure_and_up_with_headroom():
+    load = [0.1]
+    controller = TierController(["lite", "full", "heavy"], "full", load=lambda: load[0])
+    metrics = SessionMetrics()
+    observe(metrics, FRAME_BUDGET_SECONDS, frames=WINDOW_FRAMES - 1)
+    # not a full window yet
+    assert controller.update(metrics, now=0.0) is None
+    observe(metrics, FRAME_BUDGET_SECONDS, frames=1)
+    assert controller.update(metrics, now=1.0) == "lite"
+    # the lowest tier
+    observe(metrics, FRAME_BUDGET_SECONDS)
+    assert controller.update(metrics, now=2.0) is None
+    # fast again, but not for long enough
+    observe(metrics, 0.1 * FRAME_BUDGET_SECONDS)
+    assert controller.update(metrics, now=3.0) is None
+    observe(metrics, 0.1 * FRAME_BUDGET_SECONDS)
+    assert controller.update(metrics, now=2.0 + STEP_UP_AFTER_SECONDS) == "full"
+    # the server is overloaded
+    load[0] = 2.0
+    observe(metrics, 0.1 * FRAME_BUDGET_SECONDS)
+    assert controller.update(metrics, now=100.0) == "lite"
+
+
+class FakeLandmarker:
+    def __init__(self, model_path, segmentation):
+        self.model_path = model_path
+        self.segmentation = segmentation
+
+    def detect_for_video(self, image, timestamp):
+        pass
+
+    def close(self):
+        pass
+
+
+def fake_factory(model_path, live=False, result_callback=None, segmentation=False):
+    return FakeLandmarker(model_path, segmentation)
+
+
+def test_session_switches_landmarker(tmp_path):
+    for tier in ("lite", "full"):
+        (tmp_path / f"pose_landmarker_{tier}.task").write_bytes(b"model")
+    pools = TieredLandmarkerPools(str(tmp_path), size=1, landmarker_factory=fake_factory)
+    assert pools.tiers == ["lite", "full"] and pools.default_tier == "lite"
+    pools.warm_up()
+
+    async def scenario():
+        session = SessionLandmarker(pools)
+        session.controller.changed_at -= STEP_UP_AFTER_SECONDS
+        session.controller.load = lambda: 0.0
+        first = await session.acquire()
+        metrics = SessionMetrics()
+        observe(metrics, 0.001)
+        # the landmarker of the new tier is loaded in the background
+        assert not await session.follow(metrics)
+        await asyncio.sleep(0.05)
+        assert await session.follow(metrics)
+        second = session.landmarker
+        await session.release()
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first.landmarker.model_path.endswith("lite.task")
+    assert second.landmarker.model_path.endswith("full.task")
+    # no mask unless asked for
+    assert not second.landmarker.segmentation
+    # both went back to their pools
+    assert pools.pools["lite"].acquire() is first
+    assert pools.pools["full"].acquire() is second
@@ -0,0 +1,69 @@
+import json
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from modules.db_setup import connect_in_memory_db, save_data_to_db
+from modules.feedbackAgent import FeedbackAgent
+from modules.metrics import METRICS
+from modules.prompt_budget import estimate_tokens, format_issues, shorten_summary
+
+
+def test_issues_are_merged_without_the_measured_angles():
+    form_issues = [("Good form! Keep Going!", 50)] + [
+        (f"knees not aligned with toes, hips angle not between 45 and 90 degrees (angle: {a} degrees)", 5)
+        for a in range(95, 105)
+    ]
+    assert format_issues(form_issues) == (
+        "knees not aligned with toes (50 frames, 50%), "
+        "hips angle not between 45 and 90 degrees (50 frames, 50%)"
+    )
+    assert format_issues(form_issues, max_issues=1) == "knees not aligned with toes (50 frames, 50%)"
+    assert format_issues([("Good form", 10)]) == "none"
+
+
+def test_shorten_summary_keeps_the_last_sets():
+    summary = "Set 1: 10 push-ups. Set 2: 8 push-ups. Set 3: 6 push-ups."
+    assert shorten_summary(summary, None) == summary
+    assert shorten_summary(summary, 30) == "... Set 3: 6 push-ups."
+
+
+@pytest.fixture
+def agent(monkeypatch, metadata, make_frames):
+    monkeypatch.setenv("GOOGLE_API_KEY", "test")
+    conn = connect_in_memory_db()
+    save_data_to_db(conn, dict(metadata, session_id="s"), make_frames(120))
+    agent = FeedbackAgent(conn, session_id="s")
+    agent.previous_rolling_summary = " ".join(
+        f"Set {i}: 10 push-ups (goal 10), body not straight." for i in range(1, 40)
+    )
+    yield agent
+    conn.close()
+
+
+def test_prompt_is_compacted_to_the_budget(agent):
+    prompt = agent.create_prompt()[0]
+    chain, inputs = agent.prepare_pipeline()
+    full_tokens = estimate_tokens(prompt.format(**inputs))
+    assert agent.prompt_level == 0
+
+    agent.token_budget = full_tokens - 100
+    chain, inputs = agent.prepare_pipeline()
+    assert agent.prompt_level > 0
+    assert estimate_tokens(prompt.format(**inputs)) <= agent.token_budget
+    assert inputs["rolling_summary"].endswith("Set 39: 10 push-ups (goal 10), body not straight.")
+
+    # the smallest layout is used when the budget cannot be met
+    agent.token_budget = 10
+    agent.prepare_pipeline()
+    assert agent.prompt_level == 3
+
+
+def test_token_usage_is_recorded(agent, feedback):
+    agent.llm = FakeListChatModel(responses=[json.dumps(feedback)])
+    calls = METRICS.counters.get("llm_calls", 0)
+    agent.agent_pipeline()
+    usage = agent.token_usage.usage()
+    # the fake model returns no usage metadata
+    assert usage["estimated"]
+    assert usage["prompt_tokens"] > 0
+    assert usage["response_tokens"] == estimate_tokens(json.dumps(feedback))
+    assert METRICS.counters["llm_calls"] == calls + 1
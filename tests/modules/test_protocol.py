@@ -0,0 +1,51 @@
+import json
+import numpy as np
+import pytest
+from modules.protocol import decode_analysis, dumps, encode_analysis
+from modules.utils import LandmarkFrame
+
+ANALYSIS = {
+    "rep_count": 4,
+    "goal_reps": 10,
+    "form_ok": False,
+    "form_message": "knees on floor, body not straight",
+    "display_angles": [
+        {"name": "elbow", "value": 93.25, "joint_indices": (16, 14, 12)},
+        {"name": "body", "value": 171.5, "joint_indices": (12, 24, 28)},
+    ],
+    "is_down_phase": True,
+}
+
+
+@pytest.mark.parametrize("float32", [False, True])
+def test_encode_decode_roundtrip(float32):
+    landmarks = LandmarkFrame(np.random.default_rng(0).random((33, 3)))
+    payload = encode_analysis(ANALYSIS, landmarks, goal_reps=10, float32=float32)
+    decoded = decode_analysis(payload)
+    tolerance = 1e-6 if float32 else 1e-3
+    assert [p["x"] for p in decoded["landmarks"]] == pytest.approx(landmarks.x.tolist(), abs=tolerance)
+    assert [p["y"] for p in decoded["landmarks"]] == pytest.approx(landmarks.y.tolist(), abs=tolerance)
+    for key in ("rep_count", "goal_reps", "form_ok", "form_message", "is_down_phase"):
+        assert decoded[key] == ANALYSIS[key]
+    assert decoded["display_angles"] == ANALYSIS["display_angles"]
+
+
+def test_binary_is_smaller_than_json():
+    landmarks = LandmarkFrame(np.random.default_rng(1).random((33, 3)))
+    payload = encode_analysis(ANALYSIS, landmarks, goal_reps=10)
+    as_json = json.dumps(dict(ANALYSIS, landmarks=landmarks.to_dicts()))
+    assert len(payload) * 4 < len(as_json)
+
+
+def test_encode_without_landmarks():
+    decoded = decode_analysis(encode_analysis({"form_message": "Initializing..."}, None, 0))
+    assert decoded["landmarks"] == [] and decoded["form_message"] == "Initializing..."
+
+
+def test_decode_rejects_other_payloads():
+    with pytest.raises(ValueError):
+        decode_analysis(b"\xff\xd8" + bytes(20))
+
+
+def test_dumps_numpy_values():
+    assert json.loads(dumps({"value": np.float32(1.5), "idx": (1, 2)})) == {"value": 1.5, "idx": [1, 2]}
@@ -0,0 +1,122 @@
+import numpy as np
+from modules.archive import archive_session
+from modules.db_setup import save_data_to_db
+from modules.gymBuddy import GymBuddy
+from modules.rescoring import load_sets, rescore_sets, rescore_workouts
+from modules.utils import LandmarkFrame
+
+
+def pushup_frames(n_reps: int, rng: np.random.Generator) -> list[LandmarkFrame]:
+    """Right side push-ups, the elbow going from 175 to 70 degrees and back, with a few
+    frames with the knees on the floor."""
+    frames = []
+    for theta in 122.5 + 52.5 * np.cos(np.linspace(0, 2 * np.pi * n_reps, 20 * n_reps)):
+        data = rng.random((33, 3)).astype(np.float32) * [1, 1, 0.2]
+        half = np.radians(theta) / 2
+        # wrist below the shoulder, the elbow off their line gives the angle
+        data[12] = (0.3, 0.5, 0.9)
+        data[16] = (0.3, 0.7, 0.9)
+        data[14] = (0.3 + 0.1 / np.tan(half), 0.6, 0.9)
+        data[24] = (0.6, 0.5, 0.9)
+        data[26] = (0.8 if rng.random() < 0.1 else 0.75, 0.5, 0.9)
+        data[28] = (0.85, 0.52, 0.9)
+        data[32] = (0.95, 0.55, 0.9)
+        if data[26, 0] == np.float32(0.8):
+            data[26, 1] = 0.8
+        frames.append(LandmarkFrame(data))
+    return frames
+
+
+def record_set(conn, workout: str, strictness: str, frames: list[LandmarkFrame]) -> None:
+    buddy = GymBuddy(workout_name=workout, strictness_crit=strictness, load_model=False)
+    buddy.set_reps(100)
+    for frame in frames:
+        buddy.analyze_landmarks(frame)
+    data = buddy.get_data_to_save()
+    save_data_to_db(conn, dict(data["workout_db_buffer"], session_id="s"), data["frames"])
+
+
+def live_and_rescored(conn, version: int) -> tuple[list, list]:
+    live = conn.sql(
+        "SELECT workout_id, frame, rep_count, down, form_issues FROM workout_analysis "
+        "ORDER BY workout_id, frame"
+    ).fetchall()
+    rescored = conn.execute(
+        "SELECT workout_id, frame, rep_count, down, form_issues FROM workout_analysis_version "
+        "WHERE version = ? ORDER BY workout_id, frame",
+        [version],
+    ).fetchall()
+    return live, rescored
+
+
+def test_rescoring_replays_the_live_analysis(conn):
+    rng = np.random.default_rng(0)
+    record_set(conn, "push-ups", "loose", pushup_frames(5, rng))
+    # random poses go through every phase and form message, angles included
+    random_frames = [LandmarkFrame(rng.random((33, 3)).astype(np.float32)) for _ in range(300)]
+    record_set(conn, "squats", "strict", random_frames)
+    record_set(conn, "push-ups", "moderate", random_frames)
+
+    version = rescore_workouts(conn)
+    live, rescored = live_and_rescored(conn, version)
+    assert len(rescored) == len(live) == 100 + 300 + 300
+    assert rescored == live
+    assert max(row[2] for row in live if row[0] == 1) >= 4
+
+
+def test_new_strictness_and_thresholds_are_a_new_version(conn):
+    rng = np.random.default_rng(1)
+    record_set(conn, "push-ups", "loose", pushup_frames(5, rng))
+    first = rescore_workouts(conn, strictness="loose")
+    # the elbow never goes above 175 degrees, no rep is finished
+    second = rescore_workouts(
+        conn, [1], strictness="strict", thresholds={"push-ups": (90, 178)}, description="tuning"
+    )
+    assert second == first + 1
+    assert conn.execute(
+        "SELECT strictness_crit, rules, description FROM analysis_version WHERE id = ?", [second]
+    ).fetchone() == ("strict", '{"thresholds": {"push-ups": [90, 178]}}', "tuning")
+    counts = dict(
+        conn.sql(
+            "SELECT version, max(rep_count) FROM workout_analysis_version GROUP BY version"
+        ).fetchall()
+    )
+    assert counts[first] >= 4 and counts[second] == 0
+    # the live analysis is left as it was
+    assert conn.sql("SELECT max(rep_count) FROM workout_analysis").fetchone()[0] == counts[first]
+
+
+def test_archived_sets_are_rescored(conn, tmp_path):
+    rng = np.random.default_rng(2)
+    record_set(conn, "push-ups", "loose", pushup_frames(3, rng))
+    record_set(conn, "push-ups", "loose", pushup_frames(2, rng))
+    live = conn.sql(
+        "SELECT max(rep_count) FROM workout_analysis GROUP BY workout_id ORDER BY 1"
+    ).fetchall()
+    archive_dir = str(tmp_path / "archive")
+    archive_session(conn, "s", archive_dir)
+    assert len(load_sets(conn)) == 0
+
+    sets = load_sets(conn, archive_dir=archive_dir)
+    assert sorted(sets.workouts) == [1, 2] and len(sets) == 100
+    rescored = rescore_sets(sets)
+    assert sorted({rescored.rep_count[sets.workout_id == i].max() for i in (1, 2)}) == [
+        row[0] for row in live
+    ]
+
+
+def test_sets_without_rules_are_left_out_of_the_version(conn):
+    rng = np.random.default_rng(3)
+    record_set(conn, "push-ups", "loose", pushup_frames(2, rng))
+    record_set(conn, "push-ups", "loose", pushup_frames(2, rng))
+    conn.execute("UPDATE workout SET workout_name = 'lunges' WHERE id = 2")
+
+    version = rescore_workouts(conn)
+    assert conn.execute(
+        "SELECT DISTINCT workout_id FROM workout_analysis_version WHERE version = ?", [version]
+    ).fetchall() == [(1,)]
+    # nothing to score, an empty version
+    version = rescore_workouts(conn, [2])
+    assert conn.execute(
+        "SELECT count(*) FROM workout_analysis_version WHERE version = ?", [version]
+    ).fetchone() == (0,)
@@ -0,0 +1,97 @@
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from modules.gymBuddy import GymBuddy
+from modules.roi import RoiTracker
+from modules.utils import LandmarkFrame
+
+
+def pose(x0: float, y0: float, x1: float, y1: float, visibility: float = 0.9) -> LandmarkFrame:
+    """33 landmarks spread over the box (x0, y0, x1, y1)."""
+    t = np.linspace(0, 1, 33)
+    return LandmarkFrame(np.column_stack([x0 + t * (x1 - x0), y0 + t * (y1 - y0), np.full(33, visibility)]))
+
+
+def test_region_around_the_last_pose():
+    tracker = RoiTracker()
+    assert tracker.region(480, 640) is None
+    tracker.update(pose(0.4, 0.4, 0.6, 0.6))
+    left, top, right, bottom = tracker.region(480, 640)
+    # padded by the same margin on both axes around the pose box (128 x 96 pixels)
+    assert right - left - 128 == pytest.approx(bottom - top - 96, abs=1)
+    assert left < 0.4 * 640 and right > 0.6 * 640
+    assert top < 0.4 * 480 and bottom > 0.6 * 480
+    # kept inside the frame at the borders
+    tracker.update(pose(0.0, 0.0, 0.1, 0.1))
+    assert tracker.region(480, 640)[:2] == (0, 0)
+
+
+def test_region_held_while_the_pose_moves_inside_it():
+    tracker = RoiTracker()
+    regions = []
+    # the person walks right, 6 pixels a frame
+    for step in range(12):
+        shift = 0.01 * step
+        tracker.update(pose(0.4 + shift, 0.4, 0.6 + shift, 0.6))
+        regions.append(tracker.region(480, 640))
+    # moved only once the pose box gets close to the right border of the region
+    assert regions[1] == regions[0] and regions[2] == regions[0]
+    assert len(set(regions)) == 4
+    for step, (left, top, right, bottom) in enumerate(regions):
+        assert left < (0.4 + 0.01 * step) * 640 and right > (0.6 + 0.01 * step) * 640
+        assert (top, bottom) == regions[0][1::2]
+    # the person stands up, the box gets taller in place
+    tracker.update(pose(0.51, 0.3, 0.71, 0.7))
+    left, top, right, bottom = tracker.region(480, 640)
+    assert top < 0.3 * 480 and bottom > 0.7 * 480
+
+
+def test_tracking_lost_falls_back_to_the_whole_frame():
+    tracker = RoiTracker()
+    tracker.update(pose(0.4, 0.4, 0.6, 0.6))
+    tracker.update(pose(0.4, 0.4, 0.6, 0.6, visibility=0.1))
+    assert tracker.region(480, 640) is None
+    tracker.update(pose(0.4, 0.4, 0.6, 0.6))
+    tracker.update(None)
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    crop, roi = tracker.crop(frame)
+    assert crop is frame and roi is None
+    # a pose filling the frame is not cropped
+    tracker.update(pose(0.0, 0.0, 1.0, 1.0))
+    assert tracker.region(480, 640) is None
+
+
+def test_landmarks_mapped_back_to_the_whole_frame():
+    tracker = RoiTracker()
+    landmarks = tracker.to_frame(pose(0.0, 0.0, 1.0, 1.0), (100, 50, 300, 250), 480, 640)
+    assert landmarks.xy[0] == pytest.approx([100 / 640, 50 / 480])
+    assert landmarks.xy[-1] == pytest.approx([300 / 640, 250 / 480])
+
+
+def test_run_inference_on_the_crop():
+    # a person in the box (0.4, 0.4, 0.6, 0.6) of every frame
+    target = pose(0.4, 0.4, 0.6, 0.6)
+    shapes = []
+
+    def detect_for_video(image, timestamp):
+        view = image.numpy_view()
+        shapes.append(view.shape[:2])
+        height, width = frame.shape[:2]
+        left, top = (view[0, 0, :2].astype(np.float64) * [width / 255, height / 255]).round()
+        # the landmarks of the person relative to the image given to the model
+        data = target.data.copy()
+        data[:, 0] = (data[:, 0] * width - left) / view.shape[1]
+        data[:, 1] = (data[:, 1] * height - top) / view.shape[0]
+        landmarks = [SimpleNamespace(x=x, y=y, visibility=v) for x, y, v in data.tolist()]
+        return SimpleNamespace(pose_landmarks=[landmarks])
+
+    # every pixel holds its own coordinates, so the fake model can locate the crop
+    height, width = 255, 255
+    ys, xs = np.mgrid[0:height, 0:width]
+    frame = np.stack([xs, ys, np.zeros_like(xs)], axis=-1).astype(np.uint8)
+    buddy = GymBuddy(model=SimpleNamespace(detect_for_video=detect_for_video))
+    first = buddy.run_inference(frame)
+    second = buddy.run_inference(frame)
+    assert shapes[0] == (255, 255) and shapes[1][0] < 255
+    assert first.xy == pytest.approx(target.xy, abs=1e-3)
+    assert second.xy == pytest.approx(target.xy, abs=1e-3)
@@ -1,5 +1,6 @@
 import pytest
-from modules.utils import compute_angle, is_left_side, extend_row, Landmark
+import numpy as np
+from modules.utils import compute_angle, compute_angles, is_left_side, extend_row, Landmark, LandmarkFrame
 from pydantic import ValidationError
 
 ### tests for the Landmark class
@@ -55,6 +56,57 @@ def test_compute_angle_none_input():
         compute_angle(p1,p2,p3)
 
 
+### Tests for the LandmarkFrame class and compute_angles function
+class _MpLandmark:
+    """Minimal stand-in for a mediapipe NormalizedLandmark."""
+    def __init__(self, x, y, visibility):
+        self.x, self.y, self.visibility = x, y, visibility
+
+
+def test_landmark_frame_from_landmarks():
+    frame = LandmarkFrame.from_landmarks([_MpLandmark(i / 33, 1 - i / 33, 0.5) for i in range(33)])
+    assert frame.data.shape == (33, 3)
+    assert frame.data.dtype == np.float32
+    assert frame.x[3] == pytest.approx(3 / 33)
+    assert frame.y[3] == pytest.approx(1 - 3 / 33)
+    assert frame.visibility[3] == pytest.approx(0.5)
+    assert frame.to_dicts()[3] == {"x": pytest.approx(3 / 33), "y": pytest.approx(1 - 3 / 33)}
+    assert isinstance(frame.landmark(3), Landmark)
+
+
+def test_landmark_frame_invalid_shape():
+    with pytest.raises(ValueError):
+        LandmarkFrame(np.zeros(33))
+
+
+def test_compute_angles_matches_compute_angle():
+    points = [(0, 0), (1, 1), (1, 0), (0, 1), (1, 2), (0, 2)]
+    frame = LandmarkFrame(np.array(points))
+    triples = [(0, 1, 2), (0, 3, 1), (0, 3, 4), (0, 3, 5)]
+    angles = compute_angles(frame, triples)
+    assert angles.shape == (4,)
+    for (i, j, k), angle in zip(triples, angles):
+        p1, p2, p3 = (Landmark(x=points[n][0], y=points[n][1]) for n in (i, j, k))
+        assert angle == pytest.approx(compute_angle(p1, p2, p3))
+    assert angles == pytest.approx([45, 90, 135, 180])
+
+
+def test_compute_angles_batch_of_frames():
+    block = np.array([[(0, 0), (0, 1), (1, 1)], [(0, 0), (0, 1), (0, 2)]], dtype=np.float32)
+    angles = compute_angles(block, [(0, 1, 2)])
+    assert angles.shape == (2, 1)
+    assert angles[:, 0] == pytest.approx([90, 180])
+
+
+def test_is_left_side_landmark_frame():
+    data = np.zeros((33, 3))
+    data[13, 2] = 0.8
+    data[14, 2] = 0.2
+    assert is_left_side(LandmarkFrame(data)) is True
+    data[13, 2] = 0.1
+    assert is_left_side(LandmarkFrame(data)) is False
+
+
 ### Tests for is_left_side funtion
 MOCK_LANDMARK_LIST = [Landmark(x=0, y=0) for _ in range(15)]
 
@@ -0,0 +1,140 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# seconds to import the app, the heavy modules are only loaded by the warm-up
+IMPORT_BUDGET_SECONDS = float(os.environ.get("GYMBUDDY_IMPORT_BUDGET", 1.5))
+# duckdb is not deferred (30-40 ms): the store is opened at startup, before the warm-up
+DEFERRED_MODULES = ("mediapipe", "cv2", "pandas", "langchain", "langchain_google_genai")
+
+
+def test_import_time_budget():
+    code = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        "import main\n"
+        "print(time.perf_counter() - start)\n"
+        f"print(','.join(m for m in {DEFERRED_MODULES!r} if m in sys.modules))\n"
+    )
+    # best of three, the first run also fills the bytecode caches
+    runs = [
+        subprocess.run(
+            [sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.splitlines()
+        for _ in range(3)
+    ]
+    assert [run[1] if len(run) > 1 else "" for run in runs] == ["", "", ""]
+    assert min(float(run[0]) for run in runs) < IMPORT_BUDGET_SECONDS
+
+
+def start_app(monkeypatch, tmp_path, load_shared_resources):
+    from fastapi.testclient import TestClient
+    import main
+
+    monkeypatch.setenv("GYMBUDDY_DB_PATH", str(tmp_path / "gymbuddy.duckdb"))
+    monkeypatch.setenv("GYMBUDDY_ARCHIVE_DIR", "")
+    monkeypatch.setenv("GYMBUDDY_FEEDBACK_CACHE", "")
+    monkeypatch.setattr(main, "load_shared_resources", load_shared_resources)
+    monkeypatch.setattr(main, "WARM_UP_BACKOFF_SECONDS", 0.01)
+    return TestClient(main.app)
+
+
+def wait_for_warm_up(client):
+    for _ in range(100):
+        response = client.get("/ready")
+        if response.json()["status"] != "warming up":
+            break
+        time.sleep(0.01)
+    return response
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    loaded = threading.Event()
+
+    def load_shared_resources(application):
+        assert loaded.wait(10)
+        application.state.llm = "shared client"
+
+    with start_app(monkeypatch, tmp_path, load_shared_resources) as client:
+        yield client, loaded
+
+
+def test_ready_after_warm_up(client):
+    client, loaded = client
+    response = client.get("/ready")
+    assert response.status_code == 503
+    assert response.json() == {"status": "warming up"}
+
+    loaded.set()
+    assert wait_for_warm_up(client).json() == {"status": "ready"}
+    assert client.app.state.llm == "shared client"
+
+
+def test_export_requires_a_user(client):
+    client, loaded = client
+    loaded.set()
+    assert client.get("/export/workout").status_code == 422
+    # archiving is disabled in the test app
+    assert client.get("/export/workout", params={"user_id": "ann"}).status_code == 404
+
+
+def test_camera_feed_rejected_while_warming_up(client):
+    from starlette.websockets import WebSocketDisconnect
+
+    client, loaded = client
+    with client.websocket_connect("/ws") as websocket:
+        with pytest.raises(WebSocketDisconnect) as closed:
+            websocket.receive_text()
+    assert closed.value.code == 1013
+    loaded.set()
+
+
+def test_warm_up_is_retried(monkeypatch, tmp_path):
+    attempts = []
+
+    def load_shared_resources(application):
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise RuntimeError("model not found")
+        application.state.llm = "shared client"
+
+    with start_app(monkeypatch, tmp_path, load_shared_resources) as client:
+        assert wait_for_warm_up(client).json() == {"status": "ready"}
+    assert len(attempts) == 3
+
+
+def test_failed_warm_up_closes_the_camera_feed(monkeypatch, tmp_path):
+    from starlette.websockets import WebSocketDisconnect
+
+    def load_shared_resources(application):
+        raise RuntimeError("model not found")
+
+    with start_app(monkeypatch, tmp_path, load_shared_resources) as client:
+        response = wait_for_warm_up(client)
+        assert response.status_code == 503
+        assert response.json() == {"status": "error", "detail": "model not found"}
+        with client.websocket_connect("/ws") as websocket:
+            with pytest.raises(WebSocketDisconnect) as closed:
+                websocket.receive_text()
+    # not a code the client retries on
+    assert closed.value.code == 1011
+
+
+def test_ready_without_an_llm_client(monkeypatch):
+    from types import SimpleNamespace
+    import main
+    import modules.feedbackAgent
+
+    def create_llm():
+        raise RuntimeError("no credentials")
+
+    monkeypatch.setattr(modules.feedbackAgent, "create_llm", create_llm)
+    application = SimpleNamespace(state=SimpleNamespace(landmarker_pools=None))
+    main.load_shared_resources(application)
+    assert application.state.llm is None
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+from modules.utils import LandmarkFrame
+from modules.workouts.pushups import PushUps
+from modules.workouts.squats import Squats
+
+
+def make_frame(points: dict[int, tuple[float, float]]) -> LandmarkFrame:
+    data = np.zeros((33, 3), dtype=np.float32)
+    for idx, (x, y) in points.items():
+        data[idx, :2] = (x, y)
+    return LandmarkFrame(data)
+
+
+def test_pushups_angles_computed_on_set_res():
+    wo = PushUps(goal_reps=5, ldmrk_res=None, left_side=False)
+    # right side: shoulder 12, elbow 14, wrist 16, hip 24, knee 26
+    frame = make_frame({16: (0.0, 1.0), 14: (0.0, 0.5), 12: (0.5, 0.5), 24: (1.0, 0.5), 26: (1.5, 0.5)})
+    wo.set_res(frame)
+    assert wo.angles["elbow"] == pytest.approx(90)
+    assert wo.angles["body"] == pytest.approx(180)
+    assert [a["name"] for a in wo.get_display_angles()] == ["elbow", "body"]
+
+
+def test_squats_angles_computed_on_set_res():
+    wo = Squats(goal_reps=5, ldmrk_res=None, left_side=True)
+    # left side: shoulder 11, hip 23, knee 25, ankle 27
+    frame = make_frame({27: (0.5, 1.0), 25: (0.5, 0.75), 23: (0.5, 0.5), 11: (0.5, 0.0)})
+    wo.set_res(frame)
+    assert wo.angles["knee"] == pytest.approx(180)
+    assert wo.angles["hips"] == pytest.approx(180)
+
+
+def test_count_reps_hysteresis():
+    wo = PushUps(goal_reps=5, ldmrk_res=None, left_side=False)
+    down = make_frame({16: (0.0, 1.0), 14: (0.0, 0.5), 12: (0.5, 0.5)})
+    up = make_frame({16: (0.0, 1.0), 14: (0.0, 0.5), 12: (0.0, 0.0)})
+    wo.form = True
+    wo.set_res(down)
+    assert wo.count_reps() == 0 and wo.down
+    wo.set_res(up)
+    assert wo.count_reps() == 1 and not wo.down
+
+
+def test_get_landmark_out_of_range():
+    wo = Squats(goal_reps=5, ldmrk_res=None, left_side=True)
+    with pytest.raises(ValueError):
+        wo._get_landmark(40)
+
+
+def test_rep_margin_to_the_next_threshold():
+    wo = PushUps(goal_reps=5, ldmrk_res=None, left_side=False)
+    assert wo.rep_margin() is None
+    # elbow at 90 degrees, on the down threshold
+    wo.set_res(make_frame({16: (0.0, 1.0), 14: (0.0, 0.5), 12: (0.5, 0.5)}))
+    assert wo.rep_margin() == pytest.approx(0)
+    wo.down = True
+    assert wo.rep_margin() == pytest.approx(wo.up_threshold - 90)
+
+
+def test_squats_hip_rule_follows_the_rep_thresholds():
+    wo = Squats(goal_reps=5, ldmrk_res=None, left_side=True)
+    xy = np.zeros((1, 33, 2))
+    # down, knee at 120 degrees and hips at 100 degrees
+    angles = {"knee": np.array([120.0]), "hips": np.array([100.0])}
+    down = np.array([True])
+
+    def hips_issue() -> bool:
+        issues = dict(wo.form_issues(xy, angles, down, 5.0))
+        return bool(issues["hips angle not between 45 and 90 degrees (angle: {hips:.1f} degrees)"][0])
+
+    # between the default thresholds (90, 150) any hips angle is fine
+    assert not hips_issue()
+    wo.down_threshold, wo.up_threshold = 130, 170
+    assert hips_issue()